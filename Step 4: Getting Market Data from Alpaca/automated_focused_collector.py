@@ -6,10 +6,9 @@ Integrates with scheduling, monitoring, and automation systems
 
 import os
 import sys
-import sqlite3
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import pytz
 import time
 import logging
@@ -26,9 +25,19 @@ import argparse
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 if CURRENT_DIR not in sys.path:
     sys.path.insert(0, CURRENT_DIR)
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
 
-from step4_api import get_daily_bars
+from alpaca.data.enums import Adjustment
+from step4_api import get_daily_bars, get_corporate_actions
 from step4_config import get_credentials
+from symbol_stats import ensure_symbol_stats, get_symbol_stats
+from db_connection import get_connection_manager
+from timestamps import ensure_epoch_timestamps, canonicalize_bars
+from resampling import update_resampled_bars
+from corporate_actions import (ensure_corporate_actions, raw_basis_symbols, mark_raw_basis,
+                               store_corporate_actions)
 
 # Setup comprehensive logging
 def setup_logging(log_level: str = 'INFO', log_file: str = 'automated_collection.log'):
@@ -67,6 +76,7 @@ class AutomatedFocusedCollector:
         self.logger = setup_logging()
         self.config = self._load_config(config_file)
         self.db_path = os.path.join(os.path.dirname(__file__), '..', 'Step 5: Saving Market Data', 'market_data.db')
+        self.db = get_connection_manager(self.db_path)
         self.eastern = pytz.timezone('US/Eastern')
         
         # Initialize components
@@ -108,6 +118,9 @@ class AutomatedFocusedCollector:
                 "min_records_per_symbol": 1500,  # ~6 years of trading days
                 "max_data_age_days": 2,
                 "enable_validation": True
+            },
+            "resampling": {
+                "timeframes": ["Week", "Month"]  # Derived from stored daily bars after each collection
             }
         }
         
@@ -135,76 +148,79 @@ class AutomatedFocusedCollector:
     def _init_database(self):
         """Initialize database with proper schema and indexes"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            # Main data table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS market_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    open REAL NOT NULL,
-                    high REAL NOT NULL,
-                    low REAL NOT NULL,
-                    close REAL NOT NULL,
-                    volume INTEGER,
-                    trade_count INTEGER,
-                    vwap REAL,
-                    timeframe TEXT DEFAULT 'Day',
-                    data_source TEXT DEFAULT 'Alpaca',
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(symbol, timestamp, timeframe)
-                )
-            ''')
-            
-            # Collection tracking table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS collection_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    collection_date TEXT NOT NULL,
-                    symbols_processed INTEGER,
-                    symbols_successful INTEGER,
-                    symbols_failed INTEGER,
-                    total_records_collected INTEGER,
-                    start_time TEXT,
-                    end_time TEXT,
-                    status TEXT,
-                    error_message TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Data quality monitoring table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS data_quality (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    check_date TEXT NOT NULL,
-                    total_records INTEGER,
-                    earliest_date TEXT,
-                    latest_date TEXT,
-                    data_age_days INTEGER,
-                    completeness_score REAL,
-                    status TEXT,
-                    issues TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create indexes
-            indexes = [
-                'CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)',
-                'CREATE INDEX IF NOT EXISTS idx_symbol ON market_data(symbol)',
-                'CREATE INDEX IF NOT EXISTS idx_timestamp ON market_data(timestamp)',
-                'CREATE INDEX IF NOT EXISTS idx_collection_date ON collection_log(collection_date)',
-                'CREATE INDEX IF NOT EXISTS idx_symbol_check_date ON data_quality(symbol, check_date)'
-            ]
-            
-            for index in indexes:
-                conn.execute(index)
-            
-            conn.commit()
-            conn.close()
+            with self.db.writer() as conn:
+                # Main data table
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS market_data (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        symbol TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        open REAL NOT NULL,
+                        high REAL NOT NULL,
+                        low REAL NOT NULL,
+                        close REAL NOT NULL,
+                        volume INTEGER,
+                        trade_count INTEGER,
+                        vwap REAL,
+                        timeframe TEXT DEFAULT 'Day',
+                        data_source TEXT DEFAULT 'Alpaca',
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(symbol, timestamp, timeframe)
+                    )
+                ''')
+                
+                # Collection tracking table
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS collection_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        collection_date TEXT NOT NULL,
+                        symbols_processed INTEGER,
+                        symbols_successful INTEGER,
+                        symbols_failed INTEGER,
+                        total_records_collected INTEGER,
+                        start_time TEXT,
+                        end_time TEXT,
+                        status TEXT,
+                        error_message TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Data quality monitoring table
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS data_quality (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        symbol TEXT NOT NULL,
+                        check_date TEXT NOT NULL,
+                        total_records INTEGER,
+                        earliest_date TEXT,
+                        latest_date TEXT,
+                        data_age_days INTEGER,
+                        completeness_score REAL,
+                        status TEXT,
+                        issues TEXT,
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create indexes
+                indexes = [
+                    'CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)',
+                    'CREATE INDEX IF NOT EXISTS idx_symbol ON market_data(symbol)',
+                    'CREATE INDEX IF NOT EXISTS idx_timestamp ON market_data(timestamp)',
+                    'CREATE INDEX IF NOT EXISTS idx_collection_date ON collection_log(collection_date)',
+                    'CREATE INDEX IF NOT EXISTS idx_symbol_check_date ON data_quality(symbol, check_date)'
+                ]
+                
+                for index in indexes:
+                    conn.execute(index)
+                
+                # Canonical UTC timestamps plus int64 ts_ns, then per-symbol summary triggers
+                ensure_epoch_timestamps(conn)
+                ensure_symbol_stats(conn)
+                
+                # Raw bars are adjusted for splits/dividends at read time
+                ensure_corporate_actions(conn)
             self.logger.info("Database initialized with all tables and indexes")
             
         except Exception as e:
@@ -263,20 +279,37 @@ class AutomatedFocusedCollector:
         }
     
     def collect_daily_data(self, symbol: str, years_back: int = None, is_full_refresh: bool = False) -> Tuple[bool, int]:
-        """Collect daily data for a single symbol with enhanced error handling"""
+        """
+        Collect raw (unadjusted) daily bars for a single symbol with enhanced error handling.
+        Symbols already stored raw only fetch bars after their last stored bar; symbols still
+        holding adjusted history are fully refreshed once and then marked as raw.
+        """
         if years_back is None:
             years_back = self.config['collection']['years_back']
         
+        with self.db.reader() as conn:
+            is_raw = symbol in raw_basis_symbols(conn)
+            last_ts_ns = conn.execute(
+                "SELECT MAX(ts_ns) FROM market_data WHERE symbol = ? AND timeframe = 'Day'", (symbol,)
+            ).fetchone()[0]
+        
+        if not is_raw:
+            # Adjusted and raw bars must never be mixed within one symbol
+            is_full_refresh = True
+        
         for attempt in range(self.config['collection']['max_retries']):
             try:
-                self.logger.info(f"Collecting daily data for {symbol} (last {years_back} years)")
-                
                 # Set date range
                 end_date = self.eastern.localize(datetime.now())
                 start_date = end_date - timedelta(days=years_back * 365)
+                if not is_full_refresh and last_ts_ns is not None:
+                    start_date = max(start_date, pd.Timestamp(last_ts_ns, tz='UTC').to_pydatetime())
                 
-                # Fetch daily bars data
-                data = get_daily_bars([symbol], start_date, end_date)
+                self.logger.info(f"Collecting daily data for {symbol} from {start_date.date()}"
+                                 f"{' (full refresh)' if is_full_refresh else ''}")
+                
+                # Fetch unadjusted daily bars; adjustments come from the corporate_actions table
+                data = get_daily_bars([symbol], start_date, end_date, adjustment=Adjustment.RAW)
                 
                 if data.empty:
                     self.logger.warning(f"No daily data returned for {symbol}")
@@ -289,24 +322,32 @@ class AutomatedFocusedCollector:
                 data['timeframe'] = 'Day'
                 data['data_source'] = 'Alpaca'
                 
-                # Ensure timestamp is in the right format
+                # Store canonical UTC timestamp text alongside its epoch-ns value
                 if 'timestamp' in data.columns:
-                    data['timestamp'] = pd.to_datetime(data['timestamp'])
-                
-                # Save to database
-                conn = sqlite3.connect(self.db_path)
+                    data = canonicalize_bars(data)
                 
-                # **FIX**: If this is a full refresh, delete existing data first
-                if is_full_refresh:
-                    self.logger.info(f"Performing full refresh for {symbol}, deleting old records.")
-                    cursor = conn.cursor()
-                    cursor.execute("DELETE FROM market_data WHERE symbol = ?", (symbol,))
+                if not is_full_refresh and last_ts_ns is not None:
+                    # Only bars newer than what is stored, so the append never hits the unique key
+                    data = data[data['ts_ns'] > last_ts_ns]
+                    if data.empty:
+                        self.logger.info(f"{symbol} is already up to date")
+                        return True, 0
                 
-                # Use INSERT OR IGNORE to handle duplicates
-                data.to_sql('market_data', conn, if_exists='append', index=False)
-                
-                conn.commit()
-                conn.close()
+                # Save to database
+                with self.db.writer() as conn:
+                    # **FIX**: If this is a full refresh, delete existing data first
+                    if is_full_refresh:
+                        self.logger.info(f"Performing full refresh for {symbol}, deleting old records.")
+                        cursor = conn.cursor()
+                        cursor.execute("DELETE FROM market_data WHERE symbol = ? AND timeframe = 'Day'", (symbol,))
+                    
+                    data.to_sql('market_data', conn, if_exists='append', index=False)
+                    
+                    if not is_raw:
+                        mark_raw_basis(conn, symbol)
+                    
+                    # Dividends waiting on the pre-ex-date close can now get their factor
+                    store_corporate_actions(conn, None)
                 
                 self.logger.info(f"✅ Successfully collected {len(data)} daily bars for {symbol}")
                 return True, len(data)
@@ -321,8 +362,12 @@ class AutomatedFocusedCollector:
         
         return False, 0
     
-    def collect_all_focused_data(self, years_back: int = None) -> Dict:
-        """Collect daily data for all focused assets with comprehensive tracking"""
+    def collect_all_focused_data(self, years_back: int = None, full_refresh: bool = False) -> Dict:
+        """
+        Collect daily data for all focused assets with comprehensive tracking.
+        Raw-basis symbols are topped up incrementally and re-adjusted through synced corporate
+        actions; pass full_refresh=True to re-download every symbol's history anyway.
+        """
         if years_back is None:
             years_back = self.config['collection']['years_back']
         
@@ -344,8 +389,8 @@ class AutomatedFocusedCollector:
             self.logger.info(f"Processing batch {batch_num}/{total_batches}: {batch}")
             
             for symbol in batch:
-                # Pass is_full_refresh=True to signal a delete-first operation
-                success, records = self.collect_daily_data(symbol, years_back, is_full_refresh=True)
+                # Unconverted symbols are fully refreshed inside collect_daily_data
+                success, records = self.collect_daily_data(symbol, years_back, is_full_refresh=full_refresh)
                 results[symbol] = success
                 if success:
                     total_records += records
@@ -365,6 +410,12 @@ class AutomatedFocusedCollector:
         
         self._log_collection_end(collection_id, len(results), successful, failed, total_records, start_time, end_time, 'SUCCESS')
         
+        # New splits/dividends re-adjust history at read time instead of a full re-download
+        self.sync_corporate_actions(years_back)
+        
+        # Extend weekly/monthly aggregates from the freshly stored daily bars
+        self._update_resampled_timeframes([symbol for symbol, ok in results.items() if ok])
+        
         # Update stats
         self.collection_stats['total_collections'] += 1
         self.collection_stats['successful_collections'] += 1
@@ -387,17 +438,15 @@ class AutomatedFocusedCollector:
     def _log_collection_start(self) -> int:
         """Log the start of a collection run"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.execute('''
-                INSERT INTO collection_log 
-                (collection_date, symbols_processed, symbols_successful, symbols_failed, 
-                 total_records_collected, start_time, status)
-                VALUES (?, 0, 0, 0, 0, ?, 'RUNNING')
-            ''', (datetime.now().date().isoformat(), datetime.now().isoformat()))
-            
-            collection_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.db.writer() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO collection_log 
+                    (collection_date, symbols_processed, symbols_successful, symbols_failed, 
+                     total_records_collected, start_time, status)
+                    VALUES (?, 0, 0, 0, 0, ?, 'RUNNING')
+                ''', (datetime.now().date().isoformat(), datetime.now().isoformat()))
+                
+                collection_id = cursor.lastrowid
             return collection_id
         except Exception as e:
             self.logger.error(f"Error logging collection start: {e}")
@@ -408,16 +457,13 @@ class AutomatedFocusedCollector:
                            end_time: datetime, status: str, error_msg: str = None):
         """Log the end of a collection run"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                UPDATE collection_log 
-                SET symbols_processed = ?, symbols_successful = ?, symbols_failed = ?,
-                    total_records_collected = ?, end_time = ?, status = ?, error_message = ?
-                WHERE id = ?
-            ''', (processed, successful, failed, records, end_time.isoformat(), status, error_msg, collection_id))
-            
-            conn.commit()
-            conn.close()
+            with self.db.writer() as conn:
+                conn.execute('''
+                    UPDATE collection_log 
+                    SET symbols_processed = ?, symbols_successful = ?, symbols_failed = ?,
+                        total_records_collected = ?, end_time = ?, status = ?, error_message = ?
+                    WHERE id = ?
+                ''', (processed, successful, failed, records, end_time.isoformat(), status, error_msg, collection_id))
         except Exception as e:
             self.logger.error(f"Error logging collection end: {e}")
     
@@ -449,6 +495,10 @@ class AutomatedFocusedCollector:
         successful = sum(results.values())
         self.logger.info(f"Incremental update complete: {successful}/{len(results)} symbols updated")
         
+        self.sync_corporate_actions()
+        
+        self._update_resampled_timeframes([symbol for symbol, ok in results.items() if ok])
+        
         return {
             'status': 'success',
             'symbols_updated': len(results),
@@ -456,23 +506,68 @@ class AutomatedFocusedCollector:
             'total_records': total_records
         }
     
+    def sync_corporate_actions(self, years_back: int = None) -> int:
+        """
+        Fetch splits and dividends for raw-basis symbols since they were last checked (one API
+        call) and store them; returns the number of symbols whose adjustments changed
+        """
+        if years_back is None:
+            years_back = self.config['collection']['years_back']
+        
+        with self.db.reader() as conn:
+            checked = raw_basis_symbols(conn)
+        if not checked:
+            return 0
+        
+        today = datetime.now(self.eastern).date()
+        # Newly converted symbols have never been checked and need their whole history
+        history_start = today - timedelta(days=years_back * 365)
+        start = min(date.fromisoformat(value) if value else history_start for value in checked.values())
+        if start >= today:
+            return 0
+        
+        try:
+            actions = get_corporate_actions(list(checked), start, today)
+            with self.db.writer() as conn:
+                affected = store_corporate_actions(conn, actions, checked_through=today.isoformat())
+        except Exception as e:
+            self.logger.error(f"Error syncing corporate actions: {e}")
+            return 0
+        
+        self.logger.info(f"Corporate actions synced since {start}: {len(actions)} actions, "
+                         f"{len(affected)} symbols re-adjusted")
+
+        # Weekly/monthly bars spanning the new ex-dates must be rebuilt on the new basis
+        self._update_resampled_timeframes(affected)
+        return len(affected)
+    
+    def _update_resampled_timeframes(self, symbols: List[str]):
+        """Incrementally extend configured higher timeframes for the given symbols"""
+        if not symbols:
+            return
+        
+        for target in self.config.get('resampling', {}).get('timeframes', []):
+            try:
+                with self.db.writer() as conn:
+                    update_resampled_bars(conn, target, symbols=symbols)
+            except Exception as e:
+                self.logger.error(f"Error resampling {target} bars: {e}")
+    
     def _get_symbols_needing_update(self) -> List[str]:
         """Get symbols that need data updates"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
             # Check which symbols need updates (data older than max_data_age_days)
             cutoff_date = (datetime.now() - timedelta(days=self.config['data_quality']['max_data_age_days'])).date()
             
             query = """
                 SELECT symbol 
-                FROM market_data 
-                GROUP BY symbol
-                HAVING DATE(MAX(timestamp)) < ?
+                FROM symbol_stats 
+                WHERE timeframe = 'Day'
+                AND DATE(last_timestamp) < ?
             """
             
-            results = conn.execute(query, (cutoff_date.isoformat(),)).fetchall()
-            conn.close()
+            with self.db.reader() as conn:
+                results = conn.execute(query, (cutoff_date.isoformat(),)).fetchall()
             
             return [row[0] for row in results]
             
@@ -485,16 +580,16 @@ class AutomatedFocusedCollector:
         self.logger.info("Starting data quality check")
         
         try:
-            conn = sqlite3.connect(self.db_path)
+            with self.db.reader() as conn:
+                stats = get_symbol_stats(conn, symbols=self.focused_assets, timeframe='Day')
             
             quality_results = {}
             for symbol in self.focused_assets:
-                query = """
-                    SELECT COUNT(*) as count, MIN(timestamp) as earliest, MAX(timestamp) as latest
-                    FROM market_data
-                    WHERE symbol = ?
-                """
-                result = conn.execute(query, (symbol,)).fetchone()
+                if symbol in stats.index:
+                    row = stats.loc[symbol]
+                    result = (int(row['row_count']), row['first_timestamp'], row['last_timestamp'])
+                else:
+                    result = (0, None, None)
                 
                 if result[0] > 0:
                     earliest = pd.to_datetime(result[1])
@@ -554,8 +649,6 @@ class AutomatedFocusedCollector:
                         'issues': 'No data found'
                     }
             
-            conn.close()
-            
             # Summary statistics
             status_counts = {}
             for result in quality_results.values():
@@ -577,21 +670,18 @@ class AutomatedFocusedCollector:
     def _log_data_quality(self, symbol: str, quality_data: Dict):
         """Log data quality check results to database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                INSERT OR REPLACE INTO data_quality 
-                (symbol, check_date, total_records, earliest_date, latest_date, 
-                 data_age_days, completeness_score, status, issues)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                symbol, datetime.now().date().isoformat(), quality_data['records'],
-                quality_data['earliest_date'], quality_data['latest_date'],
-                quality_data['data_age_days'], quality_data['completeness_score'],
-                quality_data['status'], quality_data['issues']
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.db.writer() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO data_quality 
+                    (symbol, check_date, total_records, earliest_date, latest_date, 
+                     data_age_days, completeness_score, status, issues)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    symbol, datetime.now().date().isoformat(), quality_data['records'],
+                    quality_data['earliest_date'], quality_data['latest_date'],
+                    quality_data['data_age_days'], quality_data['completeness_score'],
+                    quality_data['status'], quality_data['issues']
+                ))
         except Exception as e:
             self.logger.error(f"Error logging data quality for {symbol}: {e}")
     
@@ -612,7 +702,7 @@ class AutomatedFocusedCollector:
             self.logger.info("Running in maintenance mode.")
             # Daily incremental updates
             schedule.every().day.at(self.config['scheduling']['daily_update_time']).do(self.incremental_update)
-            # Weekly full collection
+            # Weekly sweep: converts remaining adjusted symbols, tops up and syncs corporate actions
             weekly_schedule_str = self.config['scheduling']['weekly_full_collection']
             weekly_schedule_parts = weekly_schedule_str.split()
             day_of_week = weekly_schedule_parts[0].lower()
@@ -739,16 +829,14 @@ class AutomatedFocusedCollector:
     def get_collection_history(self, days_back: int = 30) -> List[Dict]:
         """Get collection history for monitoring"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            query = """
-                SELECT * FROM collection_log 
-                WHERE DATE(created_at) >= DATE('now', '-{} days')
-                ORDER BY created_at DESC
-            """.format(days_back)
-            
-            results = pd.read_sql_query(query, conn)
-            conn.close()
+            with self.db.reader() as conn:
+                query = """
+                    SELECT * FROM collection_log 
+                    WHERE DATE(created_at) >= DATE('now', '-{} days')
+                    ORDER BY created_at DESC
+                """.format(days_back)
+                
+                results = pd.read_sql_query(query, conn)
             
             return results.to_dict('records')
             
@@ -760,18 +848,17 @@ class AutomatedFocusedCollector:
         """Get comprehensive system status"""
         try:
             # Database status
-            conn = sqlite3.connect(self.db_path)
-            total_symbols = conn.execute("SELECT COUNT(DISTINCT symbol) FROM market_data").fetchone()[0]
-            total_records = conn.execute("SELECT COUNT(*) FROM market_data").fetchone()[0]
-            
-            # Latest collection status
-            latest_collection = conn.execute("""
-                SELECT * FROM collection_log 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """ ).fetchone()
-            
-            conn.close()
+            with self.db.reader() as conn:
+                total_symbols, total_records = conn.execute(
+                    "SELECT COUNT(DISTINCT symbol), COALESCE(SUM(row_count), 0) FROM symbol_stats"
+                ).fetchone()
+                
+                # Latest collection status
+                latest_collection = conn.execute("""
+                    SELECT * FROM collection_log 
+                    ORDER BY created_at DESC 
+                    LIMIT 1
+                """ ).fetchone()
             
             # Data quality summary
             quality_summary = self.check_data_quality()
@@ -6,7 +6,6 @@ Collects 7+ years of daily data for the focused asset selection
 
 import os
 import sys
-import sqlite3
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -19,9 +18,15 @@ from typing import List, Dict, Optional
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 if CURRENT_DIR not in sys.path:
     sys.path.insert(0, CURRENT_DIR)
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
 
 from step4_api import get_daily_bars
 from step4_config import get_credentials
+from symbol_stats import ensure_symbol_stats, get_symbol_stats
+from db_connection import get_connection_manager
+from timestamps import ensure_epoch_timestamps, canonicalize_bars
 
 # Setup logging
 logging.basicConfig(
@@ -40,6 +45,7 @@ class FocusedDailyCollector:
     
     def __init__(self):
         self.db_path = os.path.join(os.path.dirname(__file__), '..', 'Step 5: Saving Market Data', 'market_data.db')
+        self.db = get_connection_manager(self.db_path)
         self.eastern = pytz.timezone('US/Eastern')
         
         # Data collection parameters
@@ -58,33 +64,34 @@ class FocusedDailyCollector:
     def _init_database(self):
         """Initialize database with proper schema for daily data"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS market_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    open REAL NOT NULL,
-                    high REAL NOT NULL,
-                    low REAL NOT NULL,
-                    close REAL NOT NULL,
-                    volume INTEGER,
-                    trade_count INTEGER,
-                    vwap REAL,
-                    timeframe TEXT DEFAULT 'Day',
-                    data_source TEXT DEFAULT 'Alpaca',
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(symbol, timestamp, timeframe)
-                )
-            ''')
-            
-            # Create indexes for faster queries
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol ON market_data(symbol)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON market_data(timestamp)')
-            
-            conn.commit()
-            conn.close()
+            with self.db.writer() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS market_data (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        symbol TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        open REAL NOT NULL,
+                        high REAL NOT NULL,
+                        low REAL NOT NULL,
+                        close REAL NOT NULL,
+                        volume INTEGER,
+                        trade_count INTEGER,
+                        vwap REAL,
+                        timeframe TEXT DEFAULT 'Day',
+                        data_source TEXT DEFAULT 'Alpaca',
+                        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(symbol, timestamp, timeframe)
+                    )
+                ''')
+                
+                # Create indexes for faster queries
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol ON market_data(symbol)')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON market_data(timestamp)')
+                
+                # Canonical UTC timestamps plus int64 ts_ns, then per-symbol summary triggers
+                ensure_epoch_timestamps(conn)
+                ensure_symbol_stats(conn)
             logging.info("Daily database initialized successfully")
             
         except Exception as e:
@@ -155,18 +162,14 @@ class FocusedDailyCollector:
                 data['timeframe'] = 'Day'
                 data['data_source'] = 'Alpaca'
                 
-                # Ensure timestamp is in the right format
+                # Store canonical UTC timestamp text alongside its epoch-ns value
                 if 'timestamp' in data.columns:
-                    data['timestamp'] = pd.to_datetime(data['timestamp'])
+                    data = canonicalize_bars(data)
                 
                 # Save to database
-                conn = sqlite3.connect(self.db_path)
-                
-                # Use INSERT OR IGNORE to handle duplicates
-                data.to_sql('market_data', conn, if_exists='append', index=False)
-                
-                conn.commit()
-                conn.close()
+                with self.db.writer() as conn:
+                    # Use INSERT OR IGNORE to handle duplicates
+                    data.to_sql('market_data', conn, if_exists='append', index=False)
                 
                 logging.info(f"✅ Successfully collected {len(data)} daily bars for {symbol}")
                 return True
@@ -216,27 +219,18 @@ class FocusedDailyCollector:
     def get_data_summary(self) -> Dict:
         """Get summary of daily data collection results"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            # Overall statistics
-            total_symbols = conn.execute("SELECT COUNT(DISTINCT symbol) FROM market_data").fetchone()[0]
-            total_records = conn.execute("SELECT COUNT(*) FROM market_data").fetchone()[0]
+            with self.db.reader() as conn:
+                # Per-symbol statistics from the trigger-maintained symbol_stats table
+                stats = get_symbol_stats(conn, timeframe=None)
             
-            # Date range
-            date_range = conn.execute("""
-                SELECT MIN(timestamp) as earliest, MAX(timestamp) as latest 
-                FROM market_data
-            """).fetchone()
+            total_symbols = len(stats)
+            total_records = int(stats['row_count'].sum())
+            date_range = (stats['first_timestamp'].min() if total_symbols else None,
+                          stats['last_timestamp'].max() if total_symbols else None)
             
             # Records per symbol
-            symbol_counts = pd.read_sql_query("""
-                SELECT symbol, COUNT(*) as count 
-                FROM market_data 
-                GROUP BY symbol 
-                ORDER BY count DESC
-            """, conn)
-            
-            conn.close()
+            symbol_counts = (stats['row_count'].rename('count').sort_values(ascending=False)
+                             .reset_index())
             
             summary = {
                 'total_symbols': total_symbols,
@@ -256,16 +250,16 @@ class FocusedDailyCollector:
     def verify_data_completeness(self) -> Dict[str, Dict]:
         """Verify data completeness for each symbol"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            with self.db.reader() as conn:
+                stats = get_symbol_stats(conn, symbols=self.focused_assets, timeframe='Day')
             
             completeness = {}
             for symbol in self.focused_assets:
-                query = """
-                    SELECT COUNT(*) as count, MIN(timestamp) as earliest, MAX(timestamp) as latest
-                    FROM market_data
-                    WHERE symbol = ?
-                """
-                result = conn.execute(query, (symbol,)).fetchone()
+                if symbol in stats.index:
+                    row = stats.loc[symbol]
+                    result = (int(row['row_count']), row['first_timestamp'], row['last_timestamp'])
+                else:
+                    result = (0, None, None)
                 
                 if result[0] > 0:
                     earliest = pd.to_datetime(result[1])
@@ -288,7 +282,6 @@ class FocusedDailyCollector:
                         'status': 'Missing'
                     }
             
-            conn.close()
             return completeness
             
         except Exception as e:
@@ -17,6 +17,15 @@ from alpaca.data.requests import StockBarsRequest, StockLatestQuoteRequest
 from alpaca.data.enums import Adjustment, DataFeed
 from alpaca.data.timeframe import TimeFrame
 
+# Corporate actions endpoint ships with newer alpaca-py releases
+try:
+    from alpaca.data.historical.corporate_actions import CorporateActionsClient
+    from alpaca.data.requests import CorporateActionsRequest
+    from alpaca.data.enums import CorporateActionsType
+    CORPORATE_ACTIONS_AVAILABLE = True
+except ImportError:
+    CORPORATE_ACTIONS_AVAILABLE = False
+
 # Allow importing step4_config.py from this folder (folder is not a Python package)
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 if CURRENT_DIR not in sys.path:
@@ -88,9 +97,11 @@ def get_daily_bars(
     symbols: Iterable[str],
     start: datetime,
     end: datetime,
+    adjustment: Adjustment = Adjustment.ALL,
 ) -> pd.DataFrame:
     """Fetch daily OHLCV bars for one or more symbols.
 
+    Pass adjustment=Adjustment.RAW to store unadjusted bars and apply splits/dividends later.
     Returns a DataFrame with columns including: timestamp, symbol, open, high, low, close, volume
     """
     client = make_client()
@@ -100,7 +111,7 @@ def get_daily_bars(
         timeframe=timeframe_obj,
         start=start,
         end=end,
-        adjustment=Adjustment.ALL,
+        adjustment=adjustment,
         feed=DataFeed.IEX,
     )
     resp = _with_simple_backoff(client.get_stock_bars, req)
@@ -117,6 +128,7 @@ def get_minute_bars(
     symbols: Iterable[str],
     start: datetime,
     end: datetime,
+    adjustment: Adjustment = Adjustment.ALL,
 ) -> pd.DataFrame:
     """Fetch minute OHLCV bars for one or more symbols.
 
@@ -129,8 +141,64 @@ def get_minute_bars(
         timeframe=timeframe_obj,
         start=start,
         end=end,
-        adjustment=Adjustment.ALL,
+        adjustment=adjustment,
         feed=DataFeed.IEX,
     )
     resp = _with_simple_backoff(client.get_stock_bars, req)
     return _bars_response_to_df(resp)
+
+
+# Corporate action response groups -> action_type stored in the corporate_actions table
+_ACTION_GROUPS = {
+    "forward_splits": "forward_split",
+    "reverse_splits": "reverse_split",
+    "cash_dividends": "cash_dividend",
+}
+
+
+def get_corporate_actions(
+    symbols: Iterable[str],
+    start: datetime,
+    end: datetime,
+) -> pd.DataFrame:
+    """Fetch splits and cash dividends with an ex-date between start and end.
+
+    Returns a DataFrame with columns: symbol, ex_date, action_type, old_rate, new_rate, cash_amount
+    """
+    columns = ["symbol", "ex_date", "action_type", "old_rate", "new_rate", "cash_amount"]
+    if not CORPORATE_ACTIONS_AVAILABLE:
+        raise RuntimeError("Installed alpaca-py has no corporate actions client; upgrade alpaca-py")
+
+    key, secret = get_credentials()
+    client = CorporateActionsClient(key, secret)
+    req = CorporateActionsRequest(
+        symbols=list(symbols),
+        types=[
+            CorporateActionsType.FORWARD_SPLIT,
+            CorporateActionsType.REVERSE_SPLIT,
+            CorporateActionsType.CASH_DIVIDEND,
+        ],
+        start=start.date() if isinstance(start, datetime) else start,
+        end=end.date() if isinstance(end, datetime) else end,
+    )
+    resp = _with_simple_backoff(client.get_corporate_actions, req)
+
+    rows = []
+    data = getattr(resp, "data", {})
+    for group, actions in (data.items() if hasattr(data, "items") else []):
+        action_type = _ACTION_GROUPS.get(group)
+        if action_type is None:
+            continue
+        for action in actions:
+            rows.append(
+                {
+                    "symbol": getattr(action, "symbol", None),
+                    "ex_date": getattr(action, "ex_date", None),
+                    "action_type": action_type,
+                    "old_rate": getattr(action, "old_rate", None),
+                    "new_rate": getattr(action, "new_rate", None),
+                    # Dividends report the per-share cash amount as `rate`
+                    "cash_amount": getattr(action, "rate", None) if action_type == "cash_dividend" else None,
+                }
+            )
+    return pd.DataFrame(rows, columns=columns)
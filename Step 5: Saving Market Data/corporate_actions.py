@@ -0,0 +1,198 @@
+# Step 5: Corporate Actions and Read-Time Price Adjustment
+# Raw bars are stored once; splits and dividends are applied as backward factors when reading
+
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+
+SPLIT_TYPES = ('forward_split', 'reverse_split')
+DIVIDEND_TYPES = ('cash_dividend',)
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'vwap']
+
+CORPORATE_ACTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS corporate_actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT NOT NULL,
+        ex_date TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        old_rate REAL,
+        new_rate REAL,
+        cash_amount REAL,
+        price_factor REAL,
+        volume_factor REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(symbol, ex_date, action_type)
+    )
+'''
+
+# Symbols whose stored Day bars are unadjusted (raw) and therefore get read-time adjustment
+PRICE_BASIS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS price_basis (
+        symbol TEXT PRIMARY KEY,
+        basis TEXT NOT NULL DEFAULT 'raw',
+        actions_checked_through TEXT,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Split factors come from the rates; dividend factors need the raw close before the ex-date,
+# so they stay NULL until that bar is stored and are filled on a later refresh
+REFRESH_FACTORS_SQL = f'''
+    UPDATE corporate_actions SET
+        price_factor = CASE
+            WHEN action_type IN {SPLIT_TYPES} THEN old_rate / new_rate
+            WHEN action_type IN ('cash_dividend') THEN 1.0 - cash_amount / (
+                SELECT m.close FROM market_data m
+                WHERE m.symbol = corporate_actions.symbol AND m.timeframe = 'Day'
+                AND m.ts_ns < CAST(strftime('%s', corporate_actions.ex_date) AS INTEGER) * 1000000000
+                ORDER BY m.ts_ns DESC LIMIT 1)
+        END,
+        volume_factor = CASE WHEN action_type IN {SPLIT_TYPES} THEN new_rate / old_rate ELSE 1.0 END
+    WHERE price_factor IS NULL
+'''
+
+
+def ensure_corporate_actions(conn: sqlite3.Connection):
+    """Create the corporate_actions and price_basis tables"""
+    conn.execute(CORPORATE_ACTIONS_SCHEMA)
+    conn.execute(PRICE_BASIS_SCHEMA)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_corporate_actions_symbol ON corporate_actions(symbol, ex_date)')
+
+
+def raw_basis_symbols(conn: sqlite3.Connection) -> dict:
+    """Return {symbol: actions_checked_through} for symbols stored as raw bars"""
+    return dict(conn.execute("SELECT symbol, actions_checked_through FROM price_basis WHERE basis = 'raw'"))
+
+
+def mark_raw_basis(conn: sqlite3.Connection, symbol: str, checked_through=None):
+    """Record that a symbol's Day bars are now stored unadjusted"""
+    conn.execute('''
+        INSERT INTO price_basis (symbol, basis, actions_checked_through) VALUES (?, 'raw', ?)
+        ON CONFLICT(symbol) DO UPDATE SET
+            basis = 'raw',
+            actions_checked_through = COALESCE(excluded.actions_checked_through, actions_checked_through),
+            updated_at = CURRENT_TIMESTAMP
+    ''', (symbol, checked_through))
+
+
+def store_corporate_actions(conn: sqlite3.Connection, actions_df: pd.DataFrame, checked_through=None) -> list:
+    """
+    Insert new actions (symbol, ex_date, action_type, old_rate, new_rate, cash_amount),
+    fill their adjustment factors and return the symbols that gained actions.
+    """
+    affected = set()
+    if actions_df is not None and not actions_df.empty:
+        for row in actions_df.itertuples(index=False):
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO corporate_actions
+                (symbol, ex_date, action_type, old_rate, new_rate, cash_amount)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (row.symbol, str(row.ex_date)[:10], row.action_type,
+                  getattr(row, 'old_rate', None), getattr(row, 'new_rate', None),
+                  getattr(row, 'cash_amount', None)))
+            if cursor.rowcount:
+                affected.add(row.symbol)
+
+    conn.execute(REFRESH_FACTORS_SQL)
+
+    if checked_through is not None:
+        conn.execute("UPDATE price_basis SET actions_checked_through = ?, updated_at = CURRENT_TIMESTAMP WHERE basis = 'raw'",
+                     (str(checked_through)[:10],))
+
+    if affected:
+        logging.info(f"Stored corporate actions for {len(affected)} symbols: {sorted(affected)}")
+    return sorted(affected)
+
+
+def actions_version(conn: sqlite3.Connection, symbols=None) -> dict:
+    """
+    Return {symbol: version string} that changes whenever an action is added or its factor
+    is filled in; symbols without actions are absent
+    """
+    query = '''
+        SELECT symbol, COUNT(*) || ':' || COUNT(price_factor) || ':' || MAX(created_at)
+        FROM corporate_actions
+    '''
+    params = []
+    if symbols:
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        query += f" WHERE symbol IN ({','.join(['?' for _ in symbols])})"
+        params.extend(symbols)
+    query += ' GROUP BY symbol'
+
+    try:
+        return dict(conn.execute(query, params))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def load_adjustments(conn: sqlite3.Connection, symbols=None) -> dict:
+    """
+    Return {symbol: (ex_ns, price_multipliers, volume_multipliers)} where multipliers[k] is the
+    product of all factors from the k-th action onwards (suffix product, multipliers[-1] == 1)
+    """
+    query = 'SELECT symbol, ex_date, price_factor, volume_factor FROM corporate_actions'
+    params = []
+    if symbols:
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        query += f" WHERE symbol IN ({','.join(['?' for _ in symbols])})"
+        params.extend(symbols)
+    query += ' ORDER BY symbol, ex_date'
+
+    try:
+        rows = conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError:
+        # Database created before corporate actions were tracked
+        return {}
+
+    adjustments = {}
+    frame = pd.DataFrame(rows, columns=['symbol', 'ex_date', 'price_factor', 'volume_factor'])
+    for symbol, group in frame.groupby('symbol', sort=False):
+        ex_ns = group['ex_date'].to_numpy().astype('M8[D]').astype('M8[ns]').astype('int64')
+        price = group['price_factor'].fillna(1.0).to_numpy(dtype='float64')
+        volume = group['volume_factor'].fillna(1.0).to_numpy(dtype='float64')
+        adjustments[symbol] = (
+            ex_ns,
+            np.r_[np.cumprod(price[::-1])[::-1], 1.0],
+            np.r_[np.cumprod(volume[::-1])[::-1], 1.0],
+        )
+    return adjustments
+
+
+def apply_adjustments(df: pd.DataFrame, adjustments: dict, ts_ns: np.ndarray) -> pd.DataFrame:
+    """Back-adjust prices and volumes in place; bars on or after an ex-date are untouched"""
+    if not adjustments or df.empty:
+        return df
+
+    # One multiplier per row, filled symbol by symbol, then one vectorized multiply per column
+    price = np.ones(len(df))
+    volume = np.ones(len(df))
+    rows_by_symbol = df.groupby('symbol', sort=False).indices
+    for symbol, (ex_ns, price_mult, volume_mult) in adjustments.items():
+        rows = rows_by_symbol.get(symbol)
+        if rows is None:
+            continue
+        # Number of actions with ex-date <= bar time; only later actions adjust the bar
+        k = np.searchsorted(ex_ns, ts_ns[rows], side='right')
+        price[rows] = price_mult[k]
+        volume[rows] = volume_mult[k]
+
+    for col in PRICE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].to_numpy(dtype='float64') * price
+    if 'volume' in df.columns:
+        df['volume'] = df['volume'].to_numpy(dtype='float64') * volume
+    return df
+
+
+def adjust_bars(conn: sqlite3.Connection, df: pd.DataFrame, ts_ns: np.ndarray) -> pd.DataFrame:
+    """Load the factors for the symbols in df and apply them"""
+    if df.empty:
+        return df
+    adjustments = load_adjustments(conn, df['symbol'].unique().tolist())
+    if adjustments and 'volume' in df.columns:
+        df['volume'] = df['volume'].astype('float64')
+    return apply_adjustments(df, adjustments, ts_ns)
@@ -4,11 +4,13 @@
 import os
 import sys
 import pandas as pd
+import numpy as np
 import json
 import csv
 from datetime import datetime
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Add parent directory to path
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,16 +20,40 @@ if PARENT_DIR not in sys.path:
 
 from data_management import MarketDataManager
 
+# Parquet/Feather output needs pyarrow; CSV and pickle work without it
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Output formats for per-symbol files and their file extensions
+PARTITION_FORMATS = {
+    'csv': 'csv',
+    'pkl': 'pkl',
+    'parquet': 'parquet',
+    'feather': 'feather',
+}
+
+# Incremental exports append to CSV files in place and add Parquet part files
+INCREMENTAL_FORMATS = ('csv', 'parquet')
+
+# Columns that define a bar's content for change detection
+CONTENT_HASH_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
 class DataExporter:
     """
     Utility to export market data in various formats for backtesting and analysis
     """
     
-    def __init__(self):
+    def __init__(self, max_workers=None):
         self.data_manager = MarketDataManager()
         self.export_dir = 'exports'
+        self.manifest_path = os.path.join(self.export_dir, 'export_manifest.json')
+        # Per-symbol files are written from a thread pool of this size
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
         
         # Create export directory
         if not os.path.exists(self.export_dir):
@@ -35,6 +61,77 @@ class DataExporter:
         
         logging.info("DataExporter initialized")
     
+    def _partition_by_symbol(self, data):
+        """Split data into per-symbol slices in a single pass over the rows"""
+        if not data['symbol'].is_monotonic_increasing:
+            data = data.sort_values(['symbol', 'timestamp'], kind='mergesort')
+        
+        # Rows arrive sorted by symbol, so each symbol is one contiguous block
+        symbols = data['symbol'].to_numpy()
+        boundaries = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(data)]))
+        
+        for start, end in zip(starts, ends):
+            yield symbols[start], data.iloc[start:end]
+    
+    def _check_formats(self, formats):
+        """Drop output formats whose optional dependencies are missing"""
+        usable = []
+        for fmt in formats:
+            if fmt not in PARTITION_FORMATS:
+                logging.warning(f"Unknown export format skipped: {fmt}")
+            elif fmt in ('parquet', 'feather') and not PYARROW_AVAILABLE:
+                logging.warning(f"pyarrow not installed - skipping {fmt} export")
+            else:
+                usable.append(fmt)
+        return usable
+    
+    def _write_frame(self, frame, filepath, fmt, index):
+        """Write one DataFrame in the requested format"""
+        if fmt == 'csv':
+            frame.to_csv(filepath, index=index)
+        elif fmt == 'pkl':
+            frame.to_pickle(filepath)
+        elif fmt == 'parquet':
+            frame.to_parquet(filepath, index=index)
+        elif fmt == 'feather':
+            # Feather cannot store a custom index, so keep it as a column
+            frame.reset_index(drop=not index).to_feather(filepath)
+    
+    def _write_partitions(self, data, output_dir, name_template, formats, index=False, prepare=None):
+        """Write one file per symbol and format from a thread pool, return the paths written"""
+        formats = self._check_formats(formats)
+        if not formats:
+            return []
+        
+        def export_symbol(symbol, symbol_data):
+            if prepare is not None:
+                symbol_data = prepare(symbol_data)
+            paths = []
+            for fmt in formats:
+                extension = PARTITION_FORMATS[fmt]
+                filepath = os.path.join(output_dir, name_template.format(symbol=symbol, ext=extension))
+                self._write_frame(symbol_data, filepath, fmt, index)
+                paths.append(filepath)
+            return paths
+        
+        written = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(export_symbol, symbol, symbol_data): symbol
+                for symbol, symbol_data in self._partition_by_symbol(data)
+            }
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    written.extend(future.result())
+                    logging.info(f"Exported {symbol} data ({', '.join(formats)})")
+                except Exception as e:
+                    logging.error(f"Error exporting {symbol}: {e}")
+        
+        return written
+    
     def export_to_csv(self, symbols=None, start_date=None, end_date=None, 
                      filename=None, separate_files=False):
         """Export data to CSV format"""
@@ -50,12 +147,10 @@ class DataExporter:
         
         if separate_files and 'symbol' in data.columns:
             # Export separate CSV for each symbol
-            for symbol in data['symbol'].unique():
-                symbol_data = data[data['symbol'] == symbol]
-                symbol_filename = f"{symbol}_data_{timestamp}.csv"
-                filepath = os.path.join(self.export_dir, symbol_filename)
-                symbol_data.to_csv(filepath, index=False)
-                logging.info(f"Exported {symbol} data to {filepath}")
+            written = self._write_partitions(
+                data, self.export_dir, f"{{symbol}}_data_{timestamp}.{{ext}}", ['csv']
+            )
+            logging.info(f"Exported {len(written)} per-symbol CSV files to {self.export_dir}")
         else:
             # Single CSV file
             if filename is None:
@@ -91,10 +186,11 @@ class DataExporter:
         logging.info(f"Exported data to {filepath}")
         return True
     
-    def export_for_backtesting(self, symbols=None, start_date=None, end_date=None):
+    def export_for_backtesting(self, symbols=None, start_date=None, end_date=None,
+                               formats=('csv', 'pkl')):
         """Export data in formats commonly used for backtesting"""
         data = self.data_manager.get_data_from_database(
-            symbols=symbols, start_date=start_date, end_date=end_date
+            symbols=symbols, start_date=start_date, end_date=end_date, typed_timestamps=True
         )
         
         if data.empty:
@@ -107,28 +203,21 @@ class DataExporter:
         backtest_dir = os.path.join(self.export_dir, f'backtesting_{timestamp}')
         os.makedirs(backtest_dir, exist_ok=True)
         
+        written = []
         if 'symbol' in data.columns:
-            for symbol in data['symbol'].unique():
-                symbol_data = data[data['symbol'] == symbol].copy()
-                
-                # Ensure proper datetime index for backtesting
-                if 'timestamp' in symbol_data.columns:
-                    symbol_data['timestamp'] = pd.to_datetime(symbol_data['timestamp'])
-                    symbol_data.set_index('timestamp', inplace=True)
-                
-                # Select only OHLCV columns for backtesting
-                backtest_columns = ['open', 'high', 'low', 'close', 'volume']
-                available_columns = [col for col in backtest_columns if col in symbol_data.columns]
-                symbol_data = symbol_data[available_columns]
-                
-                # Export in multiple formats
-                csv_file = os.path.join(backtest_dir, f'{symbol}_ohlcv.csv')
-                symbol_data.to_csv(csv_file)
-                
-                pkl_file = os.path.join(backtest_dir, f'{symbol}_ohlcv.pkl')
-                symbol_data.to_pickle(pkl_file)
-                
-                logging.info(f"Exported {symbol} backtesting data")
+            # Select only OHLCV columns (timestamps already arrive as datetime64[ns, UTC])
+            backtest_columns = ['open', 'high', 'low', 'close', 'volume']
+            available_columns = [col for col in backtest_columns if col in data.columns]
+            ohlcv = data[['symbol', 'timestamp'] + available_columns]
+            
+            # Ensure proper datetime index for backtesting
+            def to_backtest_frame(symbol_data):
+                return symbol_data.drop(columns='symbol').set_index('timestamp')
+            
+            written = self._write_partitions(
+                ohlcv, backtest_dir, '{symbol}_ohlcv.{ext}', formats,
+                index=True, prepare=to_backtest_frame
+            )
         
         # Create metadata file
         metadata = {
@@ -139,7 +228,9 @@ class DataExporter:
                 'end': end_date or data['timestamp'].max() if 'timestamp' in data.columns else None
             },
             'total_records': len(data),
-            'format': 'OHLCV for backtesting'
+            'format': 'OHLCV for backtesting',
+            'file_formats': self._check_formats(formats),
+            'files_written': len(written)
         }
         
         metadata_file = os.path.join(backtest_dir, 'metadata.json')
@@ -149,6 +240,158 @@ class DataExporter:
         logging.info(f"Backtesting export completed: {backtest_dir}")
         return True
     
+    def _load_manifest(self):
+        """Load per-symbol export watermarks from the manifest file"""
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.warning(f"Could not read export manifest, starting fresh: {e}")
+        return {}
+    
+    def _save_manifest(self, manifest):
+        """Atomically write the export manifest"""
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _content_hash(self, frame):
+        """Order-independent hash of bar content; hashes of disjoint row sets add up"""
+        if frame.empty:
+            return 0
+        row_hashes = pd.util.hash_pandas_object(frame[CONTENT_HASH_COLUMNS], index=False).to_numpy()
+        return int(row_hashes.sum(dtype=np.uint64))
+    
+    def _export_state(self, last_timestamp, last_created_at, row_count, content_hash, actions_version=None):
+        """Build the manifest entry recorded for a symbol after an export"""
+        return {
+            'last_timestamp': last_timestamp,
+            'last_created_at': last_created_at,
+            'row_count': int(row_count),
+            'content_hash': f"{content_hash:016x}",
+            'actions_version': actions_version,
+            'exported_at': datetime.now().isoformat()
+        }
+    
+    def _plan_symbol_export(self, symbol, current, state, timeframe):
+        """Decide whether a symbol is unchanged, can be appended to, or must be rewritten"""
+        actions_version = current.get('actions_version')
+        if state is not None and actions_version != state.get('actions_version'):
+            # A new split/dividend re-adjusts the whole history, so the file must be rewritten
+            state = None
+        
+        if state is not None and (
+            int(current['row_count']) == state['row_count']
+            and current['last_timestamp'] == state['last_timestamp']
+            and str(current['last_created_at'] or '') <= str(state['last_created_at'] or '')
+        ):
+            return 'unchanged', None, state
+        
+        if state is not None:
+            # Rows past the watermark, plus anything (re)inserted since the last export
+            touched = self.data_manager.get_changed_rows(
+                symbol, state['last_timestamp'], state['last_created_at'] or '', timeframe
+            )
+            appended = touched[touched['timestamp'] > state['last_timestamp']]
+            rewritten = touched[
+                (touched['timestamp'] <= state['last_timestamp'])
+                & (touched['created_at'].fillna('') > (state['last_created_at'] or ''))
+            ]
+            
+            expected_rows = state['row_count'] + len(appended)
+            expected_hash = (int(state['content_hash'], 16) + self._content_hash(appended)) % (1 << 64)
+            
+            is_append = rewritten.empty and int(current['row_count']) == expected_rows
+            if not is_append:
+                # History was re-inserted (e.g. a full refresh); only rewrite if content differs
+                full = self.data_manager.get_data_from_database(symbols=symbol, timeframe=timeframe)
+                is_append = len(full) == expected_rows and self._content_hash(full) == expected_hash
+            
+            if is_append:
+                last_timestamp = appended['timestamp'].max() if not appended.empty else state['last_timestamp']
+                last_created_at = max([state['last_created_at'] or ''] + touched['created_at'].dropna().tolist())
+                new_state = self._export_state(last_timestamp, last_created_at, expected_rows, expected_hash,
+                                               actions_version)
+                return 'append', appended, new_state
+        else:
+            full = self.data_manager.get_data_from_database(symbols=symbol, timeframe=timeframe)
+        
+        if full.empty:
+            return 'unchanged', None, state
+        
+        new_state = self._export_state(
+            full['timestamp'].max(), full['created_at'].max(), len(full), self._content_hash(full),
+            actions_version
+        )
+        return 'replace', full, new_state
+    
+    def _write_incremental(self, symbol, rows, fmt, action, output_dir):
+        """Append new rows to, or replace, a symbol's stable export file"""
+        if fmt == 'csv':
+            filepath = os.path.join(output_dir, f"{symbol}_data.csv")
+            if action == 'append' and os.path.exists(filepath):
+                rows.to_csv(filepath, mode='a', header=False, index=False)
+            else:
+                rows.to_csv(filepath, index=False)
+        elif fmt == 'parquet':
+            # Each run adds one part file; pd.read_parquet(directory) reads the whole history
+            dataset_dir = os.path.join(output_dir, f"{symbol}_data")
+            os.makedirs(dataset_dir, exist_ok=True)
+            parts = sorted(name for name in os.listdir(dataset_dir) if name.endswith('.parquet'))
+            if action == 'replace':
+                for name in parts:
+                    os.remove(os.path.join(dataset_dir, name))
+                parts = []
+            rows.to_parquet(os.path.join(dataset_dir, f"part-{len(parts):05d}.parquet"), index=False)
+    
+    def export_incremental(self, symbols=None, formats=('csv',), timeframe='Day'):
+        """Export only bars that are new or changed since the last incremental export"""
+        formats = [fmt for fmt in self._check_formats(formats) if fmt in INCREMENTAL_FORMATS]
+        if not formats:
+            logging.warning(f"Incremental export supports only: {', '.join(INCREMENTAL_FORMATS)}")
+            return False
+        
+        watermarks = self.data_manager.get_symbol_watermarks(symbols, timeframe)
+        if watermarks.empty:
+            logging.warning("No data found for incremental export")
+            return False
+        
+        incremental_dir = os.path.join(self.export_dir, 'incremental')
+        os.makedirs(incremental_dir, exist_ok=True)
+        
+        manifest = self._load_manifest()
+        
+        for fmt in formats:
+            states = manifest.setdefault(f"{fmt}_{timeframe}", {})
+            counts = {'append': 0, 'replace': 0, 'unchanged': 0}
+            rows_written = 0
+            
+            for symbol, current in watermarks.iterrows():
+                action, rows, new_state = self._plan_symbol_export(symbol, current, states.get(symbol), timeframe)
+                counts[action] += 1
+                
+                if action == 'unchanged':
+                    continue
+                
+                try:
+                    if not rows.empty:
+                        self._write_incremental(symbol, rows, fmt, action, incremental_dir)
+                except Exception as e:
+                    logging.error(f"Incremental {fmt} export failed for {symbol}: {e}")
+                    continue
+                
+                # Only advance the watermark once the rows are on disk
+                states[symbol] = new_state
+                rows_written += len(rows)
+            
+            self._save_manifest(manifest)
+            logging.info(f"Incremental {fmt} export: {counts['append']} appended, {counts['replace']} rewritten, "
+                         f"{counts['unchanged']} unchanged, {rows_written} rows written")
+        
+        return True
+    
     def export_summary_report(self, filename=None):
         """Export a comprehensive summary report"""
         summary = self.data_manager.get_data_summary()
@@ -164,7 +407,8 @@ class DataExporter:
             **summary,
             'export_date': datetime.now().isoformat(),
             'database_path': self.data_manager.db_path,
-            'export_formats_available': ['CSV', 'JSON', 'Pickle', 'Backtesting'],
+            'export_formats_available': ['CSV', 'JSON', 'Pickle', 'Backtesting'] +
+                                        (['Parquet', 'Feather'] if PYARROW_AVAILABLE else []),
         }
         
         with open(filepath, 'w') as f:
@@ -184,10 +428,16 @@ def main():
     parser.add_argument('--filename', help='Custom filename')
     parser.add_argument('--separate', action='store_true', 
                        help='Create separate files for each symbol')
+    parser.add_argument('--backtest-formats', nargs='+', default=['csv', 'pkl'],
+                       choices=list(PARTITION_FORMATS),
+                       help='File formats for backtest export (parquet/feather need pyarrow)')
+    parser.add_argument('--workers', type=int, help='Threads used to write per-symbol files')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only export bars new or changed since the last incremental run (csv/backtest)')
     
     args = parser.parse_args()
     
-    exporter = DataExporter()
+    exporter = DataExporter(max_workers=args.workers)
     
     print("📤 DATA EXPORT UTILITY")
     print("=" * 50)
@@ -198,7 +448,12 @@ def main():
     
     success = False
     
-    if args.format == 'csv':
+    if args.incremental and args.format in ('csv', 'backtest'):
+        success = exporter.export_incremental(
+            symbols=args.symbols,
+            formats=['csv'] if args.format == 'csv' else args.backtest_formats
+        )
+    elif args.format == 'csv':
         success = exporter.export_to_csv(
             symbols=args.symbols,
             start_date=args.start_date,
@@ -217,7 +472,8 @@ def main():
         success = exporter.export_for_backtesting(
             symbols=args.symbols,
             start_date=args.start_date,
-            end_date=args.end_date
+            end_date=args.end_date,
+            formats=args.backtest_formats
         )
     elif args.format == 'summary':
         success = exporter.export_summary_report(filename=args.filename)
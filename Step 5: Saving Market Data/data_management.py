@@ -3,7 +3,6 @@
 
 import os
 import sys
-import sqlite3
 import pandas as pd
 import pickle
 import json
@@ -11,6 +10,12 @@ from datetime import datetime, timedelta
 import pytz
 import logging
 
+from symbol_stats import ensure_symbol_stats, get_symbol_stats
+from db_connection import get_connection_manager
+from timestamps import ensure_epoch_timestamps, canonicalize_bars, epoch_range_clause, epoch_ns_to_datetime
+from resampling import RESAMPLE_RULES, update_resampled_bars
+from corporate_actions import ensure_corporate_actions, adjust_bars, actions_version
+
 # Add parent directory to path for imports
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(CURRENT_DIR)
@@ -36,6 +41,10 @@ logging.basicConfig(
     ]
 )
 
+# Stored bar columns returned to callers (ts_ns is an internal read/filter column)
+MARKET_DATA_COLUMNS = ['id', 'symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume',
+                       'trade_count', 'vwap', 'timeframe', 'data_source', 'created_at']
+
 class MarketDataManager:
     """
     Comprehensive market data management system for Step 5 requirements.
@@ -46,6 +55,7 @@ class MarketDataManager:
         self.db_path = db_path
         self.backup_dir = backup_dir
         self.eastern = pytz.timezone('US/Eastern')
+        self.db = get_connection_manager(db_path)
         
         # Create backup directory if it doesn't exist
         if not os.path.exists(backup_dir):
@@ -58,40 +68,49 @@ class MarketDataManager:
     
     def initialize_database(self):
         """Initialize SQLite database with proper schema"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create market_data table with enhanced schema
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS market_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                symbol TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                open REAL NOT NULL,
-                high REAL NOT NULL,
-                low REAL NOT NULL,
-                close REAL NOT NULL,
-                volume INTEGER,
-                trade_count INTEGER,
-                vwap REAL,
-                timeframe TEXT DEFAULT 'Day',
-                data_source TEXT DEFAULT 'Alpaca',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(symbol, timestamp, timeframe)
-            )
-        ''')
-        
-        # Create index for faster queries
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timeframe ON market_data(timeframe)')
-        
-        conn.commit()
-        conn.close()
+        with self.db.writer() as conn:
+            cursor = conn.cursor()
+            
+            # Create market_data table with enhanced schema
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS market_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume INTEGER,
+                    trade_count INTEGER,
+                    vwap REAL,
+                    timeframe TEXT DEFAULT 'Day',
+                    data_source TEXT DEFAULT 'Alpaca',
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(symbol, timestamp, timeframe)
+                )
+            ''')
+            
+            # Create index for faster queries
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timestamp ON market_data(symbol, timestamp)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timeframe ON market_data(timeframe)')
+            
+            # Canonical UTC timestamps with an int64 ts_ns column for typed, index-friendly reads
+            ensure_epoch_timestamps(conn)
+            
+            # Per-symbol summary table maintained by triggers on every insert/delete
+            ensure_symbol_stats(conn)
+            
+            # Splits/dividends applied to raw-basis symbols at read time
+            ensure_corporate_actions(conn)
         
         logging.info("Database initialized with enhanced schema")
     
-    def save_data_to_database(self, data_df, timeframe='Day'):
-        """Save market data to SQLite database with data validation"""
+    def save_data_to_database(self, data_df, timeframe='Day', resample_to=None):
+        """
+        Save market data to SQLite database with data validation.
+        resample_to lists higher timeframes (e.g. ['Week', 'Month']) to extend from the new bars.
+        """
         if data_df.empty:
             logging.warning("Attempted to save empty dataframe to database")
             return 0
@@ -107,23 +126,38 @@ class MarketDataManager:
         clean_df = self.clean_data(data_df)
         clean_df['timeframe'] = timeframe
         clean_df['data_source'] = 'Alpaca'
+        clean_df = canonicalize_bars(clean_df)
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            # Insert data with conflict resolution
-            rows_inserted = clean_df.to_sql('market_data', conn, if_exists='append', 
-                                          index=False)
-            
-            conn.close()
+            with self.db.writer() as conn:
+                # Insert data with conflict resolution
+                rows_inserted = clean_df.to_sql('market_data', conn, if_exists='append', 
+                                              index=False)
             
             logging.info(f"Saved {len(clean_df)} records to database (timeframe: {timeframe})")
+            
+            for target in resample_to or []:
+                if RESAMPLE_RULES.get(target, (None,))[0] == timeframe:
+                    self.resample_timeframe(target, symbols=clean_df['symbol'].unique().tolist())
             return len(clean_df)
             
         except Exception as e:
             logging.error(f"Error saving data to database: {e}")
             return 0
     
+    def resample_timeframe(self, target, symbols=None):
+        """
+        Build or extend stored `target` bars (Hour from Minute, Week/Month from Day).
+        Results are persisted in market_data under timeframe=target, so they are read with
+        get_data_from_database(timeframe=target) like any collected bars.
+        """
+        try:
+            with self.db.writer() as conn:
+                return update_resampled_bars(conn, target, symbols=symbols)
+        except Exception as e:
+            logging.error(f"Error resampling to {target}: {e}")
+            return {}
+    
     def save_data_to_csv(self, data_df, filename=None):
         """Save market data to CSV files for backup and analysis"""
         if data_df.empty:
@@ -194,13 +228,17 @@ class MarketDataManager:
         return clean_df
     
     def get_data_from_database(self, symbols=None, start_date=None, end_date=None, 
-                             timeframe='Day', limit=None):
-        """Retrieve market data from database with flexible filtering"""
+                             timeframe='Day', limit=None, typed_timestamps=False, adjusted=True):
+        """
+        Retrieve market data from database with flexible filtering.
+        With typed_timestamps=True the timestamp column comes back as datetime64[ns, UTC]
+        (built from the stored ts_ns integers) instead of text. Symbols stored as raw bars are
+        split/dividend adjusted from the corporate_actions table unless adjusted=False.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            
             # Build query
-            query = "SELECT * FROM market_data WHERE 1=1"
+            columns = ', '.join(MARKET_DATA_COLUMNS + ['ts_ns'])
+            query = f"SELECT {columns} FROM market_data WHERE 1=1"
             params = []
             
             if symbols:
@@ -210,25 +248,28 @@ class MarketDataManager:
                 query += f" AND symbol IN ({placeholders})"
                 params.extend(symbols)
             
-            if start_date:
-                query += " AND timestamp >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND timestamp <= ?"
-                params.append(end_date)
+            # Integer range on (symbol, timeframe, ts_ns); end_date includes the whole day
+            range_clause, range_params = epoch_range_clause(start_date or None, end_date or None)
+            query += range_clause
+            params.extend(range_params)
             
             if timeframe:
                 query += " AND timeframe = ?"
                 params.append(timeframe)
             
-            query += " ORDER BY symbol, timestamp"
+            query += " ORDER BY symbol, ts_ns"
             
             if limit:
                 query += f" LIMIT {limit}"
             
-            df = pd.read_sql_query(query, conn, params=params)
-            conn.close()
+            with self.db.reader() as conn:
+                df = pd.read_sql_query(query, conn, params=params)
+                ts_ns = df.pop('ts_ns').to_numpy(dtype='int64')
+                if adjusted:
+                    adjust_bars(conn, df, ts_ns)
+            
+            if typed_timestamps:
+                df['timestamp'] = epoch_ns_to_datetime(ts_ns)
             
             logging.info(f"Retrieved {len(df)} records from database")
             return df
@@ -237,6 +278,43 @@ class MarketDataManager:
             logging.error(f"Error retrieving data from database: {e}")
             return pd.DataFrame()
     
+    def get_symbol_watermarks(self, symbols=None, timeframe='Day'):
+        """Get row count, latest bar and latest ingest time for each symbol"""
+        try:
+            with self.db.reader() as conn:
+                stats = get_symbol_stats(conn, symbols=symbols, timeframe=timeframe)
+                # Changes whenever an action is added or its factor gets filled in
+                actions = actions_version(conn, symbols)
+            
+            stats = stats.rename(columns={'last_ingested_at': 'last_created_at'})
+            stats['actions_version'] = [actions.get(symbol) for symbol in stats.index]
+            return stats[['row_count', 'last_timestamp', 'last_created_at', 'actions_version']]
+            
+        except Exception as e:
+            logging.error(f"Error retrieving symbol watermarks: {e}")
+            return pd.DataFrame()
+    
+    def get_changed_rows(self, symbol, since_timestamp, since_created_at, timeframe='Day', adjusted=True):
+        """Retrieve bars newer than a watermark or (re)inserted since a given ingest time"""
+        try:
+            query = f"""
+                SELECT {', '.join(MARKET_DATA_COLUMNS + ['ts_ns'])} FROM market_data
+                WHERE symbol = ? AND timeframe = ?
+                AND (timestamp > ? OR created_at >= ?)
+                ORDER BY timestamp
+            """
+            
+            with self.db.reader() as conn:
+                df = pd.read_sql_query(query, conn, params=[symbol, timeframe, since_timestamp, since_created_at])
+                ts_ns = df.pop('ts_ns').to_numpy(dtype='int64')
+                if adjusted:
+                    adjust_bars(conn, df, ts_ns)
+            return df
+            
+        except Exception as e:
+            logging.error(f"Error retrieving changed rows for {symbol}: {e}")
+            return pd.DataFrame()
+    
     def create_backup(self, backup_name=None):
         """Create a complete backup of market data in multiple formats"""
         if backup_name is None:
@@ -296,38 +374,21 @@ class MarketDataManager:
     def get_data_summary(self):
         """Get summary statistics of stored data"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            # Read from the trigger-maintained symbol_stats table instead of scanning market_data
+            with self.db.reader() as conn:
+                stats = get_symbol_stats(conn, timeframe=None)
             
-            # Basic statistics
             summary = {}
-            
-            # Total records
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM market_data")
-            summary['total_records'] = cursor.fetchone()[0]
-            
-            # Symbols
-            cursor.execute("SELECT DISTINCT symbol FROM market_data")
-            summary['symbols'] = [row[0] for row in cursor.fetchall()]
-            
-            # Date range
-            cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM market_data")
-            date_range = cursor.fetchone()
+            summary['total_records'] = int(stats['row_count'].sum())
+            summary['symbols'] = stats.index.tolist()
             summary['date_range'] = {
-                'start': date_range[0],
-                'end': date_range[1]
+                'start': stats['first_timestamp'].min() if not stats.empty else None,
+                'end': stats['last_timestamp'].max() if not stats.empty else None
+            }
+            summary['records_per_symbol'] = {
+                symbol: int(count)
+                for symbol, count in stats['row_count'].sort_values(ascending=False).items()
             }
-            
-            # Records per symbol
-            cursor.execute("""
-                SELECT symbol, COUNT(*) as count 
-                FROM market_data 
-                GROUP BY symbol 
-                ORDER BY count DESC
-            """)
-            summary['records_per_symbol'] = dict(cursor.fetchall())
-            
-            conn.close()
             
             logging.info("Generated data summary")
             return summary
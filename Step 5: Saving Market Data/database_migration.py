@@ -6,6 +6,10 @@ import logging
 from datetime import datetime
 import os
 
+from symbol_stats import ensure_symbol_stats
+from timestamps import ensure_epoch_timestamps
+from corporate_actions import ensure_corporate_actions
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def migrate_database(db_path='market_data.db'):
@@ -108,6 +112,12 @@ def migrate_database(db_path='market_data.db'):
             logging.info("Database schema migration completed")
         
         conn.commit()
+        
+        # Rebuilding market_data drops ts_ns and the triggers, so restore them and backfill
+        ensure_epoch_timestamps(conn)
+        ensure_symbol_stats(conn)
+        ensure_corporate_actions(conn)
+        conn.commit()
         conn.close()
         
         logging.info("Database migration successful")
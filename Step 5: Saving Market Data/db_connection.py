@@ -0,0 +1,125 @@
+# Step 5: Shared SQLite Connection Manager
+# Per-thread pooled connections in WAL mode so analytics readers never block on collector writes
+
+import os
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+DEFAULT_BUSY_TIMEOUT_MS = 30000
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """
+    Hands out one read-write and one read-only connection per thread for a database file.
+    Connections stay open between operations, so sqlite3's per-connection statement cache
+    reuses prepared statements across calls instead of re-parsing SQL every time.
+    """
+
+    def __init__(self, db_path, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.db_path = os.path.abspath(db_path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._wal_enabled = False
+
+    def _open(self, read_only):
+        """Open a new connection with WAL, busy timeout and statement caching configured"""
+        if read_only:
+            # URI form keeps spaces in the project paths intact
+            conn = sqlite3.connect(Path(self.db_path).as_uri() + '?mode=ro', uri=True,
+                                   timeout=self.busy_timeout_ms / 1000,
+                                   cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                                   cached_statements=self.cached_statements)
+            if not self._wal_enabled:
+                # journal_mode is persistent, so the first writer switches the file to WAL
+                mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+                conn.execute('PRAGMA synchronous=NORMAL')
+                self._wal_enabled = mode.lower() == 'wal'
+                if not self._wal_enabled:
+                    logging.warning(f"Could not enable WAL mode for {self.db_path} (journal_mode={mode})")
+
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self, read_only=False):
+        """Return this thread's pooled connection, opening it on first use"""
+        # A forked worker must not reuse the parent's sqlite handles
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.__dict__.clear()
+            self._local.pid = os.getpid()
+
+        key = 'reader' if read_only else 'writer'
+        conn = getattr(self._local, key, None)
+        if conn is None:
+            if read_only and not os.path.exists(self.db_path):
+                # Nothing to read yet; fall back to a writer so the schema can be created
+                return self.connection(read_only=False)
+            conn = self._open(read_only)
+            setattr(self._local, key, conn)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Read-only connection for queries and analytics"""
+        yield self.connection(read_only=True)
+
+    @contextmanager
+    def writer(self):
+        """Read-write connection that commits on success and rolls back on error"""
+        conn = self.connection(read_only=False)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close_thread(self):
+        """Close the calling thread's connections"""
+        for key in ('reader', 'writer'):
+            conn = getattr(self._local, key, None)
+            if conn is not None:
+                conn.close()
+                setattr(self._local, key, None)
+                with self._lock:
+                    if conn in self._connections:
+                        self._connections.remove(conn)
+
+    def close_all(self):
+        """Close every pooled connection (call from the owning threads when possible)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Connection belongs to another thread; it is released when that thread exits
+                pass
+        self._local = threading.local()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path):
+    """Return the process-wide ConnectionManager for a database file"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(key)
+            _managers[key] = manager
+        return manager
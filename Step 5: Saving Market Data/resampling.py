@@ -0,0 +1,182 @@
+# Step 5: Multi-Timeframe Resampling
+# Builds higher-timeframe OHLCV bars from stored base bars and persists them under market_data.timeframe
+
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+
+from corporate_actions import PRICE_COLUMNS, load_adjustments
+from timestamps import CANONICAL_FORMAT, NS_PER_DAY, epoch_ns_to_datetime
+
+NS_PER_HOUR = 3600 * 10**9
+
+# Target timeframe -> (base timeframe it is built from, calendar bucket)
+RESAMPLE_RULES = {
+    'Hour': ('Minute', 'hour'),
+    'Week': ('Day', 'week'),
+    'Month': ('Day', 'month'),
+}
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']
+
+
+def bucket_keys(ts_ns: np.ndarray, bucket: str) -> np.ndarray:
+    """Integer bucket id per bar (UTC calendar; weeks start on Monday)"""
+    if bucket == 'hour':
+        return ts_ns // NS_PER_HOUR
+    if bucket == 'week':
+        # 1970-01-01 was a Thursday, so shift by 3 days to align weeks on Monday
+        return (ts_ns // NS_PER_DAY + 3) // 7
+    if bucket == 'month':
+        return ts_ns.view('M8[ns]').astype('M8[M]').astype('int64')
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+
+def bucket_start_ns(keys: np.ndarray, bucket: str) -> np.ndarray:
+    """Epoch ns at which each bucket id starts (inverse of bucket_keys)"""
+    keys = np.asarray(keys, dtype='int64')
+    if bucket == 'hour':
+        return keys * NS_PER_HOUR
+    if bucket == 'week':
+        return (keys * 7 - 3) * NS_PER_DAY
+    if bucket == 'month':
+        return keys.view('M8[M]').astype('M8[ns]').astype('int64')
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+
+def aggregate_bars(ts_ns: np.ndarray, bars: dict, bucket: str, adjustment=None):
+    """
+    Vectorized OHLCV aggregation of one symbol's time-sorted bars.
+    Returns (label_ns, aggregated columns); intraday buckets are labelled by bucket start,
+    calendar buckets by their first bar so weekly/monthly bars keep the session open time.
+    adjustment is the symbol's (ex_ns, price_mult, volume_mult) from load_adjustments: bars are
+    then restated on the basis of their bucket's first bar, so read-time adjustment by the
+    label adjusts every constituent exactly, even when the bucket spans an ex-date.
+    """
+    keys = bucket_keys(ts_ns, bucket)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+
+    if adjustment is not None:
+        ex_ns, price_mult, volume_mult = adjustment
+        k = np.searchsorted(ex_ns, ts_ns, side='right')
+        first = np.repeat(k[starts], ends - starts + 1)
+        bars = dict(bars)
+        for col in PRICE_COLUMNS:
+            bars[col] = bars[col] * (price_mult[k] / price_mult[first])
+        bars['volume'] = bars['volume'] * (volume_mult[k] / volume_mult[first])
+
+    volume = np.nan_to_num(bars['volume'].astype('float64'))
+    out = {
+        'open': bars['open'][starts],
+        'high': np.maximum.reduceat(bars['high'], starts),
+        'low': np.minimum.reduceat(bars['low'], starts),
+        'close': bars['close'][ends],
+        'volume': np.add.reduceat(volume, starts),
+        'trade_count': np.add.reduceat(np.nan_to_num(bars['trade_count'].astype('float64')), starts),
+    }
+    # Volume-weighted average of the constituent VWAPs
+    vwap = np.nan_to_num(bars['vwap'].astype('float64'))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['vwap'] = np.add.reduceat(vwap * volume, starts) / out['volume']
+
+    labels = bucket_start_ns(keys[starts], bucket) if bucket == 'hour' else ts_ns[starts]
+    return labels, out
+
+
+def _load_base_bars(conn, symbol, timeframe, since_ns=None):
+    """Read base bars for one symbol as column arrays ordered by ts_ns"""
+    query = f"SELECT ts_ns, {', '.join(BAR_COLUMNS)} FROM market_data WHERE symbol = ? AND timeframe = ?"
+    params = [symbol, timeframe]
+    if since_ns is not None:
+        query += ' AND ts_ns >= ?'
+        params.append(int(since_ns))
+    query += ' ORDER BY ts_ns'
+
+    rows = conn.execute(query, params).fetchall()
+    if not rows:
+        return None, None
+    columns = list(zip(*rows))
+    ts_ns = np.asarray(columns[0], dtype='int64')
+    bars = {name: np.asarray(values, dtype='float64') for name, values in zip(BAR_COLUMNS, columns[1:])}
+    return ts_ns, bars
+
+
+def _resume_point(conn, symbol, base, target, bucket):
+    """
+    Epoch ns from which aggregates must be rebuilt: the start of the last stored bucket
+    (it may have been partial), or None for a full rebuild when base history was rewritten
+    or a corporate action arrived since (it changes the basis of stored buckets).
+    """
+    last = conn.execute('''
+        SELECT MAX(ts_ns), MAX(created_at) FROM market_data
+        WHERE symbol = ? AND timeframe = ?
+    ''', (symbol, target)).fetchone()
+    if last[0] is None:
+        return None
+
+    resume_ns = int(bucket_start_ns(bucket_keys(np.array([last[0]], dtype='int64'), bucket), bucket)[0])
+
+    # A full refresh re-inserts older base bars; those buckets are stale and need a rebuild
+    rewritten = conn.execute('''
+        SELECT 1 FROM market_data
+        WHERE symbol = ? AND timeframe = ? AND ts_ns < ? AND created_at > ?
+        LIMIT 1
+    ''', (symbol, base, resume_ns, last[1])).fetchone()
+    try:
+        new_action = conn.execute(
+            'SELECT 1 FROM corporate_actions WHERE symbol = ? AND created_at > ? LIMIT 1',
+            (symbol, last[1])).fetchone()
+    except sqlite3.OperationalError:
+        # Database created before corporate actions were tracked
+        new_action = None
+    return None if rewritten or new_action else resume_ns
+
+
+def update_resampled_bars(conn: sqlite3.Connection, target: str, symbols=None) -> dict:
+    """
+    Build or incrementally extend `target` timeframe bars from their base timeframe.
+    Only the last (possibly partial) bucket onwards is recomputed unless base history changed.
+    Buckets spanning an ex-date are built on their label's basis so read-time adjustment stays exact.
+    Returns {symbol: aggregated bars written}.
+    """
+    if target not in RESAMPLE_RULES:
+        raise ValueError(f"Unsupported timeframe '{target}'. Choose from: {', '.join(RESAMPLE_RULES)}")
+    base, bucket = RESAMPLE_RULES[target]
+
+    if symbols is None:
+        symbols = [row[0] for row in conn.execute(
+            'SELECT symbol FROM symbol_stats WHERE timeframe = ? ORDER BY symbol', (base,))]
+    elif isinstance(symbols, str):
+        symbols = [symbols]
+
+    adjustments = load_adjustments(conn, symbols)
+    written = {}
+    for symbol in symbols:
+        resume_ns = _resume_point(conn, symbol, base, target, bucket)
+        ts_ns, bars = _load_base_bars(conn, symbol, base, since_ns=resume_ns)
+        if ts_ns is None:
+            written[symbol] = 0
+            continue
+
+        labels, agg = aggregate_bars(ts_ns, bars, bucket, adjustment=adjustments.get(symbol))
+
+        if resume_ns is None:
+            conn.execute('DELETE FROM market_data WHERE symbol = ? AND timeframe = ?', (symbol, target))
+        else:
+            conn.execute('DELETE FROM market_data WHERE symbol = ? AND timeframe = ? AND ts_ns >= ?',
+                         (symbol, target, resume_ns))
+
+        frame = pd.DataFrame(agg)
+        frame.insert(0, 'symbol', symbol)
+        frame.insert(1, 'timestamp', epoch_ns_to_datetime(labels).strftime(CANONICAL_FORMAT))
+        frame['timeframe'] = target
+        frame['data_source'] = f'Resampled:{base}'
+        frame['ts_ns'] = labels
+        frame.to_sql('market_data', conn, if_exists='append', index=False)
+
+        written[symbol] = len(frame)
+
+    logging.info(f"Resampled {base} -> {target}: {sum(written.values())} bars across {len(written)} symbols")
+    return written
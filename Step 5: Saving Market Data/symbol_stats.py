@@ -0,0 +1,151 @@
+# Step 5: Materialized Symbol Statistics
+# Per-symbol row counts and date ranges kept current by SQLite triggers on market_data
+
+import sqlite3
+import logging
+import pandas as pd
+
+SYMBOL_STATS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS symbol_stats (
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL DEFAULT 'Day',
+        row_count INTEGER NOT NULL DEFAULT 0,
+        first_timestamp TEXT,
+        last_timestamp TEXT,
+        last_close REAL,
+        last_ingested_at TEXT,
+        PRIMARY KEY (symbol, timeframe)
+    )
+'''
+
+# Every writer (collectors, to_sql appends, manual deletes) goes through these triggers,
+# so summary queries never need to scan market_data
+SYMBOL_STATS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_symbol_stats_insert AFTER INSERT ON market_data
+    BEGIN
+        INSERT INTO symbol_stats (symbol, timeframe, row_count, first_timestamp, last_timestamp,
+                                  last_close, last_ingested_at)
+        VALUES (NEW.symbol, COALESCE(NEW.timeframe, 'Day'), 1, NEW.timestamp, NEW.timestamp,
+                NEW.close, COALESCE(NEW.created_at, CURRENT_TIMESTAMP))
+        ON CONFLICT(symbol, timeframe) DO UPDATE SET
+            row_count = row_count + 1,
+            first_timestamp = MIN(first_timestamp, excluded.first_timestamp),
+            last_close = CASE WHEN excluded.last_timestamp >= last_timestamp
+                              THEN excluded.last_close ELSE last_close END,
+            last_timestamp = MAX(last_timestamp, excluded.last_timestamp),
+            last_ingested_at = MAX(COALESCE(last_ingested_at, ''), excluded.last_ingested_at);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_symbol_stats_delete AFTER DELETE ON market_data
+    BEGIN
+        UPDATE symbol_stats SET
+            row_count = row_count - 1,
+            first_timestamp = CASE WHEN OLD.timestamp = first_timestamp THEN
+                (SELECT MIN(timestamp) FROM market_data
+                 WHERE symbol = OLD.symbol AND timeframe = OLD.timeframe)
+                ELSE first_timestamp END,
+            last_timestamp = CASE WHEN OLD.timestamp = last_timestamp THEN
+                (SELECT MAX(timestamp) FROM market_data
+                 WHERE symbol = OLD.symbol AND timeframe = OLD.timeframe)
+                ELSE last_timestamp END,
+            last_close = CASE WHEN OLD.timestamp = last_timestamp THEN
+                (SELECT close FROM market_data
+                 WHERE symbol = OLD.symbol AND timeframe = OLD.timeframe
+                 ORDER BY timestamp DESC LIMIT 1)
+                ELSE last_close END
+        WHERE symbol = OLD.symbol AND timeframe = OLD.timeframe;
+
+        DELETE FROM symbol_stats
+        WHERE symbol = OLD.symbol AND timeframe = OLD.timeframe AND row_count <= 0;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_symbol_stats_update AFTER UPDATE OF timestamp, close ON market_data
+    BEGIN
+        UPDATE symbol_stats SET
+            first_timestamp = (SELECT MIN(timestamp) FROM market_data
+                               WHERE symbol = NEW.symbol AND timeframe = NEW.timeframe),
+            last_timestamp = (SELECT MAX(timestamp) FROM market_data
+                              WHERE symbol = NEW.symbol AND timeframe = NEW.timeframe),
+            last_close = (SELECT close FROM market_data
+                          WHERE symbol = NEW.symbol AND timeframe = NEW.timeframe
+                          ORDER BY timestamp DESC LIMIT 1)
+        WHERE symbol = NEW.symbol AND timeframe = NEW.timeframe;
+    END
+    '''
+]
+
+
+def rebuild_symbol_stats(conn: sqlite3.Connection):
+    """Recompute symbol_stats from market_data with one full scan"""
+    conn.execute('DELETE FROM symbol_stats')
+    conn.execute('''
+        INSERT INTO symbol_stats (symbol, timeframe, row_count, first_timestamp, last_timestamp,
+                                  last_close, last_ingested_at)
+        SELECT s.symbol, s.timeframe, s.row_count, s.first_timestamp, s.last_timestamp,
+               (SELECT close FROM market_data m
+                WHERE m.symbol = s.symbol AND m.timeframe = s.timeframe
+                ORDER BY m.timestamp DESC LIMIT 1),
+               s.last_ingested_at
+        FROM (
+            SELECT symbol, COALESCE(timeframe, 'Day') AS timeframe, COUNT(*) AS row_count,
+                   MIN(timestamp) AS first_timestamp, MAX(timestamp) AS last_timestamp,
+                   MAX(created_at) AS last_ingested_at
+            FROM market_data
+            GROUP BY symbol, COALESCE(timeframe, 'Day')
+        ) s
+    ''')
+
+
+def ensure_symbol_stats(conn: sqlite3.Connection):
+    """Create the symbol_stats table and its triggers, backfilling from existing data once"""
+    has_triggers = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_symbol_stats_%'"
+    ).fetchone()[0] == len(SYMBOL_STATS_TRIGGERS)
+
+    conn.execute(SYMBOL_STATS_SCHEMA)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol_stats_last_ts ON symbol_stats(timeframe, last_timestamp)')
+
+    if not has_triggers:
+        # Backfill and install triggers together so no insert is counted twice or missed
+        rebuild_symbol_stats(conn)
+        for trigger in SYMBOL_STATS_TRIGGERS:
+            conn.execute(trigger)
+        conn.commit()
+        logging.info("symbol_stats table backfilled and triggers installed")
+
+
+def get_symbol_stats(conn: sqlite3.Connection, symbols=None, timeframe='Day') -> pd.DataFrame:
+    """
+    Return per-symbol statistics indexed by symbol (all timeframes when timeframe is None, with
+    last_close taken from the timeframe with the latest bar)
+    """
+    # last_close comes from the requested timeframe, not a later intraday bar of another one
+    close_filter = ' AND s2.timeframe = ?' if timeframe else ''
+    query = f'''
+        SELECT symbol, SUM(row_count) AS row_count, MIN(first_timestamp) AS first_timestamp,
+               MAX(last_timestamp) AS last_timestamp, MAX(last_ingested_at) AS last_ingested_at,
+               (SELECT last_close FROM symbol_stats s2
+                WHERE s2.symbol = symbol_stats.symbol{close_filter}
+                ORDER BY s2.last_timestamp DESC LIMIT 1) AS last_close
+        FROM symbol_stats
+        WHERE 1=1
+    '''
+    params = [timeframe] if timeframe else []
+
+    if timeframe:
+        query += ' AND timeframe = ?'
+        params.append(timeframe)
+
+    if symbols:
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        placeholders = ','.join(['?' for _ in symbols])
+        query += f' AND symbol IN ({placeholders})'
+        params.extend(symbols)
+
+    query += ' GROUP BY symbol ORDER BY symbol'
+
+    return pd.read_sql_query(query, conn, params=params).set_index('symbol')
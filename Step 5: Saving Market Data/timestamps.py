@@ -0,0 +1,182 @@
+# Step 5: Canonical Bar Timestamps
+# Fixed-width UTC text plus an int64 epoch-ns column so readers never re-parse timestamp strings
+
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+
+from corporate_actions import adjust_bars
+
+# Every stored timestamp looks like '2024-01-02 05:00:00+00:00', so text order == time order
+CANONICAL_FORMAT = '%Y-%m-%d %H:%M:%S+00:00'
+CANONICAL_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]+00:00'
+
+NS_PER_DAY = 86400 * 10**9
+EPOCH_NS_SQL = "CAST(strftime('%s', {column}) AS INTEGER) * 1000000000"
+
+# Writers that do not supply ts_ns (manual inserts, older scripts) get it filled in by SQLite
+EPOCH_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_market_data_ts_ns_insert AFTER INSERT ON market_data
+    WHEN NEW.ts_ns IS NULL
+    BEGIN
+        UPDATE market_data SET ts_ns = {EPOCH_NS_SQL.format(column='NEW.timestamp')} WHERE id = NEW.id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_market_data_ts_ns_update AFTER UPDATE OF timestamp ON market_data
+    BEGIN
+        UPDATE market_data SET ts_ns = {EPOCH_NS_SQL.format(column='NEW.timestamp')} WHERE id = NEW.id;
+    END
+    '''
+]
+
+
+def ensure_epoch_timestamps(conn: sqlite3.Connection):
+    """Add the ts_ns column, its index and triggers, and canonicalize existing rows once"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(market_data)')]
+    if 'ts_ns' in columns:
+        return
+
+    conn.execute('ALTER TABLE market_data ADD COLUMN ts_ns INTEGER')
+
+    # Normalize any offset/format variants to UTC fixed-width text. A variant whose canonical form
+    # already exists is skipped by OR IGNORE, then deleted so each bar keeps only the canonical row
+    conn.execute(f'''
+        UPDATE OR IGNORE market_data
+        SET timestamp = strftime('{CANONICAL_FORMAT}', timestamp)
+        WHERE timestamp NOT GLOB '{CANONICAL_GLOB}'
+    ''')
+    duplicates = conn.execute(f'''
+        DELETE FROM market_data
+        WHERE timestamp NOT GLOB '{CANONICAL_GLOB}'
+          AND EXISTS (
+              SELECT 1 FROM market_data AS canonical
+              WHERE canonical.symbol = market_data.symbol
+                AND canonical.timeframe = market_data.timeframe
+                AND canonical.timestamp = strftime('{CANONICAL_FORMAT}', market_data.timestamp)
+          )
+    ''').rowcount
+    if duplicates:
+        logging.info(f"Removed {duplicates} duplicate bars stored under non-canonical timestamps")
+    conn.execute(f"UPDATE market_data SET ts_ns = {EPOCH_NS_SQL.format(column='timestamp')}")
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_symbol_timeframe_ts_ns ON market_data(symbol, timeframe, ts_ns)')
+    for trigger in EPOCH_TRIGGERS:
+        conn.execute(trigger)
+    conn.commit()
+    logging.info("market_data timestamps canonicalized and ts_ns column added")
+
+
+def canonicalize_bars(data_df: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy with canonical UTC timestamp text and a matching ts_ns column for insertion"""
+    df = data_df.copy()
+    timestamps = pd.to_datetime(df['timestamp'], utc=True)
+    df['timestamp'] = timestamps.dt.strftime(CANONICAL_FORMAT)
+    df['ts_ns'] = timestamps.astype('datetime64[ns, UTC]').array.asi8
+    return df
+
+
+def epoch_ns_to_datetime(values) -> pd.DatetimeIndex:
+    """Turn stored int64 epoch-ns values into datetime64[ns, UTC] without any string parsing"""
+    return pd.DatetimeIndex(np.asarray(values, dtype='int64').view('M8[ns]')).tz_localize('UTC')
+
+
+def to_epoch_ns(value, end_of_day=False) -> int:
+    """
+    Convert a date/datetime bound to epoch ns.
+    Date-only values with end_of_day=True cover the whole day (exclusive upper bound).
+    """
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    if end_of_day and ts == ts.normalize():
+        return ts.value + NS_PER_DAY
+    return ts.value + (1 if end_of_day else 0)
+
+
+def epoch_range_clause(start_date=None, end_date=None, column='ts_ns'):
+    """Index-friendly SQL range filter (inclusive dates) replacing DATE(timestamp) comparisons"""
+    clause, params = '', []
+    if start_date is not None:
+        clause += f' AND {column} >= ?'
+        params.append(to_epoch_ns(start_date))
+    if end_date is not None:
+        clause += f' AND {column} < ?'
+        params.append(to_epoch_ns(end_date, end_of_day=True))
+    return clause, params
+
+
+def read_bars(conn: sqlite3.Connection, symbols=None, start_date=None, end_date=None,
+              timeframe='Day', columns=('open', 'high', 'low', 'close', 'volume'),
+              adjusted=True) -> pd.DataFrame:
+    """
+    Typed bar reader: returns symbol, timestamp (datetime64[ns, UTC]) and the requested columns,
+    ordered by symbol and time, built straight from the cursor instead of pd.read_sql_query.
+    Raw-basis symbols are split/dividend adjusted unless adjusted=False.
+    """
+    query = f"SELECT symbol, ts_ns, {', '.join(columns)} FROM market_data WHERE timeframe = ?"
+    params = [timeframe]
+
+    if symbols:
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        placeholders = ','.join(['?' for _ in symbols])
+        query += f' AND symbol IN ({placeholders})'
+        params.extend(symbols)
+
+    range_clause, range_params = epoch_range_clause(start_date, end_date)
+    query += range_clause + ' ORDER BY symbol, ts_ns'
+    params.extend(range_params)
+
+    df = pd.DataFrame.from_records(conn.execute(query, params).fetchall(),
+                                   columns=['symbol', 'ts_ns', *columns])
+    ts_ns = df.pop('ts_ns').to_numpy(dtype='int64')
+    if adjusted:
+        adjust_bars(conn, df, ts_ns)
+    df.insert(1, 'timestamp', epoch_ns_to_datetime(ts_ns))
+    return df
+
+
+def read_panel(conn: sqlite3.Connection, symbols=None, start_date=None, end_date=None,
+               timeframe='Day', columns=('close',), align='date', adjusted=True) -> dict:
+    """
+    Load bars with one query into {column: DataFrame} panels of rows x symbols.
+    align='date' indexes rows by the union of bar timestamps (NaN where a symbol has no bar);
+    align='end' right-aligns every symbol so the last row is each symbol's latest bar, which
+    keeps rolling windows identical to per-symbol calculations. The 'end' panels also carry
+    a 'timestamp' panel with each bar's naive UTC time (NaT before a symbol's history starts).
+    """
+    bars = read_bars(conn, symbols=symbols, start_date=start_date, end_date=end_date,
+                     timeframe=timeframe, columns=columns, adjusted=adjusted)
+    if bars.empty:
+        return {col: pd.DataFrame() for col in columns}
+
+    # Rows arrive ordered by symbol then time, so each symbol is one contiguous run
+    symbol_codes, symbol_names = pd.factorize(bars['symbol'])
+    ts_ns = bars['timestamp'].array.asi8
+    n_symbols = len(symbol_names)
+
+    if align == 'date':
+        times, rows = np.unique(ts_ns, return_inverse=True)
+        index = epoch_ns_to_datetime(times)
+    elif align == 'end':
+        counts = np.bincount(symbol_codes, minlength=n_symbols)
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        depth = counts.max()
+        # Position within the symbol's run, shifted so its last bar lands on the final row
+        rows = np.arange(len(bars)) - starts[symbol_codes] + (depth - counts)[symbol_codes]
+        index = pd.RangeIndex(-depth + 1, 1)
+    else:
+        raise ValueError("align must be 'date' or 'end'")
+
+    panels = {}
+    for col in columns:
+        grid = np.full((len(index), n_symbols), np.nan)
+        grid[rows, symbol_codes] = bars[col].to_numpy(dtype='float64')
+        panels[col] = pd.DataFrame(grid, index=index, columns=symbol_names)
+    if align == 'end':
+        grid = np.full((len(index), n_symbols), np.iinfo('int64').min, dtype='int64')
+        grid[rows, symbol_codes] = ts_ns
+        panels['timestamp'] = pd.DataFrame(grid.view('M8[ns]'), index=index, columns=symbol_names)
+    return panels
@@ -16,14 +16,29 @@ Usage:
     python advanced_strategy_analyzer.py
 """
 
+import os
+import sys
 import logging
-import sqlite3
 import pandas as pd
 import numpy as np
 import warnings
 from datetime import datetime, timedelta
 warnings.filterwarnings('ignore')
 
+STEP5_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from timestamps import read_bars
+from indicators import rolling_mean, rolling_volatility, rolling_compound_return
+from rebalance_engine import run_rebalanced_sleeves, sleeve_signals as panel_sleeve_signals, SLEEVES
+from correlation import correlation_pairs, rank_correlation_pairs, blocked_correlation_pairs, CovarianceEngine
+from regimes import (classify_regimes, volatility_states, volatility_state, trend_state, regime_label,
+                     RegimeMatrix, INDEX_COLUMN, VOLATILITY_STATES, TREND_STATES)
+from portfolio_risk import portfolio_metrics, random_weights
+from portfolio_optimizer import PortfolioOptimizer, optimized_sleeve, SLEEVE_NAMES
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -39,14 +54,20 @@ class AdvancedStrategyAnalyzer:
         self.setup_database()
         
     def setup_database(self):
-        """Initialize database connection"""
+        """Initialize the pooled database connection manager"""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.db = get_connection_manager(self.db_path)
+            self.db.connection(read_only=True)
             logger.info(f"✅ Connected to database: {self.db_path}")
         except Exception as e:
             logger.error(f"❌ Database connection failed: {e}")
             raise
     
+    @property
+    def conn(self):
+        """Read-only connection for the calling thread"""
+        return self.db.connection(read_only=True)
+    
     def get_multi_asset_data(self, symbols, start_date=None, end_date=None):
         """Get comprehensive multi-asset dataset"""
         if start_date is None:
@@ -54,22 +75,11 @@ class AdvancedStrategyAnalyzer:
         if end_date is None:
             end_date = datetime.now().strftime('%Y-%m-%d')
         
-        symbol_placeholders = ','.join(['?' for _ in symbols])
-        query = f"""
-        SELECT 
-            symbol,
-            DATE(timestamp) as date,
-            close,
-            high,
-            low,
-            volume
-        FROM market_data 
-        WHERE symbol IN ({symbol_placeholders})
-        AND DATE(timestamp) BETWEEN ? AND ?
-        ORDER BY symbol, timestamp
-        """
+        # Integer ts_ns range on the (symbol, timeframe, ts_ns) index instead of DATE(timestamp)
+        df = read_bars(self.conn, symbols=symbols, start_date=start_date, end_date=end_date,
+                       columns=('close',))
+        df['date'] = df['timestamp'].dt.tz_localize(None).dt.normalize()
         
-        df = pd.read_sql_query(query, self.conn, params=symbols + [start_date, end_date])
         return df.pivot_table(index='date', columns='symbol', values='close')
     
     def calculate_portfolio_metrics(self, returns_df, weights=None):
@@ -83,6 +93,21 @@ class AdvancedStrategyAnalyzer:
         # Portfolio returns
         portfolio_returns = (returns_df * weights).sum(axis=1)
         
+        return self.return_metrics(portfolio_returns), portfolio_returns
+    
+    def score_portfolios(self, returns_df, weights=None, n_portfolios=10000, seed=None):
+        """
+        return_metrics for many candidate allocations at once, one row per weight vector.
+        weights is a (portfolios x assets) matrix or DataFrame with the asset columns; None scores
+        n_portfolios random long-only allocations (a random portfolio search).
+        """
+        if weights is None:
+            weights = pd.DataFrame(random_weights(n_portfolios, len(returns_df.columns), seed),
+                                   columns=returns_df.columns)
+        return portfolio_metrics(returns_df, weights)
+    
+    def return_metrics(self, portfolio_returns):
+        """Performance and risk metrics for a daily portfolio return series"""
         # Performance metrics
         total_return = (1 + portfolio_returns).prod() - 1
         annualized_return = (1 + total_return) ** (252 / len(portfolio_returns)) - 1
@@ -118,57 +143,104 @@ class AdvancedStrategyAnalyzer:
             'avg_loss': portfolio_returns[portfolio_returns < 0].mean(),
         }
         
-        return metrics, portfolio_returns
+        return metrics
     
-    def analyze_correlation_matrix(self, price_df):
-        """Analyze asset correlations and identify diversification opportunities"""
+    def analyze_correlation_matrix(self, price_df, top_k=5, block_size=None, method='sample',
+                                   halflife=63, shrinkage=None):
+        """
+        Analyze asset correlations and identify diversification opportunities.
+        With block_size set, only the top/bottom pairs are computed block by block and no full
+        matrix is built (corr_matrix is None and corr_df holds just those pairs).
+        method='ewma' or 'rolling' ranks the current correlations from the incremental covariance
+        engine instead of the full-sample matrix, optionally shrunk towards a structured target.
+        """
         returns_df = price_df.pct_change().dropna()
-        corr_matrix = returns_df.corr()
-        
-        # Find highest and lowest correlations
-        corr_values = []
-        for i in range(len(corr_matrix.columns)):
-            for j in range(i+1, len(corr_matrix.columns)):
-                asset1 = corr_matrix.columns[i]
-                asset2 = corr_matrix.columns[j]
-                correlation = corr_matrix.iloc[i, j]
-                corr_values.append({
-                    'asset1': asset1,
-                    'asset2': asset2,
-                    'correlation': correlation
-                })
-        
-        corr_df = pd.DataFrame(corr_values)
+        
+        if method != 'sample':
+            engine = CovarianceEngine(returns_df.columns, mode=method, halflife=halflife)
+            engine.update_panel(returns_df)
+            corr_matrix = engine.correlation(shrinkage)
+            highest, lowest = rank_correlation_pairs(corr_matrix, top_k)
+            corr_df = correlation_pairs(corr_matrix)
+        elif block_size:
+            corr_matrix = None
+            highest, lowest = blocked_correlation_pairs(returns_df, top_k, block_size)
+            corr_df = pd.concat([highest, lowest], ignore_index=True)
+        else:
+            corr_matrix = returns_df.corr()
+            highest, lowest = rank_correlation_pairs(corr_matrix, top_k)
+            corr_df = correlation_pairs(corr_matrix)
         
         logger.info("🔗 CORRELATION ANALYSIS:")
         logger.info("   Highest Correlations:")
-        for _, row in corr_df.nlargest(5, 'correlation').iterrows():
-            logger.info(f"      {row['asset1']:6} - {row['asset2']:6}: {row['correlation']:+6.3f}")
+        for asset1, asset2, correlation in highest.itertuples(index=False):
+            logger.info(f"      {asset1:6} - {asset2:6}: {correlation:+6.3f}")
         
         logger.info("   Lowest Correlations (Best Diversifiers):")
-        for _, row in corr_df.nsmallest(5, 'correlation').iterrows():
-            logger.info(f"      {row['asset1']:6} - {row['asset2']:6}: {row['correlation']:+6.3f}")
+        for asset1, asset2, correlation in lowest.itertuples(index=False):
+            logger.info(f"      {asset1:6} - {asset2:6}: {correlation:+6.3f}")
         
         return corr_matrix, corr_df
     
-    def detect_volatility_regimes(self, returns_series, window=20):
-        """Detect high/low volatility regimes"""
-        volatility = returns_series.rolling(window).std() * np.sqrt(252)
-        vol_median = volatility.median()
-        
-        # Define regimes
-        high_vol_threshold = vol_median * 1.5
-        low_vol_threshold = vol_median * 0.7
-        
-        regimes = pd.Series(index=returns_series.index, dtype='object')
-        regimes[volatility > high_vol_threshold] = 'High'
-        regimes[volatility < low_vol_threshold] = 'Low'
-        regimes.fillna('Normal', inplace=True)
+    def detect_volatility_regimes(self, returns, window=20, baseline=None):
+        """
+        Detect high/low volatility regimes for a returns Series or a whole (date x symbol) DataFrame
+        at once. Thresholds are 1.5x/0.7x the median volatility: the full-sample median by default,
+        or a trailing `baseline`-bar median for point-in-time regimes.
+        """
+        volatility = rolling_volatility(returns, window)
+        states = volatility_states(returns, window, baseline)
+        labels = np.array(('Normal',) + VOLATILITY_STATES, dtype=object)[states + 1]  # warm-up rows stay Normal
+        if isinstance(returns, pd.DataFrame):
+            regimes = pd.DataFrame(labels, index=returns.index, columns=returns.columns)
+        else:
+            regimes = pd.Series(labels[:, 0], index=returns.index)
         
         return regimes, volatility
     
-    def backtest_enhanced_strategy(self, symbols, start_date=None, lookback=252):
-        """Backtest enhanced multi-asset strategy"""
+    def detect_market_regimes(self, price_df, path=None, **params):
+        """
+        Volatility/trend regime codes (int8) for every symbol and the equal-weight index. With a
+        path the matrix is stored there and later calls only classify the new dates.
+        """
+        if path is None:
+            return classify_regimes(price_df, **params)
+        return RegimeMatrix(path, **params).update(price_df)
+    
+    def sleeve_signals(self, price_df, returns_df, vol_lookback, momentum_lookback, sma_lookback):
+        """
+        Full (date x symbol) histories of the sleeve inputs, each from one cumulative-sum pass per
+        column: annualized volatility, trailing compounded return (momentum) and the price SMA
+        """
+        return {
+            'volatility': rolling_volatility(returns_df, vol_lookback),
+            'momentum': rolling_compound_return(returns_df, momentum_lookback),
+            'sma': rolling_mean(price_df, sma_lookback),
+        }
+    
+    def optimized_weights(self, price_df, method='min_variance', frequency='M', **params):
+        """
+        Minimum-variance, mean-variance or risk-parity target weights on each rebalance date, from
+        the EWMA covariance known at that close (PortfolioOptimizer parameters pass through).
+        """
+        optimizer = PortfolioOptimizer(method, **params)
+        targets = optimizer.target_weights(price_df, frequency)
+        stats = optimizer.stats
+        if stats['solves']:
+            logger.info(f"   {SLEEVE_NAMES[method]}: {stats['solves']} rebalances, "
+                        f"{stats['iterations'] / stats['solves']:.1f} iterations and "
+                        f"{stats['seconds'] / stats['solves'] * 1000:.1f} ms per solve")
+        return targets
+    
+    def backtest_enhanced_strategy(self, symbols, start_date=None, lookback=252, rebalance=None, cost_bps=5.0,
+                                   optimized=()):
+        """
+        Backtest enhanced multi-asset strategy. With rebalance set (bars, or 'W'/'M'/'Q'), every
+        sleeve's weights are recomputed on each rebalance date from the signals known then, with
+        turnover costs; otherwise weights come from the final date and are applied to the whole history.
+        optimized adds sleeves from portfolio_optimizer methods ('min_variance', 'mean_variance',
+        'risk_parity'), solved on each rebalance date or once on the full-sample covariance.
+        """
         logger.info("🚀 ENHANCED STRATEGY BACKTESTING")
         logger.info("=" * 60)
         
@@ -189,6 +261,29 @@ class AdvancedStrategyAnalyzer:
         
         # Strategy components
         strategies = {}
+        vol_lookback = min(60, len(returns_df) // 4)
+        momentum_lookback = min(220, len(returns_df) // 2)  # ~11 months (12-1 month momentum)
+        sma_lookback = min(200, len(returns_df) // 2)
+        
+        if rebalance is not None:
+            signals = panel_sleeve_signals(price_df, vol_lookback, momentum_lookback, sma_lookback)
+            sleeve_functions = dict(SLEEVES)
+            for method in optimized:
+                targets = self.optimized_weights(price_df, method, rebalance)
+                sleeve_functions[SLEEVE_NAMES[method]] = optimized_sleeve(targets, price_df.index)
+            sleeves = run_rebalanced_sleeves(price_df, signals, sleeve_functions, frequency=rebalance,
+                                             cost_bps=cost_bps)
+            for name, sleeve in sleeves.items():
+                metrics = self.return_metrics(sleeve['returns'])
+                metrics['annual_turnover'] = sleeve['turnover'].sum() / (len(sleeve['returns']) / 252)
+                metrics['total_costs'] = sleeve['costs'].sum()
+                strategies[name] = {'metrics': metrics, 'returns': sleeve['returns'],
+                                    'weights': sleeve['weights'], 'turnover': sleeve['turnover']}
+            logger.info(f"   Rebalancing: {rebalance}, {len(next(iter(sleeves.values()))['weights'])} "
+                        f"rebalances, {cost_bps:g} bps per unit turnover")
+            return self._report_strategies(strategies, price_df)
+        
+        signals = self.sleeve_signals(price_df, returns_df, vol_lookback, momentum_lookback, sma_lookback)
         
         # 1. Equal Weight Benchmark
         eq_weights = np.ones(len(returns_df.columns)) / len(returns_df.columns)
@@ -196,18 +291,13 @@ class AdvancedStrategyAnalyzer:
         strategies['Equal Weight'] = {'metrics': eq_metrics, 'returns': eq_returns}
         
         # 2. Low Volatility Strategy
-        vol_lookback = min(60, len(returns_df) // 4)
-        rolling_vol = returns_df.rolling(vol_lookback).std() * np.sqrt(252)
-        latest_vol = rolling_vol.iloc[-1]
+        latest_vol = signals['volatility'].iloc[-1]
         vol_weights = (1 / latest_vol) / (1 / latest_vol).sum()
         vol_metrics, vol_returns = self.calculate_portfolio_metrics(returns_df, vol_weights)
         strategies['Low Volatility'] = {'metrics': vol_metrics, 'returns': vol_returns}
         
         # 3. Momentum Strategy (12-1 month)
-        momentum_lookback = min(220, len(returns_df) // 2)  # ~11 months
-        momentum_scores = returns_df.rolling(momentum_lookback).apply(
-            lambda x: (1 + x).prod() - 1, raw=False
-        ).iloc[-1]
+        momentum_scores = signals['momentum'].iloc[-1]
         # Top 50% momentum, equal weighted
         top_momentum = momentum_scores.nlargest(len(momentum_scores)//2)
         mom_weights = np.zeros(len(returns_df.columns))
@@ -219,9 +309,8 @@ class AdvancedStrategyAnalyzer:
         
         # 4. Mean Reversion Strategy
         # Select assets trading below their long-term averages
-        sma_lookback = min(200, len(returns_df) // 2)
         latest_prices = price_df.iloc[-1]
-        sma_prices = price_df.rolling(sma_lookback).mean().iloc[-1]
+        sma_prices = signals['sma'].iloc[-1]
         undervalued = latest_prices[latest_prices < sma_prices * 0.95]  # 5% below SMA
         
         if len(undervalued) > 0:
@@ -232,6 +321,16 @@ class AdvancedStrategyAnalyzer:
             mr_metrics, mr_returns = self.calculate_portfolio_metrics(returns_df, mr_weights)
             strategies['Mean Reversion'] = {'metrics': mr_metrics, 'returns': mr_returns}
         
+        # 5. Optimized allocations on the full-sample covariance
+        for method in optimized:
+            weights = PortfolioOptimizer(method).weights(returns_df.cov(), returns_df.mean(), returns_df.columns)
+            opt_metrics, opt_returns = self.calculate_portfolio_metrics(returns_df, weights)
+            strategies[SLEEVE_NAMES[method]] = {'metrics': opt_metrics, 'returns': opt_returns}
+        
+        return self._report_strategies(strategies, price_df)
+    
+    def _report_strategies(self, strategies, price_df):
+        """Log the sleeve comparison and correlations, save comparison and return CSVs"""
         # Performance comparison
         logger.info("📈 STRATEGY PERFORMANCE COMPARISON:")
         logger.info("-" * 60)
@@ -254,6 +353,18 @@ class AdvancedStrategyAnalyzer:
                        f"Vol: {row['Volatility']} | Sharpe: {row['Sharpe']} | "
                        f"DD: {row['Max DD']} | WR: {row['Win Rate']}")
         
+        # Market regimes of the equal-weight index
+        regimes = self.detect_market_regimes(price_df)
+        index_codes = regimes[INDEX_COLUMN].to_numpy()
+        known = index_codes >= 0
+        if known.any():
+            logger.info("")
+            logger.info(f"🌡️  Market regime (equal-weight index): {regime_label(index_codes[-1])}")
+            vol_share = np.bincount(volatility_state(index_codes[known]), minlength=3) / known.sum()
+            trend_share = np.bincount(trend_state(index_codes[known]), minlength=3) / known.sum()
+            logger.info("   Volatility: " + ", ".join(f"{name} {share:.0%}" for name, share in zip(VOLATILITY_STATES, vol_share)))
+            logger.info("   Trend:      " + ", ".join(f"{name} {share:.0%}" for name, share in zip(TREND_STATES, trend_share)))
+        
         # Correlation analysis
         logger.info("")
         self.analyze_correlation_matrix(price_df)
@@ -321,7 +432,8 @@ def main():
         # Run comprehensive strategy analysis
         result = analyzer.backtest_enhanced_strategy(
             available_symbols,
-            start_date='2021-01-01'  # Use recent 3+ years for focused analysis
+            start_date='2021-01-01',  # Use recent 3+ years for focused analysis
+            rebalance='M'             # Monthly rebalancing from point-in-time signals
         )
         
         if result:
@@ -353,7 +465,7 @@ def main():
         raise
     
     finally:
-        analyzer.conn.close()
+        analyzer.db.close_thread()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,157 @@
+# Step 7: Persistent Backtest Result Cache
+# Content-addressed backtest results keyed by (data fingerprint, strategy, parameters)
+
+import os
+import sys
+import json
+import time
+import zlib
+import pickle
+import hashlib
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from corporate_actions import actions_version
+
+DEFAULT_DB_PATH = os.path.join(STEP5_DIR, 'market_data.db')
+DEFAULT_CACHE_PATH = os.path.join(CURRENT_DIR, 'backtest_cache', 'results.db')
+
+# Bump when backtest logic changes so results computed by older code are not served
+CACHE_VERSION = 1
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS backtest_results (
+        cache_key TEXT PRIMARY KEY,
+        strategy TEXT NOT NULL,
+        params TEXT NOT NULL,
+        symbols TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        metrics TEXT,
+        result BLOB NOT NULL,
+        size_bytes INTEGER,
+        runtime_seconds REAL,
+        last_access REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def data_fingerprint(conn, symbols=None, timeframe='Day') -> str:
+    """
+    Hash of the bars a backtest reads: per symbol the bar count, first/last timestamp, newest
+    ingestion time and close/volume totals, plus the corporate-action version. Any appended,
+    corrected or re-adjusted bar changes it.
+    """
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    query = '''
+        SELECT symbol, COUNT(*), MIN(ts_ns), MAX(ts_ns), MAX(created_at), TOTAL(close), TOTAL(volume)
+        FROM market_data WHERE timeframe = ?
+    '''
+    params = [timeframe]
+    if symbols:
+        query += f" AND symbol IN ({','.join(['?' for _ in symbols])})"
+        params.extend(symbols)
+    query += ' GROUP BY symbol ORDER BY symbol'
+
+    digest = hashlib.sha1()
+    for row in conn.execute(query, params):
+        digest.update(repr(row).encode())
+    versions = actions_version(conn, symbols)
+    digest.update(json.dumps(versions, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _jsonable(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+class BacktestResultCache:
+    """
+    Stores whole backtest results (metrics, equity curves, trade logs) on disk. A result is
+    addressed by strategy, parameters and symbols; it is served only while the fingerprint of
+    the bars it was computed from is unchanged, and re-running replaces the stale entry.
+    """
+
+    def __init__(self, db_path=None, cache_path=None):
+        self.db = get_connection_manager(db_path or DEFAULT_DB_PATH)
+        self.cache_path = cache_path or DEFAULT_CACHE_PATH
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        self.store = get_connection_manager(self.cache_path)
+        with self.store.writer() as conn:
+            conn.execute(CACHE_SCHEMA)
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _key(self, strategy, params_json, symbols_json, timeframe):
+        raw = f"{CACHE_VERSION}|{strategy}|{params_json}|{symbols_json}|{timeframe}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get_or_run(self, strategy: str, params: dict, symbols, run, timeframe='Day', db=None):
+        """
+        Return the cached result of run() for these inputs, or call run() and store what it returns.
+        symbols=None means the whole database universe; db overrides the market data connection
+        manager the fingerprint is read from (the one run() reads).
+        """
+        params_json = json.dumps({k: _jsonable(v) for k, v in params.items()}, sort_keys=True, default=str)
+        symbols_list = [symbols] if isinstance(symbols, str) else (sorted(symbols) if symbols else None)
+        symbols_json = json.dumps(symbols_list)
+        key = self._key(strategy, params_json, symbols_json, timeframe)
+
+        with (db or self.db).reader() as conn:
+            fingerprint = data_fingerprint(conn, symbols_list, timeframe)
+
+        with self.store.reader() as conn:
+            row = conn.execute('SELECT fingerprint, result FROM backtest_results WHERE cache_key = ?',
+                               (key,)).fetchone()
+        if row is not None and row[0] == fingerprint:
+            self.stats['hits'] += 1
+            with self.store.writer() as conn:
+                conn.execute('UPDATE backtest_results SET last_access = ? WHERE cache_key = ?', (time.time(), key))
+            return pickle.loads(zlib.decompress(row[1]))
+
+        self.stats['misses'] += 1
+        start = time.perf_counter()
+        result = run()
+        runtime = time.perf_counter() - start
+
+        blob = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        with self.store.writer() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO backtest_results
+                (cache_key, strategy, params, symbols, fingerprint, metrics, result, size_bytes,
+                 runtime_seconds, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (key, strategy, params_json, symbols_json, fingerprint, self._metrics_json(result),
+                  blob, len(blob), runtime, time.time()))
+        return result
+
+    def _metrics_json(self, result):
+        """Scalar metrics of a result as JSON, so the store can be queried without unpickling"""
+        if not isinstance(result, dict):
+            return None
+        metrics = result.get('portfolio_metrics', result)
+        if not isinstance(metrics, dict):
+            return None
+        scalars = {k: _jsonable(v) for k, v in metrics.items() if isinstance(_jsonable(v), (int, float, str))}
+        return json.dumps(scalars, default=str)
+
+    def invalidate(self, strategy=None):
+        """Remove stored results (for one strategy, or everything)"""
+        with self.store.writer() as conn:
+            if strategy is None:
+                conn.execute('DELETE FROM backtest_results')
+            else:
+                conn.execute('DELETE FROM backtest_results WHERE strategy = ?', (strategy,))
+
+    def summary(self) -> dict:
+        """Entry count, disk usage, total backtest time stored and this session's hits/misses"""
+        with self.store.reader() as conn:
+            entries, size, runtime = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(runtime_seconds), 0)
+                FROM backtest_results
+            ''').fetchone()
+        return {'entries': entries, 'size_mb': size / 1e6, 'stored_runtime_seconds': runtime, **self.stats}
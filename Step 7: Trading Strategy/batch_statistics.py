@@ -0,0 +1,184 @@
+# Step 7: Batch Symbol Statistics
+# The MarketDataAnalyzer per-symbol statistics for a whole end-aligned panel, one row per symbol
+
+import time
+import numpy as np
+import pandas as pd
+
+from indicators import bollinger_bands, rsi, rolling_volatility, pct_returns, TRADING_DAYS
+
+MA_WINDOWS = (20, 50, 200)
+
+# Rolling indicators only report their last value, so they run on the final bars of the panel
+TAIL_BARS = max(MA_WINDOWS) + 1
+
+
+def _first_valid(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """First valid value per column of an end-aligned panel (its history start)"""
+    return values[np.argmax(valid, axis=0), np.arange(values.shape[1])]
+
+
+def rsi_status(current_rsi):
+    """Oversold below 30, Overbought above 70, else Neutral"""
+    return np.select([current_rsi < 30, current_rsi > 70], ['Oversold', 'Overbought'], default='Neutral')
+
+
+def ma_trend(ma_20, ma_50, ma_200):
+    """Bullish when the averages are stacked 20 > 50 > 200, Bearish when reversed, else Mixed"""
+    with np.errstate(invalid='ignore'):
+        bullish = (ma_20 > ma_50) & (ma_50 > ma_200)
+        bearish = (ma_20 < ma_50) & (ma_50 < ma_200)
+    return np.select([bullish, bearish], ['Bullish', 'Bearish'], default='Mixed')
+
+
+def panel_statistics(panel: dict) -> pd.DataFrame:
+    """
+    Statistics for every symbol of an end-aligned read_panel result (close/high/low/volume and
+    timestamp panels). Whole-history figures are column reductions; the moving averages,
+    Bollinger bands, RSI and 30-day volatility come from one cumulative pass over the tail rows.
+    """
+    close_df = panel['close']
+    if close_df.empty:
+        return pd.DataFrame()
+    close = close_df.to_numpy()
+    high = panel['high'].to_numpy()
+    low = panel['low'].to_numpy()
+    volume = panel['volume'].to_numpy()
+    valid = np.isfinite(close)
+    total_days = valid.sum(axis=0)
+
+    returns = pct_returns(close)
+    tail = close[-TAIL_BARS:]
+    bands = bollinger_bands(tail, MA_WINDOWS, num_std=2)
+    current_rsi = rsi(tail, 14)[-1]
+    volatility_30d = rolling_volatility(returns[-TAIL_BARS:], 30)[-1]
+    ma = {w: bands[w]['middle'][-1] for w in MA_WINDOWS}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        first_close = _first_valid(close, valid)
+        current = close[-1]
+        mean_return = np.nanmean(returns, axis=0)
+        std_return = np.nanstd(returns, axis=0, ddof=1)
+        volatility = std_return * np.sqrt(TRADING_DAYS)
+        sharpe = np.where(std_return > 0, mean_return * TRADING_DAYS / volatility, 0.0)
+        drawdown = close / np.fmax.accumulate(close, axis=0) - 1
+        recent_volume = np.nanmean(volume[-30:], axis=0)
+        prior_volume = np.nanmean(volume[-60:-30], axis=0)
+
+        stats = pd.DataFrame({
+            'total_days': total_days,
+            'start': panel['timestamp'].min().dt.strftime('%Y-%m-%d'),
+            'end': panel['timestamp'].max().dt.strftime('%Y-%m-%d'),
+            'current_price': current,
+            'highest_price': np.nanmax(high, axis=0),
+            'lowest_price': np.nanmin(low, axis=0),
+            'avg_price': np.nanmean(close, axis=0),
+            'price_change': current - first_close,
+            'price_change_pct': (current / first_close - 1) * 100,
+            'avg_volume': np.nanmean(volume, axis=0),
+            'max_volume': np.nanmax(volume, axis=0),
+            'volume_trend': np.where(recent_volume > prior_volume, 'Increasing', 'Decreasing'),
+            'avg_daily_return': mean_return,
+            'volatility': volatility,
+            'sharpe_ratio': sharpe,
+            'max_drawdown': np.nanmin(drawdown, axis=0) * 100,
+            'volatility_30d': volatility_30d,
+            **{f'ma_{w}': ma[w] for w in MA_WINDOWS},
+            'bb_upper': bands[20]['upper'][-1],
+            'bb_middle': ma[20],
+            'bb_lower': bands[20]['lower'][-1],
+            'current_rsi': current_rsi,
+            'rsi_status': rsi_status(current_rsi),
+            'ma_trend': ma_trend(ma[20], ma[50], ma[200]),
+        }, index=close_df.columns)
+    stats.index.name = 'symbol'
+    return stats
+
+
+def nested_statistics(symbol, row) -> dict:
+    """One row of panel_statistics in the nested dict layout of get_symbol_statistics"""
+    return {
+        'symbol': symbol,
+        'total_days': int(row['total_days']),
+        'date_range': {'start': row['start'], 'end': row['end']},
+        'price_stats': {name: row[name] for name in ('current_price', 'highest_price', 'lowest_price',
+                                                     'avg_price', 'price_change', 'price_change_pct')},
+        'volume_stats': {name: row[name] for name in ('avg_volume', 'max_volume', 'volume_trend')},
+        'volatility_stats': {name: row[name] for name in ('avg_daily_return', 'volatility',
+                                                          'sharpe_ratio', 'max_drawdown')},
+        'technical_indicators': {name: row[name] for name in ('current_rsi', 'rsi_status', 'ma_trend')},
+    }
+
+
+def _reference_statistics(bars: pd.DataFrame) -> dict:
+    """Per-symbol pandas calculation the batch replaces (used by the self-check)"""
+    close = bars['close']
+    returns = close.pct_change()
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    ma = {w: close.rolling(w).mean() for w in MA_WINDOWS}
+    peak = close.expanding(min_periods=1).max()
+    return {
+        'current_price': close.iloc[-1],
+        'highest_price': bars['high'].max(),
+        'avg_price': close.mean(),
+        'price_change_pct': (close.iloc[-1] / close.iloc[0] - 1) * 100,
+        'avg_volume': bars['volume'].mean(),
+        'volatility': returns.std() * np.sqrt(TRADING_DAYS),
+        'sharpe_ratio': (returns.mean() * TRADING_DAYS) / (returns.std() * np.sqrt(TRADING_DAYS)),
+        'max_drawdown': ((close - peak) / peak).min() * 100,
+        'volatility_30d': returns.rolling(30).std().iloc[-1] * np.sqrt(TRADING_DAYS),
+        **{f'ma_{w}': ma[w].iloc[-1] for w in MA_WINDOWS},
+        'bb_upper': ma[20].iloc[-1] + 2 * close.rolling(20).std().iloc[-1],
+        'current_rsi': (100 - (100 / (1 + gain / loss))).iloc[-1],
+        'volume_trend': 'Increasing' if bars['volume'].iloc[-30:].mean() > bars['volume'].iloc[-60:-30].mean() else 'Decreasing',
+    }
+
+
+def _synthetic_panel(n_bars, n_symbols, seed=5):
+    """End-aligned panels shaped like read_panel(..., align='end') with uneven history lengths"""
+    rng = np.random.default_rng(seed)
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (n_bars, n_symbols)), axis=0))
+    high = close * (1 + rng.uniform(0, 0.02, close.shape))
+    low = close * (1 - rng.uniform(0, 0.02, close.shape))
+    volume = rng.integers(10_000, 1_000_000, close.shape).astype('float64')
+    lengths = rng.integers(40, n_bars + 1, n_symbols)
+    missing = np.arange(n_bars)[:, None] < (n_bars - lengths)
+    dates = pd.bdate_range(end='2025-06-30', periods=n_bars)
+    timestamps = np.where(missing, np.datetime64('NaT'), dates.values[:, None])
+    columns = [f'S{i:04d}' for i in range(n_symbols)]
+    index = pd.RangeIndex(-n_bars + 1, 1)
+    panel = {name: pd.DataFrame(np.where(missing, np.nan, values), index=index, columns=columns)
+             for name, values in (('close', close), ('high', high), ('low', low), ('volume', volume))}
+    panel['timestamp'] = pd.DataFrame(timestamps.astype('M8[ns]'), index=index, columns=columns)
+    return panel
+
+
+def main():
+    """Check the batch against per-symbol pandas statistics and time a full-universe panel"""
+    panel = _synthetic_panel(1500, 60)
+    stats = panel_statistics(panel)
+    worst = 0.0
+    for symbol in panel['close'].columns:
+        bars = pd.DataFrame({name: panel[name][symbol] for name in ('close', 'high', 'volume')}).dropna()
+        for name, expected in _reference_statistics(bars).items():
+            actual = stats.at[symbol, name]
+            if isinstance(expected, str):
+                worst = max(worst, float(actual != expected))
+            elif np.isfinite(expected) or np.isfinite(actual):
+                worst = max(worst, abs(actual - expected) / max(1.0, abs(expected)))
+    print(f"Batch vs per-symbol pandas (60 symbols, uneven histories): max relative difference {worst:.1e}")
+
+    big = _synthetic_panel(2000, 3000)
+    start = time.perf_counter()
+    panel_statistics(big)
+    seconds = time.perf_counter() - start
+    print(f"3000 symbols x 2000 bars: {seconds:.2f}s")
+    ok = worst < 1e-9
+    print(f"{'✅ Batch statistics match' if ok else '❌ Parity check failed'}")
+    return ok
+
+
+if __name__ == "__main__":
+    main()
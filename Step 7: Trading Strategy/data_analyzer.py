@@ -19,6 +19,13 @@ if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 
 from data_management import MarketDataManager
+from timestamps import read_panel
+from symbol_stats import get_symbol_stats
+from indicators import rolling_mean, rolling_volatility, rsi, bollinger_bands
+from correlation import CovarianceEngine
+from batch_statistics import panel_statistics, nested_statistics
+from chart_renderer import ChartRenderer, price_chart_spec
+from bootstrap import bootstrap_metrics
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -46,15 +53,13 @@ class MarketDataAnalyzer:
     def get_symbol_statistics(self, symbol, start_date=None, end_date=None):
         """Calculate comprehensive statistics for a specific symbol"""
         data = self.data_manager.get_data_from_database(
-            symbols=symbol, start_date=start_date, end_date=end_date
+            symbols=symbol, start_date=start_date, end_date=end_date, typed_timestamps=True
         )
         
         if data.empty:
             logging.warning(f"No data found for symbol: {symbol}")
             return {}
         
-        # Convert timestamp to datetime
-        data['timestamp'] = pd.to_datetime(data['timestamp'])
         data = data.sort_values('timestamp')
         
         # Calculate returns
@@ -62,25 +67,20 @@ class MarketDataAnalyzer:
         data['log_return'] = np.log(data['close'] / data['close'].shift(1))
         
         # Calculate volatility (rolling 30-day)
-        data['volatility_30d'] = data['daily_return'].rolling(window=30).std() * np.sqrt(252)
+        data['volatility_30d'] = rolling_volatility(data['daily_return'], 30)
         
-        # Calculate moving averages
-        data['ma_20'] = data['close'].rolling(window=20).mean()
-        data['ma_50'] = data['close'].rolling(window=50).mean()
-        data['ma_200'] = data['close'].rolling(window=200).mean()
+        # Calculate moving averages (all windows from one cumulative pass)
+        for window, ma in rolling_mean(data['close'], (20, 50, 200)).items():
+            data[f'ma_{window}'] = ma
         
         # Calculate RSI
-        delta = data['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        data['rsi'] = 100 - (100 / (1 + rs))
+        data['rsi'] = rsi(data['close'], 14)
         
         # Calculate Bollinger Bands
-        data['bb_middle'] = data['close'].rolling(window=20).mean()
-        bb_std = data['close'].rolling(window=20).std()
-        data['bb_upper'] = data['bb_middle'] + (bb_std * 2)
-        data['bb_lower'] = data['bb_middle'] - (bb_std * 2)
+        bands = bollinger_bands(data['close'], 20, num_std=2)
+        data['bb_middle'] = bands['middle']
+        data['bb_upper'] = bands['upper']
+        data['bb_lower'] = bands['lower']
         
         # Calculate statistics
         stats = {
@@ -118,13 +118,38 @@ class MarketDataAnalyzer:
         
         return stats, data
     
+    def get_batch_statistics(self, symbols=None, start_date=None, end_date=None, timeframe='Day',
+                             chunk_size=500):
+        """
+        The get_symbol_statistics figures for many symbols (all stored symbols when None) as one
+        frame indexed by symbol. Each chunk of symbols is read with a single query into end-aligned
+        panels and computed column-wise, so memory stays bounded for full-universe runs.
+        """
+        with self.data_manager.db.reader() as conn:
+            if symbols is None:
+                symbols = get_symbol_stats(conn, timeframe=timeframe).index.tolist()
+            elif isinstance(symbols, str):
+                symbols = [symbols]
+            frames = []
+            for i in range(0, len(symbols), chunk_size):
+                panel = read_panel(conn, symbols[i:i + chunk_size], start_date, end_date, timeframe,
+                                   columns=('close', 'high', 'low', 'volume'), align='end')
+                frames.append(panel_statistics(panel))
+        
+        stats = pd.concat(frames) if frames else pd.DataFrame()
+        missing = [symbol for symbol in symbols if symbol not in stats.index]
+        if missing:
+            logging.warning(f"No data found for {len(missing)} symbols: {', '.join(missing[:10])}")
+        logging.info(f"Batch statistics computed for {len(stats)} symbols")
+        return stats
+    
     def _calculate_max_drawdown(self, prices):
         """Calculate maximum drawdown from peak"""
         peak = prices.expanding(min_periods=1).max()
         drawdown = (prices - peak) / peak
         return drawdown.min() * 100
     
-    def create_price_chart(self, symbol, start_date=None, end_date=None, save_plot=True):
+    def create_price_chart(self, symbol, start_date=None, end_date=None, save_plot=True, show=True):
         """Create comprehensive price chart with technical indicators"""
         stats, data = self.get_symbol_statistics(symbol, start_date, end_date)
         
@@ -175,11 +200,63 @@ class MarketDataAnalyzer:
             plt.savefig(filepath, dpi=300, bbox_inches='tight')
             logging.info(f"Chart saved: {filepath}")
         
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close()
         return True
     
-    def create_correlation_matrix(self, symbols, start_date=None, end_date=None, save_plot=True):
-        """Create correlation matrix for multiple symbols"""
+    def create_price_charts(self, symbols=None, start_date=None, end_date=None, renderer=None, block=True,
+                            chunk_size=500):
+        """
+        Price charts (close, MAs, Bollinger bands, volume, RSI) for many symbols, all stored symbols
+        when None. Indicators are computed on end-aligned panels read one chunk per query, and the
+        charts are drawn headlessly by a ChartRenderer process pool with long series downsampled.
+        Returns {symbol: path}. With block=False and a renderer passed in, the files are still being
+        written when it returns (collect them with renderer.wait()).
+        """
+        own_renderer = renderer is None
+        renderer = renderer or ChartRenderer(self.analysis_dir)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        paths = {}
+        with self.data_manager.db.reader() as conn:
+            if symbols is None:
+                symbols = get_symbol_stats(conn).index.tolist()
+            for i in range(0, len(symbols), chunk_size):
+                panel = read_panel(conn, symbols[i:i + chunk_size], start_date, end_date,
+                                   columns=('close', 'volume'), align='end')
+                close = panel['close']
+                if close.empty:
+                    continue
+                indicators = {f'ma_{w}': ma for w, ma in rolling_mean(close, (20, 50, 200)).items()}
+                bands = bollinger_bands(close, 20, num_std=2)
+                indicators.update(bb_upper=bands['upper'], bb_lower=bands['lower'], rsi=rsi(close, 14))
+                specs = []
+                for symbol in close.columns:
+                    rows = close[symbol].notna().to_numpy()
+                    data = pd.DataFrame({'close': close[symbol], 'volume': panel['volume'][symbol],
+                                         **{name: values[symbol] for name, values in indicators.items()}})[rows]
+                    data.index = pd.DatetimeIndex(panel['timestamp'][symbol][rows])
+                    paths[symbol] = renderer.path(f"{symbol}_analysis_{stamp}")
+                    specs.append(price_chart_spec(symbol, data, paths[symbol]))
+                renderer.render(specs, block=False)
+        
+        if own_renderer:
+            renderer.close()
+        elif block:
+            renderer.wait()
+        if block or own_renderer:
+            logging.info(f"{len(paths)} price charts saved to {renderer.output_dir}")
+        return paths
+    
+    def create_correlation_matrix(self, symbols, start_date=None, end_date=None, save_plot=True,
+                                  method='sample', halflife=63, window=126, shrinkage=None, intensity=0.1,
+                                  show=True):
+        """
+        Create correlation matrix for multiple symbols. method='sample' is the full-period
+        correlation; 'ewma' or 'rolling' give the current correlation from the incremental
+        covariance engine, optionally shrunk (shrinkage='constant_correlation', 'diagonal', 'identity').
+        """
         if len(symbols) < 2:
             logging.warning("Need at least 2 symbols for correlation analysis")
             return False
@@ -188,10 +265,9 @@ class MarketDataAnalyzer:
         all_data = {}
         for symbol in symbols:
             data = self.data_manager.get_data_from_database(
-                symbols=symbol, start_date=start_date, end_date=end_date
+                symbols=symbol, start_date=start_date, end_date=end_date, typed_timestamps=True
             )
             if not data.empty:
-                data['timestamp'] = pd.to_datetime(data['timestamp'])
                 data = data.set_index('timestamp')['close']
                 all_data[symbol] = data
         
@@ -204,7 +280,12 @@ class MarketDataAnalyzer:
         
         # Calculate returns and correlation
         returns = df.pct_change().dropna()
-        correlation_matrix = returns.corr()
+        if method == 'sample':
+            correlation_matrix = returns.corr()
+        else:
+            engine = CovarianceEngine(returns.columns, mode=method, halflife=halflife, window=window)
+            engine.update_panel(returns)
+            correlation_matrix = engine.correlation(shrinkage, intensity)
         
         # Create correlation heatmap
         plt.figure(figsize=(12, 10))
@@ -219,7 +300,8 @@ class MarketDataAnalyzer:
                    fmt='.2f',
                    cbar_kws={"shrink": .8})
         
-        plt.title(f'Correlation Matrix: {", ".join(symbols)}', fontsize=16, fontweight='bold')
+        title = 'Correlation Matrix' if method == 'sample' else f'Correlation Matrix ({method})'
+        plt.title(f'{title}: {", ".join(symbols)}', fontsize=16, fontweight='bold')
         plt.tight_layout()
         
         if save_plot:
@@ -228,11 +310,18 @@ class MarketDataAnalyzer:
             plt.savefig(filepath, dpi=300, bbox_inches='tight')
             logging.info(f"Correlation matrix saved: {filepath}")
         
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close()
         return correlation_matrix
     
-    def create_portfolio_analysis(self, symbols, weights=None, start_date=None, end_date=None):
-        """Analyze portfolio performance with given symbols and weights"""
+    def create_portfolio_analysis(self, symbols, weights=None, start_date=None, end_date=None, show=True,
+                                  bootstrap_paths=0, bootstrap_method='stationary'):
+        """
+        Analyze portfolio performance with given symbols and weights. bootstrap_paths > 0 adds
+        90% bootstrap confidence intervals for each statistic under 'confidence_intervals'.
+        """
         if weights is None:
             weights = [1/len(symbols)] * len(symbols)  # Equal weight
         
@@ -244,10 +333,9 @@ class MarketDataAnalyzer:
         portfolio_data = {}
         for symbol in symbols:
             data = self.data_manager.get_data_from_database(
-                symbols=symbol, start_date=start_date, end_date=end_date
+                symbols=symbol, start_date=start_date, end_date=end_date, typed_timestamps=True
             )
             if not data.empty:
-                data['timestamp'] = pd.to_datetime(data['timestamp'])
                 data = data.set_index('timestamp')['close']
                 portfolio_data[symbol] = data
         
@@ -273,6 +361,10 @@ class MarketDataAnalyzer:
             'cvar_95': portfolio_returns[portfolio_returns <= np.percentile(portfolio_returns, 5)].mean()
         }
         
+        if bootstrap_paths:
+            boot = bootstrap_metrics(portfolio_returns, bootstrap_paths, method=bootstrap_method)
+            portfolio_stats['confidence_intervals'] = boot['intervals'].to_dict('index')
+        
         # Create portfolio performance chart
         cumulative_returns = (portfolio_returns + 1).cumprod()
         
@@ -291,12 +383,20 @@ class MarketDataAnalyzer:
         plt.savefig(filepath, dpi=300, bbox_inches='tight')
         logging.info(f"Portfolio analysis chart saved: {filepath}")
         
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close()
         
         return portfolio_stats
     
-    def generate_analysis_report(self, symbols, start_date=None, end_date=None, filename=None):
-        """Generate comprehensive analysis report for multiple symbols"""
+    def generate_analysis_report(self, symbols, start_date=None, end_date=None, filename=None,
+                                 charts=False, show=True):
+        """
+        Generate comprehensive analysis report for multiple symbols. charts=True also renders a
+        price chart per symbol in the background (paths under 'charts'); show=False keeps the
+        portfolio chart off screen.
+        """
         if filename is None:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"market_analysis_report_{timestamp}.json"
@@ -312,16 +412,27 @@ class MarketDataAnalyzer:
             'portfolio_analysis': None
         }
         
-        # Individual symbol analysis
+        # Price charts render in worker processes while the statistics are computed
+        renderer = None
+        if charts:
+            renderer = ChartRenderer(self.analysis_dir)
+            report['charts'] = self.create_price_charts(symbols, start_date, end_date, renderer, block=False)
+        
+        # Individual symbol analysis (one batch over all symbols)
+        batch = self.get_batch_statistics(symbols, start_date, end_date)
         for symbol in symbols:
-            stats, _ = self.get_symbol_statistics(symbol, start_date, end_date)
-            report['individual_analysis'][symbol] = stats
+            report['individual_analysis'][symbol] = (nested_statistics(symbol, batch.loc[symbol])
+                                                     if symbol in batch.index else {})
         
         # Portfolio analysis if multiple symbols
         if len(symbols) > 1:
-            portfolio_stats = self.create_portfolio_analysis(symbols, start_date=start_date, end_date=end_date)
+            portfolio_stats = self.create_portfolio_analysis(symbols, start_date=start_date, end_date=end_date,
+                                                             show=show)
             report['portfolio_analysis'] = portfolio_stats
         
+        if renderer is not None:
+            renderer.close()
+        
         # Save report
         filepath = os.path.join(self.analysis_dir, filename)
         with open(filepath, 'w') as f:
@@ -3,7 +3,6 @@
 
 import os
 import sys
-import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
@@ -43,9 +42,10 @@ class DataWorkflow:
         logging.info("DataWorkflow initialized")
     
     def run_complete_workflow(self, symbols, start_date=None, end_date=None, 
-                            export_formats=['csv', 'json'], create_analysis=True):
+                            export_formats=['csv', 'json'], create_analysis=True, incremental=False):
         """
         Run complete data workflow: management -> export -> analysis
+        With incremental=True, csv/backtest exports only write bars changed since the last run
         """
         print("🚀 COMPLETE DATA WORKFLOW PIPELINE")
         print("=" * 60)
@@ -53,6 +53,7 @@ class DataWorkflow:
         print(f"Date Range: {start_date or 'All'} to {end_date or 'All'}")
         print(f"Export Formats: {', '.join(export_formats)}")
         print(f"Create Analysis: {create_analysis}")
+        print(f"Incremental Export: {incremental}")
         print()
         
         workflow_results = {
@@ -98,7 +99,20 @@ class DataWorkflow:
         
         for export_format in export_formats:
             try:
-                if export_format == 'csv':
+                if incremental and export_format in ('csv', 'backtest'):
+                    # Incremental files mirror each symbol's full stored history, so a date window can't apply
+                    if start_date or end_date:
+                        logging.warning(f"Incremental {export_format} export ignores the date range "
+                                        f"({start_date or 'All'} to {end_date or 'All'}) and covers all stored bars")
+                    success = self.data_exporter.export_incremental(
+                        symbols=available_symbols,
+                        formats=['csv'] if export_format == 'csv' else ['csv', 'parquet']
+                    )
+                    if success:
+                        exports_created.append(f'{export_format}_incremental')
+                        print(f"✅ Incremental {export_format} export completed (new/changed bars only)")
+                
+                elif export_format == 'csv':
                     success = self.data_exporter.export_to_csv(
                         symbols=available_symbols,
                         start_date=start_date,
@@ -251,14 +265,12 @@ class DataWorkflow:
         
         for symbol in symbols:
             print(f"\n📊 Checking {symbol}...")
-            data = self.data_manager.get_data_from_database(symbols=symbol)
+            data = self.data_manager.get_data_from_database(symbols=symbol, typed_timestamps=True)
             
             if data.empty:
                 print(f"  ❌ No data available")
                 continue
             
-            # Convert timestamp
-            data['timestamp'] = pd.to_datetime(data['timestamp'])
             data = data.sort_values('timestamp')
             
             # Check for missing values
@@ -329,6 +341,8 @@ def main():
                        choices=['csv', 'json', 'backtest'], help='Export formats')
     parser.add_argument('--no-analysis', action='store_true', 
                        help='Skip data analysis step')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only export bars new or changed since the last run (csv/backtest)')
     parser.add_argument('--overview', action='store_true', 
                        help='Show quick data overview only')
     parser.add_argument('--quality-check', action='store_true', 
@@ -348,7 +362,8 @@ def main():
             start_date=args.start_date,
             end_date=args.end_date,
             export_formats=args.export_formats,
-            create_analysis=not args.no_analysis
+            create_analysis=not args.no_analysis,
+            incremental=args.incremental
         )
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+# Step 7: Persistent Indicator Cache
+# On-disk indicator arrays keyed by symbol, timeframe, indicator, parameters and data watermark
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from timestamps import read_bars, epoch_ns_to_datetime
+from corporate_actions import actions_version
+from indicators import rolling_mean, rolling_std, zscore, rsi, atr, pct_returns, rolling_volatility
+
+DEFAULT_DB_PATH = os.path.join(STEP5_DIR, 'market_data.db')
+DEFAULT_CACHE_DIR = os.path.join(CURRENT_DIR, 'indicator_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# name -> (input columns, compute(bars, **params) -> {output: array}, bars of history each value needs)
+INDICATORS = {
+    'sma': (('close',),
+            lambda bars, window: {'sma': rolling_mean(bars['close'], window)},
+            lambda window: window),
+    'mean_std': (('close',),
+                 lambda bars, window: {'mean': rolling_mean(bars['close'], window),
+                                       'std': rolling_std(bars['close'], window)},
+                 lambda window: window),
+    'zscore': (('close',),
+               lambda bars, window: {'zscore': zscore(bars['close'], window)},
+               lambda window: window),
+    'rsi': (('close',),
+            lambda bars, period: {'rsi': rsi(bars['close'], period)},
+            lambda period: period),
+    'atr': (('high', 'low', 'close'),
+            lambda bars, period: {'atr': atr(bars['high'], bars['low'], bars['close'], period)},
+            lambda period: period),
+    'volatility': (('close',),
+                   lambda bars, window: {'volatility': rolling_volatility(pct_returns(bars['close']), window)},
+                   lambda window: window),
+}
+
+INDEX_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS indicator_index (
+        cache_key TEXT PRIMARY KEY,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        indicator TEXT NOT NULL,
+        params TEXT NOT NULL,
+        outputs TEXT NOT NULL,
+        file TEXT NOT NULL,
+        last_ts_ns INTEGER,
+        row_count INTEGER,
+        ingested_through TEXT,
+        actions_version TEXT,
+        size_bytes INTEGER,
+        last_access REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+class IndicatorCache:
+    """
+    Memoizes indicator series per symbol on disk. An entry stays valid while the bars it was
+    computed from are unchanged (same count and ingestion watermark up to its last bar, no new
+    corporate actions); new bars only extend the entry by computing the newest values.
+    Least recently used entries are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, db_path=None, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.db = get_connection_manager(db_path or DEFAULT_DB_PATH)
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.index = get_connection_manager(os.path.join(self.cache_dir, 'index.db'))
+        with self.index.writer() as conn:
+            conn.execute(INDEX_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_indicator_last_access ON indicator_index(last_access)')
+
+        self.stats = {'hits': 0, 'extended': 0, 'computed': 0, 'evicted': 0}
+
+    def _key(self, symbol, timeframe, indicator, params_json):
+        raw = f"{symbol}|{timeframe}|{indicator}|{params_json}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _load_entry(self, path):
+        with np.load(path) as stored:
+            return stored['ts_ns'], stored['values']
+
+    def _write_entry(self, path, ts_ns, values):
+        # Write then rename so readers never see a half-written file
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, ts_ns=ts_ns, values=values)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    def _compute(self, conn, symbol, timeframe, indicator, params, start_ns=None):
+        """Read bars (from start_ns onwards) and evaluate the indicator on them"""
+        columns, compute, _ = INDICATORS[indicator]
+        start = epoch_ns_to_datetime([start_ns])[0] if start_ns is not None else None
+        bars = read_bars(conn, symbols=symbol, start_date=start, timeframe=timeframe, columns=columns)
+        ts_ns = bars['timestamp'].array.asi8 if not bars.empty else np.empty(0, dtype='int64')
+        outputs = compute({col: bars[col].to_numpy(dtype='float64') for col in columns}, **params)
+        names = sorted(outputs)
+        values = np.column_stack([np.asarray(outputs[name], dtype='float64') for name in names]) \
+            if len(ts_ns) else np.empty((0, len(names)))
+        return ts_ns, values, names
+
+    def _coverage(self, conn, symbol, timeframe, last_ts_ns):
+        """Bar count and newest ingestion time up to last_ts_ns (the entry's data watermark)"""
+        return conn.execute('''
+            SELECT COUNT(*), MAX(created_at) FROM market_data
+            WHERE symbol = ? AND timeframe = ? AND ts_ns <= ?
+        ''', (symbol, timeframe, int(last_ts_ns))).fetchone()
+
+    def get(self, symbol, indicator, params=None, timeframe='Day') -> pd.DataFrame:
+        """Return the indicator's outputs as a DataFrame indexed by bar timestamp (UTC)"""
+        if indicator not in INDICATORS:
+            raise ValueError(f"Unknown indicator '{indicator}'. Choose from: {', '.join(INDICATORS)}")
+        params = {name: (value.item() if hasattr(value, 'item') else value)
+                  for name, value in (params or {}).items()}
+        params_json = json.dumps(params, sort_keys=True)
+        key = self._key(symbol, timeframe, indicator, params_json)
+        path = os.path.join(self.cache_dir, f"{key}.npz")
+
+        with self.index.reader() as conn:
+            entry = conn.execute('''
+                SELECT outputs, last_ts_ns, row_count, ingested_through, actions_version
+                FROM indicator_index WHERE cache_key = ?
+            ''', (key,)).fetchone()
+
+        with self.db.reader() as conn:
+            version = actions_version(conn, symbol).get(symbol)
+            action = 'computed'
+            ts_ns = values = None
+
+            if entry is not None and entry[1] is not None and entry[4] == version and os.path.exists(path):
+                count, ingested = self._coverage(conn, symbol, timeframe, entry[1])
+                if count == entry[2] and (ingested or '') <= (entry[3] or ''):
+                    ts_ns, values = self._load_entry(path)
+                    names = json.loads(entry[0])
+                    action = 'hits'
+
+                    newest = conn.execute(
+                        'SELECT MAX(ts_ns) FROM market_data WHERE symbol = ? AND timeframe = ?',
+                        (symbol, timeframe)).fetchone()[0]
+                    if newest is not None and newest > entry[1]:
+                        # Recompute only the new bars plus the history they depend on
+                        lookback = INDICATORS[indicator][2](**params)
+                        start_row = conn.execute('''
+                            SELECT ts_ns FROM market_data WHERE symbol = ? AND timeframe = ? AND ts_ns <= ?
+                            ORDER BY ts_ns DESC LIMIT 1 OFFSET ?
+                        ''', (symbol, timeframe, int(entry[1]), max(lookback - 1, 0))).fetchone()
+                        start_ns = start_row[0] if start_row else None
+                        tail_ts, tail_values, names = self._compute(conn, symbol, timeframe, indicator,
+                                                                    params, start_ns)
+                        new = tail_ts > entry[1]
+                        ts_ns = np.concatenate([ts_ns, tail_ts[new]])
+                        values = np.vstack([values, tail_values[new]])
+                        action = 'extended'
+
+            if action == 'computed':
+                ts_ns, values, names = self._compute(conn, symbol, timeframe, indicator, params)
+
+            last_ts_ns = int(ts_ns[-1]) if len(ts_ns) else None
+            count, ingested = self._coverage(conn, symbol, timeframe, last_ts_ns) \
+                if last_ts_ns is not None else (0, None)
+
+        self.stats[action] += 1
+        now = time.time()
+        if action == 'hits':
+            with self.index.writer() as conn:
+                conn.execute('UPDATE indicator_index SET last_access = ? WHERE cache_key = ?', (now, key))
+        else:
+            size = self._write_entry(path, ts_ns, values)
+            with self.index.writer() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO indicator_index
+                    (cache_key, symbol, timeframe, indicator, params, outputs, file, last_ts_ns,
+                     row_count, ingested_through, actions_version, size_bytes, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (key, symbol, timeframe, indicator, params_json, json.dumps(names),
+                      os.path.basename(path), last_ts_ns, count, ingested, version, size, now))
+            self._evict()
+
+        return pd.DataFrame(values, index=epoch_ns_to_datetime(ts_ns), columns=names)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self.index.writer() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM indicator_index').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, file, size in conn.execute(
+                    'SELECT cache_key, file, size_bytes FROM indicator_index ORDER BY last_access').fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, file))
+                except FileNotFoundError:
+                    pass
+                conn.execute('DELETE FROM indicator_index WHERE cache_key = ?', (key,))
+                total -= size or 0
+                self.stats['evicted'] += 1
+        logging.info(f"Indicator cache evicted down to {total / 1e6:.1f} MB")
+
+    def invalidate(self, symbol=None):
+        """Remove cached entries (for one symbol, or everything)"""
+        with self.index.writer() as conn:
+            query = 'SELECT cache_key, file FROM indicator_index'
+            params = ()
+            if symbol is not None:
+                query += ' WHERE symbol = ?'
+                params = (symbol,)
+            for key, file in conn.execute(query, params).fetchall():
+                try:
+                    os.remove(os.path.join(self.cache_dir, file))
+                except FileNotFoundError:
+                    pass
+                conn.execute('DELETE FROM indicator_index WHERE cache_key = ?', (key,))
+
+    def summary(self) -> dict:
+        """Entry count, disk usage and this session's hit/extend/compute counters"""
+        with self.index.reader() as conn:
+            entries, size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM indicator_index').fetchone()
+        return {'entries': entries, 'size_mb': size / 1e6, **self.stats}
@@ -0,0 +1,282 @@
+# Step 7: Shared Vectorized Indicators
+# NumPy kernels over (time x symbol) arrays; one cumulative-sum pass serves every window
+
+import time
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+def _as_2d(values):
+    """Return (float64 2-D array, original object) so results can be re-wrapped"""
+    array = np.asarray(values, dtype='float64')
+    if array.ndim == 1:
+        array = array[:, None]
+    return array, values
+
+
+def _wrap(result, like):
+    """Give a result the shape and pandas labels of the input it was computed from"""
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(result, index=like.index, columns=like.columns)
+    if isinstance(like, pd.Series):
+        return pd.Series(result[:, 0], index=like.index, name=like.name)
+    if np.ndim(like) == 1:
+        return result[:, 0]
+    return result
+
+
+def _windows(windows):
+    """Normalize an int or iterable of window lengths to a tuple"""
+    if np.isscalar(windows):
+        return (int(windows),), True
+    return tuple(int(w) for w in windows), False
+
+
+def _cumulative(array):
+    """Zero-prefixed cumulative sums of finite values, their squares and finite counts"""
+    finite = np.isfinite(array)
+    # Centering each column keeps the sum-of-squares variance numerically stable for prices
+    with np.errstate(invalid='ignore'):
+        center = np.nanmean(np.where(finite, array, np.nan), axis=0)
+    center = np.nan_to_num(center)
+    filled = np.where(finite, array - center, 0.0)
+
+    rows, cols = array.shape
+    sums = np.zeros((rows + 1, cols))
+    squares = np.zeros((rows + 1, cols))
+    counts = np.zeros((rows + 1, cols), dtype='int64')
+    np.cumsum(filled, axis=0, out=sums[1:])
+    np.cumsum(filled * filled, axis=0, out=squares[1:])
+    np.cumsum(finite, axis=0, out=counts[1:])
+    return center, sums, squares, counts
+
+
+def _window_moments(array, window, cumulative, need_var):
+    """Rolling mean (and sample variance) for one window; NaN unless the window is full"""
+    center, sums, squares, counts = cumulative
+    rows, cols = array.shape
+    mean = np.full((rows, cols), np.nan)
+    var = np.full((rows, cols), np.nan) if need_var else None
+    if window > rows:
+        return mean, var
+
+    full = (counts[window:] - counts[:-window]) == window
+    total = sums[window:] - sums[:-window]
+    mean[window - 1:] = np.where(full, total / window + center, np.nan)
+    if need_var and window > 1:
+        sq = squares[window:] - squares[:-window]
+        with np.errstate(invalid='ignore'):
+            v = np.maximum(sq - total * total / window, 0.0) / (window - 1)
+        var[window - 1:] = np.where(full, v, np.nan)
+    return mean, var
+
+
+def rolling_mean(values, windows):
+    """
+    Simple moving average over axis 0 (matches Series.rolling(w).mean()).
+    Returns one result for an int window, or {window: result} for several.
+    """
+    array, like = _as_2d(values)
+    windows, single = _windows(windows)
+    cumulative = _cumulative(array)
+    out = {w: _wrap(_window_moments(array, w, cumulative, False)[0], like) for w in windows}
+    return out[windows[0]] if single else out
+
+
+def rolling_std(values, windows, ddof=1):
+    """Rolling sample standard deviation (matches Series.rolling(w).std())"""
+    array, like = _as_2d(values)
+    windows, single = _windows(windows)
+    cumulative = _cumulative(array)
+    out = {}
+    for w in windows:
+        _, var = _window_moments(array, w, cumulative, True)
+        if ddof != 1 and w > ddof:
+            var = var * (w - 1) / (w - ddof)
+        out[w] = _wrap(np.sqrt(var), like)
+    return out[windows[0]] if single else out
+
+
+def bollinger_bands(close, windows, num_std=2.0):
+    """
+    Middle/upper/lower bands per window as {'middle', 'upper', 'lower'} dicts
+    (a single dict when windows is an int)
+    """
+    array, like = _as_2d(close)
+    windows, single = _windows(windows)
+    cumulative = _cumulative(array)
+    out = {}
+    for w in windows:
+        mean, var = _window_moments(array, w, cumulative, True)
+        width = np.sqrt(var) * num_std
+        out[w] = {
+            'middle': _wrap(mean, like),
+            'upper': _wrap(mean + width, like),
+            'lower': _wrap(mean - width, like),
+        }
+    return out[windows[0]] if single else out
+
+
+def zscore(values, windows):
+    """Distance from the rolling mean in rolling standard deviations"""
+    array, like = _as_2d(values)
+    windows, single = _windows(windows)
+    cumulative = _cumulative(array)
+    out = {}
+    for w in windows:
+        mean, var = _window_moments(array, w, cumulative, True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[w] = _wrap((array - mean) / np.sqrt(var), like)
+    return out[windows[0]] if single else out
+
+
+def rsi(close, periods=14):
+    """
+    Simple-average RSI as used across the strategies: rolling means of gains and losses.
+    The first diff counts as a zero move, matching delta.where(delta > 0, 0).
+    """
+    array, like = _as_2d(close)
+    periods, single = _windows(periods)
+    delta = np.full_like(array, np.nan)
+    delta[1:] = array[1:] - array[:-1]
+    with np.errstate(invalid='ignore'):
+        gain = np.where(delta > 0, delta, 0.0)
+        loss = np.where(delta < 0, -delta, 0.0)
+
+    gain_cum, loss_cum = _cumulative(gain), _cumulative(loss)
+    out = {}
+    for p in periods:
+        avg_gain = _window_moments(gain, p, gain_cum, False)[0]
+        avg_loss = _window_moments(loss, p, loss_cum, False)[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[p] = _wrap(100 - 100 / (1 + avg_gain / avg_loss), like)
+    return out[periods[0]] if single else out
+
+
+def true_range(high, low, close):
+    """Largest of high-low and the gaps to the previous close (first bar uses high-low)"""
+    high, like = _as_2d(high)
+    low, _ = _as_2d(low)
+    close, _ = _as_2d(close)
+    prev_close = np.full_like(close, np.nan)
+    prev_close[1:] = close[:-1]
+    ranges = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return ranges, like
+
+
+def atr(high, low, close, periods=14):
+    """Average True Range as a simple rolling mean of the true range"""
+    ranges, like = true_range(high, low, close)
+    periods, single = _windows(periods)
+    cumulative = _cumulative(ranges)
+    out = {p: _wrap(_window_moments(ranges, p, cumulative, False)[0], like) for p in periods}
+    return out[periods[0]] if single else out
+
+
+def pct_returns(close):
+    """Simple returns with a leading NaN (matches DataFrame.pct_change())"""
+    array, like = _as_2d(close)
+    out = np.full_like(array, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[1:] = array[1:] / array[:-1] - 1
+    return _wrap(out, like)
+
+
+def rolling_compound_return(returns, windows):
+    """
+    Compounded return over each trailing window, (1 + r).prod() - 1, from one cumulative
+    log-return pass (matches rolling(w).apply(lambda x: (1 + x).prod() - 1))
+    """
+    array, like = _as_2d(returns)
+    windows, single = _windows(windows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_growth = np.log1p(array)
+    cumulative = _cumulative(log_growth)
+    out = {}
+    for w in windows:
+        mean = _window_moments(log_growth, w, cumulative, False)[0]
+        out[w] = _wrap(np.expm1(mean * w), like)
+    return out[windows[0]] if single else out
+
+
+def rolling_volatility(returns, windows, periods_per_year=TRADING_DAYS):
+    """Annualized rolling standard deviation of returns"""
+    result = rolling_std(returns, windows)
+    scale = np.sqrt(periods_per_year)
+    if isinstance(result, dict):
+        return {w: r * scale for w, r in result.items()}
+    return result * scale
+
+
+def _reference_indicators(close, high, low, window):
+    """Per-series pandas implementations the kernels replace (used by the self-check)"""
+    out = {}
+    for symbol in close.columns:
+        prices = close[symbol]
+        delta = prices.diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+        ranges = pd.concat([high[symbol] - low[symbol],
+                            np.abs(high[symbol] - prices.shift()),
+                            np.abs(low[symbol] - prices.shift())], axis=1).max(axis=1)
+        out[symbol] = {
+            'sma': prices.rolling(window).mean(),
+            'std': prices.rolling(window).std(),
+            'rsi': 100 - (100 / (1 + gain / loss)),
+            'atr': ranges.rolling(14).mean(),
+            'vol': prices.pct_change().rolling(30).std() * np.sqrt(TRADING_DAYS),
+            'mom': prices.pct_change().rolling(60).apply(lambda x: (1 + x).prod() - 1, raw=True),
+        }
+    return out
+
+
+def main():
+    """Parity check against the per-series pandas code and a timing comparison"""
+    rng = np.random.default_rng(7)
+    n_days, n_symbols = 2000, 100
+    close = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_days, n_symbols)), axis=0)),
+                         columns=[f'S{i:03d}' for i in range(n_symbols)])
+    close.iloc[50:55, 3] = np.nan  # gaps must propagate like pandas
+    spread = np.abs(rng.normal(0, 0.5, close.shape))
+    high, low = close + spread, close - spread
+
+    start = time.perf_counter()
+    reference = _reference_indicators(close, high, low, 20)
+    pandas_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kernels = {
+        'sma': rolling_mean(close, 20),
+        'std': rolling_std(close, 20),
+        'rsi': rsi(close, 14),
+        'atr': atr(high, low, close, 14),
+        'vol': rolling_volatility(pct_returns(close), 30),
+        'mom': rolling_compound_return(pct_returns(close), 60),
+    }
+    numpy_seconds = time.perf_counter() - start
+
+    print("Parity vs per-series pandas (max abs difference):")
+    ok = True
+    for name, result in kernels.items():
+        expected = pd.DataFrame({symbol: reference[symbol][name] for symbol in close.columns})
+        same_nan = (expected.isna().to_numpy() == result.isna().to_numpy()).all()
+        diff = np.nanmax(np.abs(expected.to_numpy() - result.to_numpy()))
+        ok &= bool(same_nan and diff < 1e-6)
+        print(f"   {name:4}: {diff:.2e}  NaN pattern {'matches' if same_nan else 'DIFFERS'}")
+
+    start = time.perf_counter()
+    rolling_mean(close, range(5, 205, 5))
+    sweep_seconds = time.perf_counter() - start
+
+    print(f"\n{n_symbols} symbols x {n_days} days:")
+    print(f"   pandas per series: {pandas_seconds:.3f}s")
+    print(f"   numpy kernels:     {numpy_seconds:.3f}s")
+    print(f"   40-window SMA sweep in one pass: {sweep_seconds:.3f}s")
+    print(f"\n{'✅ All indicators match' if ok else '❌ Parity check failed'}")
+    return ok
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
 
 from trading_strategy import BollingerBandMeanReversionStrategy
+from indicator_cache import IndicatorCache
 
 # Setup logging
 logging.basicConfig(
@@ -57,7 +58,7 @@ class LiveTrader:
             logging.warning(f"Not enough data to generate a signal for {symbol}")
             return 0
 
-        bbands = self.strategy.calculate_bollinger_bands(live_data['close'])
+        bbands = self.strategy.bollinger_bands_for(symbol, live_data['close'])
         live_data = live_data.join(bbands)
 
         latest = live_data.iloc[-1]
@@ -129,8 +130,8 @@ if __name__ == "__main__":
     # --- Configuration ---
     SYMBOLS_TO_TRADE = ['SPY', 'QQQ', 'AAPL', 'MSFT'] # Example symbols
     
-    # Initialize the strategy
-    strategy = BollingerBandMeanReversionStrategy()
+    # Initialize the strategy; cached bands only compute the newest bars each cycle
+    strategy = BollingerBandMeanReversionStrategy(indicator_cache=IndicatorCache())
 
     # Initialize and run the live trader
     live_trader = LiveTrader(symbols=SYMBOLS_TO_TRADE, trading_strategy=strategy)
@@ -0,0 +1,176 @@
+# Step 7: Multi-Asset Portfolio Strategy
+# RSI + mean reversion across the top-ranked assets, backtested on precomputed signal panels
+
+import os
+import sys
+import logging
+import pandas as pd
+from datetime import datetime
+from typing import Dict
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from portfolio_backtest import load_close_panel, rsi_zscore_signals, run_signal_backtest, performance_metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+class MultiAssetPortfolioStrategy:
+    """
+    Multi-asset implementation of the RSI + mean reversion strategy.
+    Prices are loaded once, RSI/z-score signals are computed for every symbol and day up front,
+    and the daily portfolio loop only touches the days and symbols that have a signal.
+    """
+
+    def __init__(self,
+                 initial_capital: float = 1_000_000,
+                 max_positions: int = 8,
+                 position_size_pct: float = 0.10,
+                 db_path: str = None):
+
+        self.initial_capital = initial_capital
+        self.current_capital = initial_capital
+        self.max_positions = max_positions
+        self.position_size_pct = position_size_pct
+        self.db_path = db_path or os.path.join(STEP5_DIR, 'market_data.db')
+        self.db = get_connection_manager(self.db_path)
+
+        self.strategy_parameters = {
+            'rsi_period': 14,
+            'rsi_oversold': 30,
+            'rsi_overbought': 70,
+            'z_window': 20,
+            'z_threshold': 2.0,
+            'min_history': 50,
+        }
+
+        # Portfolio tracking
+        self.positions = {}  # symbol -> shares
+        self.portfolio_history = []
+        self.trade_log = []
+
+        # Top assets from screening
+        self.top_assets = ['XLI', 'EFA', 'VWO', 'XLK', 'EEM', 'DIA', 'VEA', 'VTI']
+
+        logging.info("Multi-Asset Portfolio Strategy initialized")
+        logging.info(f"Capital: ${initial_capital:,.0f}, Max Positions: {max_positions}")
+        logging.info(f"Position Size: {position_size_pct:.1%}, Top Assets: {len(self.top_assets)}")
+
+    def build_signal_panel(self, start_date: str, end_date: str):
+        """Load all assets once and precompute signals for the whole period"""
+        params = self.strategy_parameters
+        with self.db.reader() as conn:
+            close_df = load_close_panel(conn, self.top_assets, start_date, end_date)
+        if close_df.empty:
+            return None
+
+        panel = rsi_zscore_signals(close_df, rsi_period=params['rsi_period'], z_window=params['z_window'],
+                                   oversold=params['rsi_oversold'], overbought=params['rsi_overbought'],
+                                   z_threshold=params['z_threshold'], min_history=params['min_history'])
+        return panel.slice(start_date, end_date)
+
+    def run_backtest(self, start_date: str = '2023-01-01', end_date: str = '2025-08-01') -> Dict:
+        """Run multi-asset portfolio backtest"""
+        logging.info(f"Starting multi-asset backtest from {start_date} to {end_date}")
+
+        panel = self.build_signal_panel(start_date, end_date)
+        if panel is None or len(panel.dates) == 0:
+            logging.error("No price data available for the backtest period")
+            return {}
+
+        history, trades, shares = run_signal_backtest(
+            panel, initial_capital=self.initial_capital, max_positions=self.max_positions,
+            position_size_pct=self.position_size_pct
+        )
+
+        self.current_capital = history['cash'].iloc[-1]
+        self.positions = {symbol: int(n) for symbol, n in zip(panel.symbols, shares) if n}
+        self.portfolio_history = history.reset_index().to_dict('records')
+        self.trade_log = trades.to_dict('records')
+
+        performance = performance_metrics(history, self.initial_capital, trades)
+
+        logging.info(f"Backtest complete. Final value: ${performance['final_value']:,.0f}")
+        logging.info(f"Total return: {performance['total_return']:.1%}")
+        logging.info(f"Total trades: {len(self.trade_log)}")
+
+        return performance
+
+    def create_performance_report(self, performance: Dict):
+        """Create comprehensive performance report"""
+        print("=" * 80)
+        print("MULTI-ASSET PORTFOLIO STRATEGY PERFORMANCE REPORT")
+        print("=" * 80)
+
+        print("\n💰 PORTFOLIO PERFORMANCE")
+        print(f"   Initial Capital: ${performance['initial_value']:,.0f}")
+        print(f"   Final Value: ${performance['final_value']:,.0f}")
+        print(f"   Total Return: {performance['total_return']:+.1%}")
+        print(f"   Annualized Return: {performance['annualized_return']:+.1%}")
+
+        print("\n📊 RISK METRICS")
+        print(f"   Volatility: {performance['volatility']:.1%}")
+        print(f"   Sharpe Ratio: {performance['sharpe_ratio']:.2f}")
+        print(f"   Maximum Drawdown: {performance['max_drawdown']:.1%}")
+
+        print("\n🔄 TRADING ACTIVITY")
+        print(f"   Total Trades: {performance['total_trades']}")
+        print(f"   Buy Trades: {performance['buy_trades']}")
+        print(f"   Sell Trades: {performance['sell_trades']}")
+
+        print("\n📈 POSITION MANAGEMENT")
+        print(f"   Average Positions: {performance['avg_positions']:.1f}")
+        print(f"   Maximum Positions: {performance['max_positions']}")
+        print(f"   Final Positions: {performance['final_positions']}")
+        print(f"   Final Cash %: {performance['final_cash_pct']:.1%}")
+
+        if self.trade_log:
+            trades_df = pd.DataFrame(self.trade_log)
+            symbol_performance = trades_df.groupby('symbol').agg({
+                'action': 'count',
+                'value': 'sum'
+            }).rename(columns={'action': 'trades', 'value': 'total_volume'})
+            symbol_performance = symbol_performance.sort_values('total_volume', ascending=False)
+
+            print("\n🏆 TOP TRADING ASSETS")
+            for symbol, row in symbol_performance.head(8).iterrows():
+                print(f"   {symbol}: {row['trades']} trades, ${row['total_volume']:,.0f} volume")
+
+
+def main():
+    """Run multi-asset portfolio strategy"""
+    print("🚀 Multi-Asset Portfolio Strategy - RSI + Mean Reversion")
+    print("=" * 70)
+
+    portfolio_strategy = MultiAssetPortfolioStrategy(
+        initial_capital=1_000_000,
+        max_positions=8,
+        position_size_pct=0.12  # 12% per position
+    )
+
+    performance = portfolio_strategy.run_backtest(start_date='2023-01-01', end_date='2025-08-01')
+    if not performance:
+        return
+
+    portfolio_strategy.create_performance_report(performance)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if portfolio_strategy.trade_log:
+        trades_filename = f'multi_asset_trades_{timestamp}.csv'
+        pd.DataFrame(portfolio_strategy.trade_log).to_csv(trades_filename, index=False)
+        print(f"\n💾 Trade log saved as: {trades_filename}")
+
+    if portfolio_strategy.portfolio_history:
+        portfolio_filename = f'multi_asset_portfolio_{timestamp}.csv'
+        pd.DataFrame(portfolio_strategy.portfolio_history).to_csv(portfolio_filename, index=False)
+        print(f"💾 Portfolio history saved as: {portfolio_filename}")
+
+    print("\n✅ Multi-asset strategy analysis complete!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+# Step 7: Parameter Search Strategies
+# Grid, random, successive halving and surrogate-model search behind one budget / early-stopping interface
+
+import os
+import sys
+import time
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from portfolio_backtest import SignalPanel, bollinger_signals, run_portfolio_backtest, performance_metrics
+
+
+class Integer:
+    """Integer parameter in [low, high] on a step grid"""
+
+    def __init__(self, low, high, step=1):
+        self.values = np.arange(low, high + 1, step)
+
+    def sample(self, rng, n):
+        return rng.choice(self.values, n)
+
+    def to_unit(self, value):
+        span = self.values[-1] - self.values[0]
+        return (value - self.values[0]) / span if span else 0.0
+
+
+class Real:
+    """Continuous parameter in [low, high], optionally snapped to a step"""
+
+    def __init__(self, low, high, step=None):
+        self.low, self.high, self.step = low, high, step
+        self.values = np.arange(low, high + step / 2, step) if step else None
+
+    def sample(self, rng, n):
+        if self.values is not None:
+            return rng.choice(self.values, n)
+        return rng.uniform(self.low, self.high, n)
+
+    def to_unit(self, value):
+        return (value - self.low) / (self.high - self.low) if self.high > self.low else 0.0
+
+
+class Choice:
+    """Categorical parameter (None allowed, e.g. 'never rebalance')"""
+
+    def __init__(self, options):
+        self.values = list(options)
+
+    def sample(self, rng, n):
+        return [self.values[i] for i in rng.integers(len(self.values), size=n)]
+
+    def to_unit(self, value):
+        return self.values.index(value) / max(len(self.values) - 1, 1)
+
+
+class SearchSpace:
+    """Named parameter dimensions; samples and encodes parameter dicts"""
+
+    def __init__(self, **dimensions):
+        self.dimensions = dict(sorted(dimensions.items()))
+
+    def sample(self, rng, n):
+        columns = {name: dim.sample(rng, n) for name, dim in self.dimensions.items()}
+        return [{name: _plain(columns[name][i]) for name in self.dimensions} for i in range(n)]
+
+    def grid(self):
+        """Every combination (only for spaces where every dimension has discrete values)"""
+        names = list(self.dimensions)
+        return [dict(zip(names, map(_plain, values)))
+                for values in itertools.product(*(self.dimensions[name].values for name in names))]
+
+    def size(self):
+        values = [getattr(dim, 'values', None) for dim in self.dimensions.values()]
+        return int(np.prod([len(v) for v in values])) if all(v is not None for v in values) else None
+
+    def encode(self, params_list):
+        """Parameters scaled to [0, 1] per dimension (surrogate model inputs)"""
+        return np.array([[dim.to_unit(params[name]) for name, dim in self.dimensions.items()]
+                         for params in params_list], dtype='float64')
+
+
+def _plain(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+class SearchStrategy:
+    """
+    Base class: a search spends `budget` units of backtesting, where one full-data backtest
+    costs 1.0 and a backtest on a fraction of the data costs that fraction. The search stops
+    early once the best score has not improved by min_delta for `patience` full-fidelity
+    evaluations (or after max_seconds).
+    """
+
+    name = 'base'
+
+    def __init__(self, space: SearchSpace, budget=100, patience=None, min_delta=0.0, max_seconds=None, seed=0):
+        self.space = space
+        self.budget = budget
+        self.patience = patience
+        self.min_delta = min_delta
+        self.max_seconds = max_seconds
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, objective) -> dict:
+        """
+        Search with objective(params, fidelity) -> score (higher is better, NaN for failures).
+        Returns the best parameters, their score and the full trial log.
+        """
+        self.objective = objective
+        self.trials = []
+        self.spent = 0.0
+        self.best = (-np.inf, None)
+        self._stale = 0
+        self._started = time.perf_counter()
+        self.search()
+
+        trials = pd.DataFrame(self.trials)
+        logging.info(f"{self.name} search: {len(trials)} backtests, {self.spent:.1f} budget units, "
+                     f"best score {self.best[0]:.3f}")
+        return {
+            'best_params': self.best[1],
+            'best_score': self.best[0],
+            'trials': trials,
+            'evaluations': len(trials),
+            'budget_used': self.spent,
+            'strategy': self.name,
+        }
+
+    def search(self):
+        raise NotImplementedError
+
+    def exhausted(self, next_cost=1.0) -> bool:
+        """True once the next evaluation would exceed the budget or early stopping triggered"""
+        if self.spent + next_cost > self.budget + 1e-9:
+            return True
+        if self.patience is not None and self._stale >= self.patience:
+            return True
+        return self.max_seconds is not None and time.perf_counter() - self._started > self.max_seconds
+
+    def evaluate(self, params, fidelity=1.0):
+        """Run one backtest, charge the budget and update the best full-fidelity result"""
+        score = self.objective(params, fidelity)
+        score = float(score) if score is not None and np.isfinite(score) else np.nan
+        self.spent += fidelity
+        self.trials.append({**params, 'fidelity': fidelity, 'score': score})
+
+        if fidelity >= 1.0:
+            if np.isfinite(score) and score > self.best[0] + self.min_delta:
+                self.best = (score, params)
+                self._stale = 0
+            else:
+                if np.isfinite(score) and score > self.best[0]:
+                    self.best = (score, params)
+                self._stale += 1
+        return score
+
+
+class GridSearch(SearchStrategy):
+    """Exhaustive grid (the original optimizer behaviour), truncated by the budget"""
+
+    name = 'grid'
+
+    def search(self):
+        for params in self.space.grid():
+            if self.exhausted():
+                break
+            self.evaluate(params)
+
+
+class RandomSearch(SearchStrategy):
+    """Uniform random samples of the space, without repeats"""
+
+    name = 'random'
+
+    def search(self):
+        seen = set()
+        attempts = 0
+        while not self.exhausted() and attempts < 100 * self.budget:
+            params = self.space.sample(self.rng, 1)[0]
+            attempts += 1
+            key = tuple(params.values())
+            if key in seen:
+                continue
+            seen.add(key)
+            self.evaluate(params)
+
+
+class SuccessiveHalving(SearchStrategy):
+    """
+    Start many random configurations on a small slice of the data, keep the best 1/eta at each
+    rung and grow the slice by eta until the survivors run on the full data. The number of
+    starting configurations is the largest that fits the budget.
+    """
+
+    name = 'halving'
+
+    def __init__(self, space, budget=100, eta=3, min_fidelity=1 / 9, **kwargs):
+        super().__init__(space, budget, **kwargs)
+        self.eta = eta
+        self.min_fidelity = min_fidelity
+
+    def _rungs(self):
+        rungs = []
+        fidelity = self.min_fidelity
+        while fidelity < 1.0 - 1e-9:
+            rungs.append(fidelity)
+            fidelity *= self.eta
+        return rungs + [1.0]
+
+    def _cost(self, n_configs, rungs):
+        cost, n = 0.0, n_configs
+        for fidelity in rungs:
+            cost += n * fidelity
+            n = max(1, n // self.eta)
+        return cost
+
+    def search(self):
+        rungs = self._rungs()
+        n_configs = 1
+        while self._cost(n_configs + 1, rungs) <= self.budget:
+            n_configs += 1
+        size = self.space.size()
+        if size is not None:
+            n_configs = min(n_configs, size)
+
+        # Distinct starting configurations, so no duplicate is paid for or takes a survivor slot
+        configs, seen = [], set()
+        attempts = 0
+        while len(configs) < n_configs and attempts < 100 * n_configs:
+            batch = self.space.sample(self.rng, n_configs - len(configs))
+            attempts += len(batch)
+            for params in batch:
+                key = tuple(params.values())
+                if key not in seen:
+                    seen.add(key)
+                    configs.append(params)
+        for rung, fidelity in enumerate(rungs):
+            if self.exhausted(fidelity):
+                break
+            scores = []
+            for params in configs:
+                if self.exhausted(fidelity):
+                    break
+                scores.append(self.evaluate(params, fidelity))
+            scored = np.nan_to_num(np.array(scores), nan=-np.inf)
+            keep = max(1, len(configs) // self.eta) if fidelity < 1.0 else len(configs)
+            configs = [configs[i] for i in np.argsort(-scored, kind='stable')[:keep]]
+
+
+class SurrogateSearch(SearchStrategy):
+    """
+    Gaussian-process surrogate over the encoded parameters: after n_initial random backtests,
+    each next point is the candidate (from a random pool) with the highest upper confidence bound.
+    """
+
+    name = 'surrogate'
+
+    def __init__(self, space, budget=100, n_initial=10, n_candidates=2000, kappa=2.0,
+                 length_scale=0.2, noise=1e-3, **kwargs):
+        super().__init__(space, budget, **kwargs)
+        self.n_initial = n_initial
+        self.n_candidates = n_candidates
+        self.kappa = kappa
+        self.length_scale = length_scale
+        self.noise = noise
+
+    def _kernel(self, a, b):
+        sq = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * sq / self.length_scale ** 2)
+
+    def _suggest(self, tried):
+        x = self.space.encode(tried)
+        y = np.array([t['score'] for t in self.trials], dtype='float64')
+        ok = np.isfinite(y)
+        x, y = x[ok], y[ok]
+        candidates = self.space.sample(self.rng, self.n_candidates)
+        seen = {tuple(p.values()) for p in tried}
+        candidates = [c for c in candidates if tuple(c.values()) not in seen] or candidates
+        if len(y) < 2:
+            return candidates[0]
+
+        mean, std = y.mean(), y.std() or 1.0
+        target = (y - mean) / std
+        k = self._kernel(x, x) + self.noise * np.eye(len(x))
+        chol = np.linalg.cholesky(k)
+        alpha = np.linalg.solve(chol.T, np.linalg.solve(chol, target))
+
+        encoded = self.space.encode(candidates)
+        k_star = self._kernel(encoded, x)
+        mu = k_star @ alpha
+        v = np.linalg.solve(chol, k_star.T)
+        sigma = np.sqrt(np.maximum(1.0 - (v * v).sum(axis=0), 0.0))
+        return candidates[int(np.argmax(mu + self.kappa * sigma))]
+
+    def search(self):
+        tried = []
+        for params in self.space.sample(self.rng, self.n_initial):
+            if self.exhausted():
+                return
+            tried.append(params)
+            self.evaluate(params)
+        while not self.exhausted():
+            params = self._suggest(tried)
+            tried.append(params)
+            self.evaluate(params)
+
+
+SEARCH_STRATEGIES = {
+    'grid': GridSearch,
+    'random': RandomSearch,
+    'halving': SuccessiveHalving,
+    'surrogate': SurrogateSearch,
+}
+
+# Engine settings that can be searched alongside the signal parameters
+ENGINE_PARAMETERS = ('max_positions', 'position_size', 'rebalance_every', 'max_gross_exposure', 'commission_bps')
+
+
+class PortfolioObjective:
+    """
+    Scores a parameter set with the shared-capital Bollinger portfolio on a close panel.
+    `fidelity` selects the most recent fraction of the backtest period, so cheap low-fidelity
+    runs still see current market conditions. Signals are computed only on the rows the run
+    reads plus warmup_bars of history, so low-fidelity runs are cheap end to end.
+    """
+
+    def __init__(self, close_df: pd.DataFrame, metric='sharpe_ratio', warmup_bars=100,
+                 initial_capital=100_000, **engine):
+        self.close_df = close_df
+        self.metric = metric
+        self.warmup_bars = warmup_bars
+        self.initial_capital = initial_capital
+        self.engine = {'max_positions': 10, **engine}
+
+    def __call__(self, params, fidelity=1.0):
+        n = len(self.close_df)
+        start = max(self.warmup_bars, n - int(round((n - self.warmup_bars) * fidelity)))
+        signals = bollinger_signals(self.close_df.iloc[start - self.warmup_bars:],
+                                    params['window'], params['std_dev'])
+        rows = slice(self.warmup_bars, None)
+        panel = SignalPanel(signals.dates[rows], signals.symbols, signals.close[rows], signals.entries[rows],
+                            signals.exits[rows], signals.strength[rows], signals.has_bar[rows],
+                            sides=signals.sides[rows])
+
+        engine = {**self.engine, **{name: params[name] for name in ENGINE_PARAMETERS if name in params}}
+        engine.setdefault('position_size', 1.0 / engine['max_positions'])
+        history, _, trades = run_portfolio_backtest(panel, initial_capital=self.initial_capital, **engine)
+        return performance_metrics(history, self.initial_capital, trades).get(self.metric, np.nan)
+
+
+def main():
+    """Compare search strategies against the full grid on a synthetic panel"""
+    rng = np.random.default_rng(11)
+    n_days, n_symbols = 1000, 100
+    dates = pd.bdate_range('2019-01-01', periods=n_days, tz='UTC')
+    # Mean-reverting noise around a drifting trend so some parameters are clearly better
+    trend = np.cumsum(rng.normal(0.0003, 0.01, (n_days, n_symbols)), axis=0)
+    noise = np.zeros((n_days, n_symbols))
+    for t in range(1, n_days):
+        noise[t] = 0.8 * noise[t - 1] + rng.normal(0, 0.01, n_symbols)
+    close = pd.DataFrame(100 * np.exp(trend + noise), index=dates, columns=[f'S{i:03d}' for i in range(n_symbols)])
+
+    space = SearchSpace(window=Integer(5, 100, 5), std_dev=Real(1.0, 3.5, 0.25),
+                        max_positions=Choice([5, 10, 20]), rebalance_every=Choice([None, 5, 21]))
+    objective = PortfolioObjective(close)
+
+    print(f"Search space: {space.size()} combinations")
+    for name, kwargs in [('random', {}), ('halving', {}), ('surrogate', {})]:
+        start = time.perf_counter()
+        result = SEARCH_STRATEGIES[name](space, budget=60, seed=1, **kwargs).run(objective)
+        print(f"   {name:9}: best Sharpe {result['best_score']:.3f} with {result['evaluations']} backtests "
+              f"({result['budget_used']:.1f} budget units, {time.perf_counter() - start:.1f}s) "
+              f"-> {result['best_params']}")
+
+    # Reference: the full grid of the smaller (window, std_dev) space only
+    small = SearchSpace(window=Integer(5, 100, 5), std_dev=Real(1.0, 3.5, 0.25))
+    start = time.perf_counter()
+    grid = GridSearch(small, budget=small.size()).run(objective)
+    print(f"   grid     : best Sharpe {grid['best_score']:.3f} with {grid['evaluations']} backtests "
+          f"({time.perf_counter() - start:.1f}s) over window x std_dev only -> {grid['best_params']}")
+
+
+if __name__ == "__main__":
+    main()
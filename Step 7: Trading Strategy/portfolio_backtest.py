@@ -0,0 +1,338 @@
+# Step 7: Panel Portfolio Backtesting Engine
+# Loads prices once, precomputes (date x symbol) signal arrays and steps the portfolio over array rows
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from timestamps import read_panel
+from indicators import rsi, zscore, bollinger_bands, TRADING_DAYS
+
+TRADE_COLUMNS = ['timestamp', 'symbol', 'action', 'shares', 'price', 'value', 'signal_strength',
+                 'cash_before', 'cash_after']
+
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+class SignalPanel:
+    """
+    Date-aligned arrays for a backtest: prices plus per-bar entry/exit flags and strengths.
+    `has_bar` marks rows where a symbol actually traded; signals never fire elsewhere.
+    `sides` gives each entry's direction (+1 long, -1 short; long when omitted).
+    """
+
+    def __init__(self, dates, symbols, close, entries, exits, strength, has_bar=None, extras=None, sides=None):
+        self.dates = pd.DatetimeIndex(dates)
+        self.symbols = list(symbols)
+        self.close = np.asarray(close, dtype='float64')
+        self.has_bar = np.isfinite(self.close) if has_bar is None else np.asarray(has_bar, dtype=bool)
+        self.entries = np.asarray(entries, dtype=bool) & self.has_bar
+        self.exits = np.asarray(exits, dtype=bool) & self.has_bar
+        self.strength = np.nan_to_num(np.asarray(strength, dtype='float64'))
+        # Extra per-bar arrays (e.g. rsi, z_score) copied onto the trade log
+        self.extras = extras or {}
+        self.sides = np.ones(self.close.shape, dtype='int8') if sides is None else np.asarray(sides, dtype='int8')
+
+    def slice(self, start=None, end=None):
+        """Rows between two dates (inclusive), keeping indicator warm-up out of the backtest"""
+        mask = np.ones(len(self.dates), dtype=bool)
+        if start is not None:
+            mask &= self.dates >= _utc(start)
+        if end is not None:
+            mask &= self.dates < _utc(end) + pd.Timedelta(days=1)
+        return SignalPanel(self.dates[mask], self.symbols, self.close[mask], self.entries[mask],
+                           self.exits[mask], self.strength[mask], self.has_bar[mask],
+                           {name: values[mask] for name, values in self.extras.items()}, self.sides[mask])
+
+
+def load_close_panel(conn, symbols, start_date=None, end_date=None, warmup_days=400):
+    """
+    Daily closes for the symbols as a date-aligned panel, starting warmup_days before start_date
+    so indicators are already valid on the first backtest day
+    """
+    load_start = pd.Timestamp(start_date) - timedelta(days=warmup_days) if start_date else None
+    return read_panel(conn, symbols=symbols, start_date=load_start, end_date=end_date,
+                      columns=('close',), align='date')['close']
+
+
+def rsi_zscore_signals(close_df: pd.DataFrame, rsi_period=14, z_window=20, oversold=30, overbought=70,
+                       z_threshold=2.0, min_history=50) -> SignalPanel:
+    """
+    RSI + z-score mean reversion signals for every symbol and day in one pass:
+    buy when RSI < oversold and z < -threshold, sell when RSI > overbought and z > threshold
+    """
+    has_bar = close_df.notna().to_numpy()
+    # Missing days reuse the last close so rolling windows stay contiguous per symbol
+    close = close_df.ffill().to_numpy()
+    rsi_values = rsi(close, rsi_period)
+    z = zscore(close, z_window)
+
+    enough_history = np.cumsum(has_bar, axis=0) >= min_history
+    with np.errstate(invalid='ignore'):
+        entries = (rsi_values < oversold) & (z < -z_threshold) & enough_history
+        exits = (rsi_values > overbought) & (z > z_threshold) & enough_history
+        strength = np.where(entries, np.minimum(100, (oversold - rsi_values) * 2 + np.abs(z) * 10),
+                            np.where(exits, np.minimum(100, (rsi_values - overbought) * 2 + np.abs(z) * 10), 0))
+
+    return SignalPanel(close_df.index, close_df.columns, close, entries, exits, strength, has_bar,
+                       {'rsi': rsi_values, 'z_score': z})
+
+
+def bollinger_signals(close_df: pd.DataFrame, window=20, num_std=2.5) -> SignalPanel:
+    """
+    Bollinger crossover signals for every symbol at once (same rules as
+    BollingerBandMeanReversionStrategy.generate_trading_signals): long on a cross below the
+    lower band, short on a cross above the upper band, exit on a cross of the middle band.
+    Strength is how far the close pierced the band, in standard deviations.
+    """
+    has_bar = close_df.notna().to_numpy()
+    close = close_df.ffill().to_numpy()
+    bands = bollinger_bands(close, window, num_std=num_std)
+    middle, upper, lower = bands['middle'], bands['upper'], bands['lower']
+
+    def previous(values):
+        shifted = np.full_like(values, np.nan)
+        shifted[1:] = values[:-1]
+        return shifted
+
+    prev_close = previous(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        buys = (close < lower) & (prev_close >= previous(lower))
+        sells = (close > upper) & (prev_close <= previous(upper))
+        exits = (((close > middle) & (prev_close <= previous(middle)))
+                 | ((close < middle) & (prev_close >= previous(middle))))
+        std = (upper - middle) / num_std
+        strength = np.where(buys, (lower - close) / std, np.where(sells, (close - upper) / std, 0.0))
+
+    # An exit on the same bar wins, as in the single-symbol signal generator
+    entries = (buys | sells) & ~exits
+    sides = np.where(sells, -1, 1)
+    return SignalPanel(close_df.index, close_df.columns, close, entries, exits, strength, has_bar,
+                       {'middle_band': middle}, sides)
+
+
+def run_portfolio_backtest(panel: SignalPanel, initial_capital=100_000, max_positions=10,
+                           position_size=0.10, max_gross_exposure=1.0, rebalance_every=None,
+                           commission_bps=0.0):
+    """
+    Shared-capital portfolio over a common date index, vectorized across symbols each day.
+
+    - exits close positions first, freeing cash and slots
+    - entries (strongest first) take free slots, each sized at position_size of current equity;
+      long entries must fit in cash and all entries within max_gross_exposure x equity
+    - every rebalance_every bars open positions are resized back to position_size of equity
+    Shorts credit their proceeds to cash; equity is cash plus the marked value of positions.
+    Returns (history, positions DataFrame of shares per date x symbol, trades DataFrame).
+    """
+    n_days, n_symbols = panel.close.shape
+    marks = pd.DataFrame(panel.close).ffill().fillna(0.0).to_numpy()
+    cost_rate = commission_bps / 10_000
+
+    shares = np.zeros(n_symbols)
+    entry_price = np.zeros(n_symbols)
+    # P&L already realized by rebalance trims of each open position, booked with its final close
+    trimmed_pnl = np.zeros(n_symbols)
+    cash = float(initial_capital)
+
+    positions = np.zeros((n_days, n_symbols))
+    cash_history = np.empty(n_days)
+    equity_history = np.empty(n_days)
+    realized = []
+
+    def close_positions(t, idx):
+        nonlocal cash
+        price = marks[t, idx]
+        proceeds = shares[idx] * price
+        cash += proceeds.sum() - np.abs(proceeds).sum() * cost_rate
+        realized.extend(zip(np.full(len(idx), t), idx, shares[idx] * (price - entry_price[idx]) + trimmed_pnl[idx]))
+        shares[idx] = 0
+        trimmed_pnl[idx] = 0
+
+    for t in range(n_days):
+        price = marks[t]
+
+        # 1. Exits
+        closing = np.flatnonzero(panel.exits[t] & (shares != 0))
+        if closing.size:
+            close_positions(t, closing)
+
+        equity = cash + shares @ price
+
+        # 2. Periodic rebalance of open positions back to the target size
+        if rebalance_every and t > 0 and t % rebalance_every == 0:
+            held = np.flatnonzero((shares != 0) & panel.has_bar[t])
+            if held.size:
+                target = np.sign(shares[held]) * np.floor(equity * position_size / price[held])
+                delta = target - shares[held]
+                cash -= delta @ price[held] + np.abs(delta) @ price[held] * cost_rate
+                # Trims realize P&L on the shares taken off; additions move the cost-weighted entry
+                trimmed = np.abs(target) < np.abs(shares[held])
+                trimmed_pnl[held[trimmed]] -= delta[trimmed] * (price[held[trimmed]] - entry_price[held[trimmed]])
+                added = np.abs(target) > np.abs(shares[held])
+                entry_price[held[added]] = ((shares[held[added]] * entry_price[held[added]]
+                                             + delta[added] * price[held[added]]) / target[added])
+                shares[held] = target
+                # A position trimmed all the way to zero is closed
+                emptied = held[target == 0]
+                realized.extend(zip(np.full(len(emptied), t), emptied, trimmed_pnl[emptied]))
+                trimmed_pnl[emptied] = 0
+
+        # 3. Entries into free slots, strongest signals first
+        free = max_positions - np.count_nonzero(shares)
+        candidates = np.flatnonzero(panel.entries[t] & (shares == 0))
+        if free > 0 and candidates.size:
+            if candidates.size > free:
+                top = np.argpartition(-panel.strength[t, candidates], free - 1)[:free]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-panel.strength[t, candidates], kind='stable')]
+
+            side = panel.sides[t, candidates]
+            qty = np.floor(equity * position_size / price[candidates])
+            cost = qty * price[candidates]
+            gross_room = max_gross_exposure * equity - np.abs(shares) @ price
+            long_cost = np.where(side > 0, cost * (1 + cost_rate), 0.0)
+            # Keep the strongest prefix that fits; a weaker signal never displaces a stronger one
+            fits = np.logical_and.accumulate((np.cumsum(cost) <= gross_room) & (np.cumsum(long_cost) <= cash))
+            fits &= qty > 0
+            opened = candidates[fits]
+            if opened.size:
+                shares[opened] = side[fits] * qty[fits]
+                entry_price[opened] = price[opened]
+                cash -= shares[opened] @ price[opened] + cost[fits].sum() * cost_rate
+
+        positions[t] = shares
+        cash_history[t] = cash
+        equity_history[t] = cash + shares @ price
+
+    # Trade log straight from day-over-day position changes
+    changes = np.diff(positions, axis=0, prepend=0.0)
+    rows, cols = np.nonzero(changes)
+    trades = pd.DataFrame({
+        'timestamp': panel.dates[rows],
+        'symbol': np.asarray(panel.symbols)[cols],
+        'action': np.where(changes[rows, cols] > 0, 'BUY', 'SELL'),
+        'shares': np.abs(changes[rows, cols]),
+        'price': marks[rows, cols],
+    })
+    trades['value'] = trades['shares'] * trades['price']
+
+    history = pd.DataFrame({
+        'portfolio_value': equity_history,
+        'cash': cash_history,
+        'positions_count': np.count_nonzero(positions, axis=1),
+        'gross_exposure': np.abs(positions * marks).sum(axis=1) / equity_history,
+    }, index=panel.dates)
+    history.index.name = 'date'
+    history.attrs['realized_pnl'] = np.array([pnl for _, _, pnl in realized])
+    return history, pd.DataFrame(positions, index=panel.dates, columns=panel.symbols), trades
+
+
+def run_signal_backtest(panel: SignalPanel, initial_capital=1_000_000, max_positions=8,
+                        position_size_pct=0.10, cash_buffer=0.9):
+    """
+    Long-only daily portfolio loop over precomputed signals. Each day's signals are handled in
+    order of strength: entries open a position sized at position_size_pct of cash scaled by
+    0.5-1.5x strength (if a slot is free and it fits within cash_buffer), exits close it.
+    Returns (history DataFrame, trades DataFrame, final shares array).
+    """
+    n_days, n_symbols = panel.close.shape
+    shares = np.zeros(n_symbols, dtype='int64')
+    cash = float(initial_capital)
+    # Last known close per symbol for marking positions on days without a bar
+    marks = pd.DataFrame(panel.close).ffill().fillna(0.0).to_numpy()
+
+    values = np.empty(n_days)
+    cash_history = np.empty(n_days)
+    positions = np.empty(n_days, dtype='int64')
+    trades = []
+
+    active_days = np.flatnonzero((panel.entries | panel.exits).any(axis=1))
+    next_active = 0
+    for t in range(n_days):
+        if next_active < len(active_days) and active_days[next_active] == t:
+            next_active += 1
+            candidates = np.flatnonzero(panel.entries[t] | panel.exits[t])
+            # Strongest signals first (stable for equal strength)
+            candidates = candidates[np.argsort(-panel.strength[t, candidates], kind='stable')]
+            for j in candidates:
+                price = panel.close[t, j]
+                strength = panel.strength[t, j]
+                if panel.entries[t, j]:
+                    if shares[j] or np.count_nonzero(shares) >= max_positions:
+                        continue
+                    size = int(cash * position_size_pct * (0.5 + strength / 100) / price)
+                    if size <= 0 or size * price > cash * cash_buffer:
+                        continue
+                    action, cash_before = 'BUY', cash
+                    shares[j] = size
+                    cash -= size * price
+                elif shares[j] > 0:
+                    action, cash_before, size = 'SELL', cash, int(shares[j])
+                    cash += size * price
+                    shares[j] = 0
+                else:
+                    continue
+                trades.append([panel.dates[t], panel.symbols[j], action, size, price, size * price,
+                               strength, cash_before, cash]
+                              + [float(extra[t, j]) for extra in panel.extras.values()])
+
+        positions[t] = np.count_nonzero(shares)
+        cash_history[t] = cash
+        values[t] = cash + shares @ marks[t]
+
+    history = pd.DataFrame({
+        'portfolio_value': values,
+        'cash': cash_history,
+        'positions_count': positions,
+        'positions_value': values - cash_history,
+    }, index=panel.dates)
+    history.index.name = 'date'
+    trades_df = pd.DataFrame(trades, columns=TRADE_COLUMNS + list(panel.extras))
+    return history, trades_df, shares
+
+
+def performance_metrics(history: pd.DataFrame, initial_capital: float, trades: pd.DataFrame = None) -> dict:
+    """Return, risk and activity statistics for a portfolio value history"""
+    if history.empty:
+        return {}
+
+    daily_return = history['portfolio_value'].pct_change()
+    final_value = history['portfolio_value'].iloc[-1]
+    total_return = final_value / initial_capital - 1
+    std = daily_return.std()
+
+    running_max = history['portfolio_value'].cummax()
+    drawdown = (history['portfolio_value'] - running_max) / running_max
+
+    trades = trades if trades is not None else pd.DataFrame(columns=['action'])
+    metrics = {
+        'initial_value': initial_capital,
+        'final_value': final_value,
+        'total_return': total_return,
+        'annualized_return': (1 + total_return) ** (TRADING_DAYS / len(history)) - 1,
+        'volatility': std * np.sqrt(TRADING_DAYS),
+        'sharpe_ratio': daily_return.mean() / std * np.sqrt(TRADING_DAYS) if std > 0 else 0,
+        'max_drawdown': abs(drawdown.min()),
+        'total_trades': len(trades),
+        'buy_trades': int((trades['action'] == 'BUY').sum()),
+        'sell_trades': int((trades['action'] == 'SELL').sum()),
+        'avg_positions': history['positions_count'].mean(),
+        'max_positions': int(history['positions_count'].max()),
+        'final_positions': int(history['positions_count'].iloc[-1]),
+        'final_cash_pct': history['cash'].iloc[-1] / final_value if final_value > 0 else 0,
+    }
+    realized = history.attrs.get('realized_pnl')
+    if realized is not None:
+        metrics['closed_trades'] = len(realized)
+        metrics['win_rate'] = float((realized > 0).mean()) if len(realized) else 0
+    return metrics
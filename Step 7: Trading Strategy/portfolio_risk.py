@@ -0,0 +1,158 @@
+# Step 7: Multi-Portfolio Risk Metrics
+# Return and risk metrics for a whole matrix of candidate weight vectors from one returns panel
+
+import time
+import numpy as np
+import pandas as pd
+
+from indicators import TRADING_DAYS
+
+RISK_METRICS = ('total_return', 'annualized_return', 'volatility', 'sharpe_ratio', 'sortino_ratio',
+                'max_drawdown', 'var_5', 'cvar_5', 'win_rate', 'avg_win', 'avg_loss')
+
+
+def random_weights(n_portfolios, n_assets, seed=None, concentration=1.0) -> np.ndarray:
+    """(portfolios x assets) long-only weights drawn uniformly from the simplex (Dirichlet)"""
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet(np.full(n_assets, concentration), n_portfolios)
+
+
+def _masked_mean(values, mask):
+    """Column means of the masked entries (NaN where a column has none)"""
+    count = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(mask, values, 0.0).sum(axis=0) / count, count
+
+
+def _percentile(values, q):
+    """np.percentile(values, q, axis=0) (linear interpolation) from a partial sort of two rows"""
+    position = (len(values) - 1) * q / 100
+    lower = int(np.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    part = np.partition(values, [lower, upper], axis=0)
+    return part[lower] + (part[upper] - part[lower]) * (position - lower)
+
+
+def _chunk_metrics(returns, weights):
+    """Metrics for one block of portfolios; returns is (days x assets), weights (portfolios x assets)"""
+    daily = returns @ weights.T
+    n_days = len(daily)
+    growth = np.cumprod(1 + daily, axis=0)
+    total = growth[-1] - 1
+    annualized = (1 + total) ** (TRADING_DAYS / n_days) - 1
+    volatility = daily.std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+
+    # Downside deviation: sample std of the losing days only, as the per-series metric computes it
+    losing = daily < 0
+    avg_loss, n_losing = _masked_mean(daily, losing)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        downside = np.sqrt(np.square(np.where(losing, daily - avg_loss, 0.0)).sum(axis=0) / (n_losing - 1))
+        downside = downside * np.sqrt(TRADING_DAYS)
+
+    var = _percentile(daily, 5)
+    cvar, _ = _masked_mean(daily, daily <= var)
+    winning = daily > 0
+    avg_win, _ = _masked_mean(daily, winning)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'total_return': total,
+            'annualized_return': annualized,
+            'volatility': volatility,
+            'sharpe_ratio': np.where(volatility > 0, annualized / volatility, 0.0),
+            'sortino_ratio': np.where(downside > 0, annualized / downside, 0.0),
+            'max_drawdown': (growth / np.maximum.accumulate(growth, axis=0) - 1).min(axis=0),
+            'var_5': var,
+            'cvar_5': cvar,
+            'win_rate': winning.mean(axis=0),
+            'avg_win': avg_win,
+            'avg_loss': avg_loss,
+        }
+
+
+def portfolio_metrics(returns, weights, normalize=True, chunk_size=1024) -> pd.DataFrame:
+    """
+    The metrics of AdvancedStrategyAnalyzer.return_metrics for K portfolios at once.
+
+    returns is a (days x assets) panel of daily returns (missing returns count as 0, as in
+    calculate_portfolio_metrics); weights is (K x assets), or a single vector. Daily portfolio
+    returns come from one matrix product per chunk of chunk_size portfolios, which bounds memory at
+    a few (days x chunk_size) arrays; VaR uses a partial sort instead of a full one. normalize=True
+    scales each row to sum to 1. Returns one row per portfolio (indexed like a weights DataFrame).
+    """
+    columns = returns.columns if isinstance(returns, pd.DataFrame) else None
+    index = None
+    if isinstance(weights, pd.DataFrame):
+        index = weights.index
+        if columns is not None:
+            weights = weights.reindex(columns=columns, fill_value=0.0)
+    values = np.nan_to_num(np.asarray(returns, dtype='float64'))
+    weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    if weights.shape[1] != values.shape[1]:
+        raise ValueError(f"weights have {weights.shape[1]} assets, returns have {values.shape[1]}")
+    if normalize:
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = weights / np.where(totals != 0, totals, 1.0)
+
+    chunks = [_chunk_metrics(values, weights[start:start + chunk_size])
+              for start in range(0, len(weights), chunk_size)]
+    return pd.DataFrame({name: np.concatenate([chunk[name] for chunk in chunks]) for name in RISK_METRICS},
+                        index=index)
+
+
+def _reference_metrics(portfolio_returns: pd.Series) -> dict:
+    """Per-portfolio pandas calculation the batch replaces (AdvancedStrategyAnalyzer.return_metrics)"""
+    total_return = (1 + portfolio_returns).prod() - 1
+    annualized_return = (1 + total_return) ** (252 / len(portfolio_returns)) - 1
+    volatility = portfolio_returns.std() * np.sqrt(252)
+    cumulative = (1 + portfolio_returns).cumprod()
+    running_max = cumulative.expanding().max()
+    downside_returns = portfolio_returns[portfolio_returns < 0]
+    downside_deviation = downside_returns.std() * np.sqrt(252) if len(downside_returns) > 0 else 0
+    var_5 = np.percentile(portfolio_returns, 5)
+    return {
+        'total_return': total_return,
+        'annualized_return': annualized_return,
+        'volatility': volatility,
+        'sharpe_ratio': annualized_return / volatility if volatility > 0 else 0,
+        'sortino_ratio': annualized_return / downside_deviation if downside_deviation > 0 else 0,
+        'max_drawdown': ((cumulative - running_max) / running_max).min(),
+        'var_5': var_5,
+        'cvar_5': portfolio_returns[portfolio_returns <= var_5].mean(),
+        'win_rate': (portfolio_returns > 0).mean(),
+        'avg_win': portfolio_returns[portfolio_returns > 0].mean(),
+        'avg_loss': portfolio_returns[portfolio_returns < 0].mean(),
+    }
+
+
+def main():
+    """Check the batch against the per-portfolio pandas metrics and time a large portfolio search"""
+    rng = np.random.default_rng(11)
+    n_days, n_assets = 1800, 500
+    factor = rng.normal(0.0003, 0.01, (n_days, 1))
+    returns = pd.DataFrame(factor * rng.uniform(0.5, 1.5, n_assets) + rng.normal(0, 0.015, (n_days, n_assets)),
+                           index=pd.bdate_range('2018-01-01', periods=n_days),
+                           columns=[f'S{i:03d}' for i in range(n_assets)])
+
+    weights = random_weights(50, n_assets, seed=3)
+    batch = portfolio_metrics(returns, weights)
+    worst = 0.0
+    for k in range(len(weights)):
+        reference = _reference_metrics((returns * weights[k]).sum(axis=1))
+        for name, expected in reference.items():
+            worst = max(worst, abs(batch.at[k, name] - expected) / max(1.0, abs(expected)))
+    print(f"Batch vs per-portfolio pandas (50 portfolios): max relative difference {worst:.1e}")
+
+    candidates = random_weights(10_000, n_assets, seed=4)
+    start = time.perf_counter()
+    scored = portfolio_metrics(returns, candidates)
+    seconds = time.perf_counter() - start
+    best = scored['sharpe_ratio'].idxmax()
+    print(f"10,000 portfolios x {n_assets} assets x {n_days} days: {seconds:.2f}s "
+          f"(best Sharpe {scored.at[best, 'sharpe_ratio']:.2f}, CVaR {scored.at[best, 'cvar_5']:.2%})")
+    ok = worst < 1e-9
+    print(f"{'✅ Portfolio risk metrics match' if ok else '❌ Parity check failed'}")
+    return ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# Step 7: Vectorized Regime Detection
+# Volatility/trend regimes for every symbol and the equal-weight index as one int8 (date x symbol) matrix
+
+import os
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+from indicators import rolling_mean, rolling_volatility
+
+INDEX_COLUMN = 'EQUAL_WEIGHT'
+
+# Regime code = 3 * volatility state + trend state; -1 where there is no price or not enough history
+VOLATILITY_STATES = ('Low', 'Normal', 'High')
+TREND_STATES = ('Down', 'Sideways', 'Up')
+UNKNOWN = -1
+
+
+def equal_weight_index(price_df: pd.DataFrame) -> pd.Series:
+    """Daily-rebalanced equal-weight index of the symbols with a return that day (starts at 1.0)"""
+    returns = price_df.pct_change()
+    daily = returns.mean(axis=1, skipna=True).fillna(0.0)
+    return (1 + daily).cumprod().rename(INDEX_COLUMN)
+
+
+def _rolling_median(values, window, min_periods, from_row=0):
+    """Trailing median of finite values per column for rows >= from_row (NaN before, or if too few)"""
+    rows = len(values) - from_row
+    if rows > 64:
+        median = pd.DataFrame(values).rolling(window, min_periods=min_periods).median().to_numpy(copy=True)
+        median[:from_row] = np.nan
+        return median
+    # A handful of new rows (daily updates): take the medians of just those windows
+    padded = np.vstack([np.full((window - 1, values.shape[1]), np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded[from_row:], window, axis=0)
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(windows, axis=2)
+    median[np.isfinite(windows).sum(axis=2) < min_periods] = np.nan
+    return np.vstack([np.full((from_row, values.shape[1]), np.nan), median])
+
+
+def volatility_states(returns, window=20, baseline=252, high=1.5, low=0.7, from_row=0) -> np.ndarray:
+    """
+    Volatility state per (date, symbol): High above high x the reference volatility, Low below
+    low x, Normal otherwise. The reference is the rolling median of the symbol's own volatility
+    over `baseline` bars, or the full-sample median with baseline=None (uses future data).
+    Rows before from_row are only read as history and come back unknown.
+    """
+    returns = pd.DataFrame(returns)
+    volatility = rolling_volatility(returns.to_numpy(dtype='float64'), window)
+    if baseline is None:
+        with np.errstate(all='ignore'):
+            reference = np.nanmedian(volatility, axis=0, keepdims=True)
+    else:
+        reference = _rolling_median(volatility, baseline, baseline // 2, from_row)
+
+    states = np.full(volatility.shape, UNKNOWN, dtype='int8')
+    known = np.isfinite(volatility) & np.isfinite(reference)
+    with np.errstate(invalid='ignore'):
+        states[known] = 1
+        states[known & (volatility > reference * high)] = 2
+        states[known & (volatility < reference * low)] = 0
+    return states
+
+
+def trend_states(price_df, window=200, band=0.02) -> np.ndarray:
+    """Trend state per (date, symbol): Up above the SMA by more than band, Down below it, Sideways between"""
+    close = pd.DataFrame(price_df).to_numpy(dtype='float64')
+    sma = rolling_mean(close, window)
+    states = np.full(close.shape, UNKNOWN, dtype='int8')
+    known = np.isfinite(close) & np.isfinite(sma)
+    with np.errstate(invalid='ignore'):
+        states[known] = 1
+        states[known & (close > sma * (1 + band))] = 2
+        states[known & (close < sma * (1 - band))] = 0
+    return states
+
+
+def classify_regimes(price_df: pd.DataFrame, vol_window=20, baseline=252, trend_window=200,
+                     high=1.5, low=0.7, band=0.02, include_index=True, from_row=0) -> pd.DataFrame:
+    """
+    Combined regime codes for every symbol (and the equal-weight index) over the whole panel in
+    one pass per indicator. Returns an int8 DataFrame; decode with volatility_state/trend_state.
+    With from_row, earlier rows are history only and just the rows from there on are returned.
+    """
+    if include_index:
+        price_df = price_df.assign(**{INDEX_COLUMN: equal_weight_index(price_df)})
+    vol = volatility_states(price_df.pct_change(), vol_window, baseline, high, low, from_row)
+    trend = trend_states(price_df, trend_window, band)
+    codes = np.where((vol >= 0) & (trend >= 0), 3 * vol + trend, UNKNOWN).astype('int8')
+    return pd.DataFrame(codes[from_row:], index=price_df.index[from_row:], columns=price_df.columns)
+
+
+def volatility_state(codes):
+    """Volatility state (0 Low, 1 Normal, 2 High; -1 unknown) from regime codes"""
+    codes = np.asarray(codes)
+    return np.where(codes >= 0, codes // 3, UNKNOWN).astype('int8')
+
+
+def trend_state(codes):
+    """Trend state (0 Down, 1 Sideways, 2 Up; -1 unknown) from regime codes"""
+    codes = np.asarray(codes)
+    return np.where(codes >= 0, codes % 3, UNKNOWN).astype('int8')
+
+
+def regime_label(code) -> str:
+    """Readable label such as 'High vol / Down'"""
+    code = int(code)
+    if code < 0:
+        return 'Unknown'
+    return f"{VOLATILITY_STATES[code // 3]} vol / {TREND_STATES[code % 3]}"
+
+
+class RegimeMatrix:
+    """
+    Regime codes kept on disk as one int8 (date x symbol) matrix in an .npz file, together with
+    the last `lookback` bars of prices. update() classifies only the dates after the last stored
+    one from that tail, so a daily run costs a few hundred rows rather than the whole history;
+    a changed universe, changed parameters or revised prices in the tail trigger a full rebuild.
+    """
+
+    def __init__(self, path, vol_window=20, baseline=252, trend_window=200, high=1.5, low=0.7, band=0.02):
+        if baseline is None:
+            raise ValueError("RegimeMatrix needs a trailing baseline; the full-sample median changes every day")
+        self.path = path if path.endswith('.npz') else path + '.npz'
+        self.params = {'vol_window': vol_window, 'baseline': baseline, 'trend_window': trend_window,
+                       'high': high, 'low': low, 'band': band}
+        # Bars before the first new row that every window ending on it reads
+        self.lookback = max(vol_window + baseline, trend_window) + 1
+        self.codes = None
+        self.tail = None
+        self.stats = {'rebuilds': 0, 'rows_added': 0}
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        with np.load(self.path, allow_pickle=False) as data:
+            params = dict(zip(data['param_names'].tolist(), data['param_values'].tolist()))
+            if params != {k: float(v) for k, v in self.params.items()}:
+                return
+            dates = pd.DatetimeIndex(data['dates'])
+            if bool(data['utc']):
+                dates = dates.tz_localize('UTC')
+            columns = data['symbols'].tolist()
+            self.codes = pd.DataFrame(data['codes'], index=dates, columns=columns)
+            tail_dates = dates[len(dates) - len(data['tail']):]
+            self.tail = pd.DataFrame(data['tail'], index=tail_dates, columns=columns[:-1])
+
+    def save(self):
+        """Write codes, tail prices and parameters to the .npz file"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        dates = self.codes.index
+        np.savez(self.path,
+                 codes=self.codes.to_numpy(dtype='int8'),
+                 dates=np.asarray(dates.tz_convert('UTC').tz_localize(None) if dates.tz is not None else dates,
+                                  dtype='datetime64[ns]'),
+                 utc=dates.tz is not None,
+                 symbols=np.array(self.codes.columns, dtype=str),
+                 tail=self.tail.to_numpy(dtype='float64'),
+                 param_names=np.array(list(self.params), dtype=str),
+                 param_values=np.array([float(v) for v in self.params.values()]))
+
+    def _classify(self, price_df, from_row=0):
+        return classify_regimes(price_df, self.params['vol_window'], self.params['baseline'],
+                                self.params['trend_window'], self.params['high'], self.params['low'],
+                                self.params['band'], from_row=from_row)
+
+    def _tail_matches(self, price_df):
+        if self.codes is None or list(self.tail.columns) != list(price_df.columns):
+            return False
+        overlap = self.tail.index.intersection(price_df.index)
+        if len(overlap) < min(len(self.tail), self.lookback):
+            return False
+        stored = self.tail.loc[overlap].to_numpy()
+        current = price_df.loc[overlap].to_numpy(dtype='float64')
+        return np.allclose(stored, current, rtol=1e-10, atol=0.0, equal_nan=True)
+
+    def update(self, price_df: pd.DataFrame, save=True) -> pd.DataFrame:
+        """
+        Bring the matrix up to date with a (date x symbol) close panel and return the codes.
+        Only rows after the last stored date are classified, from the stored lookback bars.
+        """
+        price_df = price_df.sort_index()
+        if not self._tail_matches(price_df):
+            self.codes = self._classify(price_df)
+            self.stats['rebuilds'] += 1
+            self.stats['rows_added'] += len(price_df)
+        else:
+            new = price_df.index > self.codes.index[-1]
+            if not new.any():
+                return self.codes
+            first = int(np.argmax(new))
+            start = max(0, first - self.lookback)
+            added = self._classify(price_df.iloc[start:], from_row=first - start)
+            self.codes = pd.concat([self.codes, added])
+            self.stats['rows_added'] += len(added)
+        self.tail = price_df.iloc[-self.lookback:].astype('float64')
+        if save:
+            self.save()
+        return self.codes
+
+    def aligned(self, dates, symbols) -> np.ndarray:
+        """
+        Codes for the given dates and symbols as an int8 array (-1 where nothing is stored), ready
+        to join onto a backtest panel, e.g. SignalPanel(..., extras={'regime': matrix.aligned(...)})
+        """
+        out = np.full((len(dates), len(symbols)), UNKNOWN, dtype='int8')
+        if self.codes is None:
+            return out
+        rows = self.codes.index.get_indexer(pd.DatetimeIndex(dates))
+        cols = self.codes.columns.get_indexer(list(symbols))
+        found_rows, found_cols = rows >= 0, cols >= 0
+        values = self.codes.to_numpy()[np.ix_(rows[found_rows], cols[found_cols])]
+        out[np.ix_(found_rows, found_cols)] = values
+        return out
+
+    def current(self) -> pd.Series:
+        """Latest regime label per symbol and for the index"""
+        latest = self.codes.iloc[-1]
+        return latest.map(regime_label)
+
+
+def _reference_regimes(returns_series, window=20):
+    """The per-series rolling std and full-sample median thresholds the engine replaces (self-check)"""
+    volatility = returns_series.rolling(window).std() * np.sqrt(252)
+    vol_median = volatility.median()
+    states = pd.Series(1, index=returns_series.index, dtype='int8')
+    states[volatility > vol_median * 1.5] = 2
+    states[volatility < vol_median * 0.7] = 0
+    states[volatility.isna()] = UNKNOWN
+    return states.to_numpy()
+
+
+def main():
+    """Check against the per-series loop, check incremental updates against a rebuild, and time both"""
+    import tempfile
+
+    rng = np.random.default_rng(11)
+    n_days, n_symbols = 2500, 200
+    dates = pd.bdate_range('2015-01-01', periods=n_days, tz='UTC')
+    scale = np.where((np.arange(n_days) // 250) % 3 == 0, 0.025, 0.012)[:, None]
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0002, 1, (n_days, n_symbols)) * scale, axis=0)),
+                          index=dates, columns=[f'S{i:03d}' for i in range(n_symbols)])
+    prices.iloc[:400, 5] = np.nan  # late listing
+
+    returns = prices.pct_change()
+    start = time.perf_counter()
+    reference = np.column_stack([_reference_regimes(returns[s]) for s in prices.columns])
+    loop_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    engine = volatility_states(returns, 20, baseline=None)
+    engine_seconds = time.perf_counter() - start
+    mismatches = int((reference != engine).sum())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'regimes.npz')
+        split = n_days - 20
+        RegimeMatrix(path).update(prices.iloc[:split])
+        rebuilds = 0
+        start = time.perf_counter()
+        for end in range(split + 1, n_days + 1):
+            matrix = RegimeMatrix(path)
+            matrix.update(prices.iloc[:end])
+            rebuilds += matrix.stats['rebuilds']
+        daily_seconds = (time.perf_counter() - start) / (n_days - split)
+        incremental = RegimeMatrix(path).codes
+    start = time.perf_counter()
+    rebuilt = classify_regimes(prices)
+    rebuild_seconds = time.perf_counter() - start
+    incremental_mismatches = int((incremental.to_numpy() != rebuilt.to_numpy()).sum())
+
+    print(f"Volatility states vs per-series loop: {mismatches} mismatches "
+          f"(loop {loop_seconds:.3f}s, engine {engine_seconds:.3f}s)")
+    print(f"Incremental vs full rebuild: {incremental_mismatches} mismatches, {rebuilds} rebuilds "
+          f"(daily update {daily_seconds * 1000:.1f}ms incl. load/save, rebuild {rebuild_seconds:.3f}s)")
+    counts = pd.Series(rebuilt[INDEX_COLUMN]).map(regime_label).value_counts()
+    print(f"Equal-weight index regimes: {counts.to_dict()}")
+    ok = mismatches == 0 and incremental_mismatches == 0 and rebuilds == 0
+    print(f"{'✅ Regime engine matches' if ok else '❌ Parity check failed'}")
+    return ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Step 7: Cross-Sectional Asset Screener
+# Loads one bar panel for the whole universe and scores every symbol with array operations
+
+import os
+import sys
+import logging
+import operator
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from timestamps import read_panel
+from indicators import rolling_mean, bollinger_bands, zscore, rsi, atr, pct_returns, rolling_volatility, TRADING_DAYS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_DB_PATH = os.path.join(STEP5_DIR, 'market_data.db')
+
+FILTER_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'between': lambda values, bounds: values.between(*bounds),
+    'in': lambda values, options: values.isin(options),
+}
+
+# Composite score used by the screening report (oversold / mean reversion / volatility / trend)
+DEFAULT_SPEC = {
+    'filters': [
+        ('data_points', '>=', 100),
+        ('total_score', '>=', 30),
+    ],
+    'rank': [('total_score', 'desc')],
+    'top_n': 20,
+}
+
+
+def _latest(values: np.ndarray) -> np.ndarray:
+    """Last row of an end-aligned panel (every symbol's most recent bar)"""
+    return values[-1]
+
+
+def _valid_mean(mask: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Share of valid rows where mask holds, per symbol"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (mask & valid).sum(axis=0) / valid.sum(axis=0)
+
+
+class PanelScreener:
+    """
+    Screens the whole universe at once: one query builds end-aligned (bar x symbol) panels,
+    indicators run as 2-D kernels and all metrics/scores are column-wise array expressions.
+    """
+
+    def __init__(self, db_path=None):
+        self.db = get_connection_manager(db_path or DEFAULT_DB_PATH)
+        self.panel = None
+
+    def load(self, symbols=None, lookback_days=1000, end_date=None, timeframe='Day'):
+        """Load close/high/low/volume for every symbol with one query"""
+        end = pd.Timestamp(end_date) if end_date is not None else pd.Timestamp(datetime.now())
+        start = end - timedelta(days=lookback_days) if lookback_days else None
+        with self.db.reader() as conn:
+            self.panel = read_panel(conn, symbols=symbols, start_date=start, end_date=end, timeframe=timeframe,
+                                    columns=('close', 'high', 'low', 'volume'), align='end')
+        logging.info(f"Screener panel loaded: {self.panel['close'].shape[1]} symbols x "
+                     f"{self.panel['close'].shape[0]} bars")
+        return self.panel
+
+    def compute_metrics(self) -> pd.DataFrame:
+        """Per-symbol metrics and scores, one row per symbol"""
+        if self.panel is None:
+            self.load()
+        close_df = self.panel['close']
+        if close_df.empty:
+            return pd.DataFrame()
+
+        close = close_df.to_numpy()
+        high = self.panel['high'].to_numpy()
+        low = self.panel['low'].to_numpy()
+        volume = self.panel['volume'].to_numpy()
+        valid = np.isfinite(close)
+        data_points = valid.sum(axis=0)
+
+        returns = pct_returns(close)
+        rsi_by_period = rsi(close, (14, 30))
+        sma = rolling_mean(close, (20, 50))
+        bands = bollinger_bands(close, 20, num_std=2)
+        z = zscore(close, 20)
+        volatility = rolling_volatility(returns, 20)
+        atr_14 = atr(high, low, close, 14)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bb_position = (close - bands['lower']) / (bands['upper'] - bands['lower'])
+            price_vs_sma20 = (close / sma[20] - 1) * 100
+            price_vs_sma50 = (close / sma[50] - 1) * 100
+
+            first_close = close[np.argmax(valid, axis=0), np.arange(close.shape[1])]
+            running_max = np.fmax.accumulate(close, axis=0)
+            drawdown = close / running_max - 1
+            mean_return = np.nanmean(returns, axis=0)
+            std_return = np.nanstd(returns, axis=0, ddof=1)
+            sharpe = np.where(std_return > 0, mean_return / std_return * np.sqrt(TRADING_DAYS), 0.0)
+
+        rsi_14 = rsi_by_period[14]
+        rsi_valid = np.isfinite(rsi_14)
+
+        metrics = pd.DataFrame({
+            'last_price': _latest(close),
+            'last_date': self.panel['timestamp'].iloc[-1],
+            'data_points': data_points,
+            'years_of_data': data_points / TRADING_DAYS,
+            'avg_volume': np.nanmean(volume, axis=0),
+            'rsi_14': _latest(rsi_14),
+            'rsi_30': _latest(rsi_by_period[30]),
+            'avg_rsi': np.nanmean(np.where(rsi_valid, rsi_14, np.nan), axis=0),
+            'rsi_extreme_pct': _valid_mean((rsi_14 < 30) | (rsi_14 > 70), rsi_valid),
+            'bb_position': _latest(bb_position),
+            'zscore_20': _latest(z),
+            'mean_reversion_opportunities': (np.abs(np.nan_to_num(z)) > 2.0).sum(axis=0),
+            'price_vs_sma20': _latest(price_vs_sma20),
+            'price_vs_sma50': _latest(price_vs_sma50),
+            'volatility_20': _latest(volatility),
+            'atr': _latest(atr_14),
+            'total_return': _latest(close) / first_close - 1,
+            'max_drawdown': np.abs(np.nanmin(drawdown, axis=0)),
+            'sharpe_ratio': sharpe,
+        }, index=close_df.columns)
+        metrics.index.name = 'symbol'
+
+        return self._score(metrics)
+
+    def _score(self, metrics: pd.DataFrame) -> pd.DataFrame:
+        """Vectorized 0-100 component scores and the weighted composite"""
+        rsi_14 = metrics['rsi_14'].to_numpy()
+        bb_position = metrics['bb_position'].to_numpy()
+        vs20 = metrics['price_vs_sma20'].to_numpy()
+        vs50 = metrics['price_vs_sma50'].to_numpy()
+        vol = metrics['volatility_20'].to_numpy()
+
+        rsi_score = np.where(rsi_14 < 40, np.maximum(0, (30 - rsi_14) / 30 * 100), 0)
+        bb_score = np.where(bb_position < 0.3, np.maximum(0, (0.2 - bb_position) / 0.2 * 100), 0)
+        metrics['oversold_score'] = np.minimum(100, (rsi_score + bb_score) / 2)
+
+        sma20_score = np.where(vs20 < -2, np.maximum(0, np.abs(vs20) - 2) * 5, 0)
+        sma50_score = np.where(vs50 < -3, np.maximum(0, np.abs(vs50) - 3) * 3, 0)
+        metrics['mean_reversion_score'] = np.minimum(100, sma20_score + sma50_score)
+
+        metrics['volatility_score'] = np.select(
+            [vol > 0.4, vol > 0.3, vol > 0.2, vol > 0.15], [100, 75, 50, 25], default=10)
+
+        rsi_trend = np.where(rsi_14 > 30, rsi_14, 0)
+        metrics['trend_score'] = np.clip(((50 + vs20) + rsi_trend) / 2, 0, 100)
+
+        metrics['total_score'] = (
+            metrics['oversold_score'] * 0.3 +
+            metrics['mean_reversion_score'] * 0.3 +
+            metrics['volatility_score'] * 0.2 +
+            metrics['trend_score'] * 0.2
+        )
+        return metrics
+
+    def screen(self, spec=None, metrics=None) -> pd.DataFrame:
+        """
+        Apply a declarative spec:
+            {'filters': [(column, op, value), ...],   # op in FILTER_OPERATORS
+             'rank': [(column, 'asc'|'desc'), ...],
+             'top_n': int or None}
+        """
+        spec = spec or DEFAULT_SPEC
+        if metrics is None:
+            metrics = self.compute_metrics()
+        if metrics.empty:
+            return metrics
+
+        mask = pd.Series(True, index=metrics.index)
+        for column, op, value in spec.get('filters', []):
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"Unknown filter operator '{op}'. Choose from: {', '.join(FILTER_OPERATORS)}")
+            mask &= FILTER_OPERATORS[op](metrics[column], value).fillna(False).astype(bool)
+        result = metrics[mask]
+
+        rank = spec.get('rank', [])
+        if rank:
+            result = result.sort_values([column for column, _ in rank],
+                                        ascending=[direction == 'asc' for _, direction in rank])
+        if spec.get('top_n'):
+            result = result.head(spec['top_n'])
+        return result
+
+
+def main():
+    """Screen the full database universe with the default spec"""
+    screener = PanelScreener()
+    start = datetime.now()
+    screener.load()
+    results = screener.screen()
+    elapsed = (datetime.now() - start).total_seconds()
+
+    print("\n" + "=" * 80)
+    print(f"🔍 Screened {screener.panel['close'].shape[1]} symbols in {elapsed:.2f}s")
+    print("=" * 80)
+    if results.empty:
+        print("No symbols passed the screen.")
+        return results
+
+    columns = ['last_price', 'rsi_14', 'bb_position', 'price_vs_sma20', 'volatility_20', 'total_score']
+    print(results[columns].round(2).to_string())
+    return results
+
+
+if __name__ == "__main__":
+    main()
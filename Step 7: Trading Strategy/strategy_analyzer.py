@@ -19,10 +19,17 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(CURRENT_DIR)
 if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
+STEP5_DIR = os.path.join(PARENT_DIR, 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
 
 # Import our strategy from the existing trading_strategy.py file
 try:
     from trading_strategy import BollingerBandMeanReversionStrategy
+    from backtest_cache import BacktestResultCache
+    from chart_renderer import lttb, DEFAULT_MAX_POINTS
+    from bootstrap import bootstrap_metrics
+    from db_connection import get_connection_manager
 except ImportError:
     print("Error: Could not import BollingerBandMeanReversionStrategy. Make sure trading_strategy.py is in the parent directory.")
     sys.exit(1)
@@ -36,9 +43,19 @@ class StrategyAnalyzer:
     Can run analysis on a single asset or a full portfolio.
     """
     
-    def __init__(self, output_dir: str = 'analysis_outputs'):
-        """Initializes the StrategyAnalyzer."""
-        self.strategy = BollingerBandMeanReversionStrategy()
+    def __init__(self, output_dir: str = 'analysis_outputs', result_cache=None, show_plots: bool = True,
+                 max_points: int = DEFAULT_MAX_POINTS, bootstrap_paths: int = 0):
+        """
+        Initializes the StrategyAnalyzer (backtests are served from the result cache when the data is unchanged).
+        show_plots=False saves charts without opening windows; equity curves longer than max_points are
+        downsampled with LTTB before plotting. bootstrap_paths > 0 adds bootstrap confidence intervals
+        to the performance metrics.
+        """
+        self.show_plots = show_plots
+        self.max_points = max_points
+        self.bootstrap_paths = bootstrap_paths
+        self.result_cache = result_cache or BacktestResultCache()
+        self.strategy = BollingerBandMeanReversionStrategy(result_cache=self.result_cache)
         self.analysis_dir = output_dir
         self._setup_environment()
         logging.info("StrategyAnalyzer initialized.")
@@ -51,10 +68,10 @@ class StrategyAnalyzer:
         sns.set_palette("viridis")
 
     def _get_db_connection(self) -> Optional[sqlite3.Connection]:
-        """Establishes and returns a connection to the market data database."""
+        """Returns this thread's pooled read-only connection to the market data database."""
         try:
             db_path = os.path.join(PARENT_DIR, 'Step 5: Saving Market Data', 'market_data.db')
-            return sqlite3.connect(db_path)
+            return get_connection_manager(db_path).connection(read_only=True)
         except sqlite3.Error as e:
             logging.error(f"Database connection error: {e}")
             return None
@@ -64,13 +81,10 @@ class StrategyAnalyzer:
         conn = self._get_db_connection()
         if not conn:
             return []
-        try:
-            query = "SELECT DISTINCT symbol FROM market_data ORDER BY symbol"
-            db_symbols = pd.read_sql_query(query, conn)['symbol'].tolist()
-            logging.info(f"Found {len(db_symbols)} unique assets in the database.")
-            return db_symbols
-        finally:
-            conn.close()
+        query = "SELECT DISTINCT symbol FROM market_data ORDER BY symbol"
+        db_symbols = pd.read_sql_query(query, conn)['symbol'].tolist()
+        logging.info(f"Found {len(db_symbols)} unique assets in the database.")
+        return db_symbols
 
     def _calculate_performance_metrics(self, daily_returns: pd.Series) -> Dict:
         """Calculates key performance metrics from a series of daily returns."""
@@ -84,11 +98,18 @@ class StrategyAnalyzer:
         annualized_volatility = daily_returns.std() * np.sqrt(252)
         sharpe_ratio = (daily_returns.mean() * 252) / annualized_volatility if annualized_volatility > 0 else 0
         
-        return {
+        metrics = {
             'return': annualized_return,
             'volatility': annualized_volatility,
             'sharpe': sharpe_ratio
         }
+        if self.bootstrap_paths:
+            intervals = bootstrap_metrics(daily_returns, self.bootstrap_paths)['intervals']
+            metrics['intervals'] = intervals
+            sharpe, drawdown = intervals.loc['sharpe_ratio'], intervals.loc['max_drawdown']
+            logging.info(f"Sharpe {sharpe_ratio:.2f} (90% CI {sharpe['lower']:.2f} to {sharpe['upper']:.2f}), "
+                         f"max drawdown {drawdown['estimate']:.1%} (90% CI {drawdown['lower']:.1%} to {drawdown['upper']:.1%})")
+        return metrics
 
     def run_single_asset_analysis(self, symbol: str):
         """Runs a backtest for a single asset and visualizes the results."""
@@ -129,8 +150,10 @@ class StrategyAnalyzer:
         """Generates and saves a visualization for a single asset backtest."""
         fig, ax = plt.subplots(figsize=(16, 8))
         
+        equity_curve = self._downsample(equity_curve)
         ax.plot(equity_curve.index, equity_curve, label=f'{symbol} Strategy Equity', color='navy', linewidth=2)
         if benchmark_equity is not None:
+            benchmark_equity = self._downsample(benchmark_equity)
             ax.plot(benchmark_equity.index, benchmark_equity, label='SPY Benchmark', color='grey', linestyle='--', linewidth=2)
         
         ax.set_title(f'{symbol} Performance vs. SPY Benchmark', fontsize=18, fontweight='bold')
@@ -154,7 +177,7 @@ class StrategyAnalyzer:
 
         plt.tight_layout()
         self._save_plot(f'analysis_{symbol}')
-        plt.show()
+        self._show(fig)
 
     def run_portfolio_analysis(self):
         """Runs a backtest across all available assets and visualizes the results."""
@@ -172,14 +195,15 @@ class StrategyAnalyzer:
             logging.error("Portfolio backtest failed.")
             return
 
-        all_returns = [pd.Series(res['daily_returns'], index=pd.to_datetime(pd.DataFrame(res['equity_curve']).set_index('timestamp').index[1:])) for res in portfolio_results['individual_results'].values() if res and 'daily_returns' in res]
-        if not all_returns:
+        # Equity curve from one shared capital pool with position limits, not an average of isolated runs
+        shared = self.strategy.run_portfolio_backtest(symbols_to_test)
+        if not shared:
             logging.error("No daily returns to analyze.")
             return
 
-        portfolio_daily_returns = pd.concat(all_returns, axis=1).fillna(0).mean(axis=1)
-        portfolio_equity = (1 + portfolio_daily_returns).cumprod() * 100
-        portfolio_equity.iloc[0] = 100
+        portfolio_values = shared['history']['portfolio_value']
+        portfolio_daily_returns = portfolio_values.pct_change().fillna(0)
+        portfolio_equity = portfolio_values / portfolio_values.iloc[0] * 100
         strategy_metrics = self._calculate_performance_metrics(portfolio_daily_returns)
 
         spy_data = self.strategy.get_historical_data_from_db('SPY')
@@ -206,6 +230,9 @@ class StrategyAnalyzer:
         fig.suptitle('Portfolio Performance Summary', fontsize=22, fontweight='bold')
 
         ax1 = fig.add_subplot(gs[0, :])
+        portfolio_equity = self._downsample(portfolio_equity)
+        if benchmark_equity is not None:
+            benchmark_equity = self._downsample(benchmark_equity)
         ax1.plot(portfolio_equity.index, portfolio_equity, label='Strategy Equity Curve', color='navy', linewidth=2)
         if benchmark_equity is not None:
             ax1.plot(benchmark_equity.index, benchmark_equity, label='SPY Benchmark', color='grey', linestyle='--', linewidth=2)
@@ -238,7 +265,18 @@ class StrategyAnalyzer:
 
         plt.tight_layout(rect=[0, 0, 1, 0.96])
         self._save_plot('analysis_portfolio')
-        plt.show()
+        self._show(fig)
+
+    def _downsample(self, series: pd.Series) -> pd.Series:
+        """Shape-preserving subset of a long series (a plot can't show more points than pixels anyway)."""
+        return series.iloc[lttb(series.to_numpy(dtype='float64'), self.max_points)]
+
+    def _show(self, fig):
+        """Displays the figure, or releases it when running headless."""
+        if self.show_plots:
+            plt.show()
+        else:
+            plt.close(fig)
 
     def _save_plot(self, name: str):
         """Saves the current plot to a file in the analysis directory."""
@@ -5,8 +5,13 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import sqlite3
 from trading_strategy import BollingerBandMeanReversionStrategy
+from indicator_cache import IndicatorCache
+from backtest_cache import BacktestResultCache
+from walk_forward import WalkForwardOptimizer, parameter_grid
+from param_search import SEARCH_STRATEGIES, SearchSpace, Integer, Real, Choice, PortfolioObjective
+from db_connection import get_connection_manager
+from timestamps import read_panel
 import logging
 from typing import List
 
@@ -17,10 +22,9 @@ def get_all_assets_from_db() -> List[str]:
     """Gets all unique assets available in the market_data database."""
     try:
         db_path = os.path.join(os.path.dirname(__file__), '..', 'Step 5: Saving Market Data', 'market_data.db')
-        conn = sqlite3.connect(db_path)
         query = "SELECT DISTINCT symbol FROM market_data ORDER BY symbol"
-        db_symbols = pd.read_sql_query(query, conn)['symbol'].tolist()
-        conn.close()
+        with get_connection_manager(db_path).reader() as conn:
+            db_symbols = pd.read_sql_query(query, conn)['symbol'].tolist()
         logging.info(f"Found {len(db_symbols)} unique assets in the database for optimization.")
         return db_symbols
     except Exception as e:
@@ -43,6 +47,11 @@ def run_portfolio_optimization():
 
     results = []
     
+    # Rolling mean/std per (symbol, window) persist across std_devs and across runs
+    indicator_cache = IndicatorCache()
+    # Whole backtest results persist too: re-running on unchanged data skips the backtests entirely
+    result_cache = BacktestResultCache()
+    
     print("\n" + "="*80)
     print(f"🔬 Starting Parameter Optimization for {len(symbols_to_test)} symbols")
     print("="*80)
@@ -57,7 +66,9 @@ def run_portfolio_optimization():
                 current_run += 1
                 print(f"Running backtest {current_run}/{total_runs}: Symbol={symbol}, Window={window}, Std Dev={std_dev:.2f}")
 
-                strategy = BollingerBandMeanReversionStrategy(window=window, std_dev=std_dev)
+                strategy = BollingerBandMeanReversionStrategy(window=window, std_dev=std_dev,
+                                                              indicator_cache=indicator_cache,
+                                                              result_cache=result_cache)
                 backtest_result = strategy.backtest_strategy(symbol=symbol)
 
                 if backtest_result and 'sharpe_ratio' in backtest_result:
@@ -74,6 +85,12 @@ def run_portfolio_optimization():
     print("\n" + "="*80)
     print("✅ Optimization Complete!")
     print("="*80)
+    cache_summary = indicator_cache.summary()
+    print(f"Indicator cache: {cache_summary['hits']} hits, {cache_summary['extended']} extended, "
+          f"{cache_summary['computed']} computed ({cache_summary['entries']} entries, {cache_summary['size_mb']:.1f} MB)")
+    result_summary = result_cache.summary()
+    print(f"Backtest result cache: {result_summary['hits']} hits, {result_summary['misses']} misses "
+          f"({result_summary['entries']} stored results, {result_summary['size_mb']:.1f} MB)")
 
     if not results:
         print("No valid backtests were completed. Please check your data and strategy logic.")
@@ -102,5 +119,100 @@ def run_portfolio_optimization():
     print(f"   - Average Win Rate: {best_results_df['win_rate'].mean():.2%}")
     print(f"   - Average Total Trades: {best_results_df['total_trades'].mean():.1f}")
 
+def run_walk_forward_optimization(train_bars: int = 504, test_bars: int = 126, anchored: bool = False,
+                                  max_positions: int = 10, max_workers: int = None):
+    """
+    Walk-forward version of the grid search: parameters are chosen on each rolling train window
+    (Sharpe of the shared-capital portfolio) and judged on the test window that follows.
+    Fold results are cached, so after a daily append only the newest fold is recomputed.
+    """
+    symbols_to_test = get_all_assets_from_db()
+    if not symbols_to_test:
+        print("No symbols found in the database. Exiting optimization.")
+        return
+
+    windows = np.arange(10, 60, 10)
+    std_devs = np.arange(1.5, 3.25, 0.5)
+
+    # Full history on purpose: folds are laid out from the first bar, which keeps them stable
+    db_path = os.path.join(os.path.dirname(__file__), '..', 'Step 5: Saving Market Data', 'market_data.db')
+    with get_connection_manager(db_path).reader() as conn:
+        close_df = read_panel(conn, symbols=symbols_to_test, columns=('close',))['close']
+
+    optimizer = WalkForwardOptimizer(train_bars=train_bars, test_bars=test_bars, anchored=anchored,
+                                     max_positions=max_positions, max_workers=max_workers)
+    result = optimizer.run(close_df, parameter_grid(window=windows, std_dev=std_devs))
+    if not result:
+        print("Not enough history for a walk-forward fold.")
+        return
+
+    print("\n" + "="*80)
+    print(f"🔁 Walk-Forward Optimization: {len(result['folds'])} folds, {len(symbols_to_test)} symbols")
+    print("="*80)
+    cache_summary = optimizer.summary()
+    print(f"Fold cache: {cache_summary['cached']} cached, {cache_summary['computed']} computed "
+          f"({cache_summary['entries']} entries)")
+
+    for _, fold in result['folds'].iterrows():
+        print(f"   {fold['test_start']:%Y-%m-%d} → {fold['test_end']:%Y-%m-%d}: window={int(fold['window'])}, "
+              f"std_dev={fold['std_dev']:.2f}, train Sharpe {fold['train_sharpe_ratio']:.2f}, "
+              f"test Sharpe {fold['test_sharpe_ratio']:.2f}")
+
+    oos = result['oos_metrics']
+    print("\n📈 Out-of-Sample Performance (stitched test windows):")
+    print(f"   - Total Return: {oos['total_return']:.2%}")
+    print(f"   - Annualized Return: {oos['annualized_return']:.2%}")
+    print(f"   - Sharpe Ratio: {oos['sharpe_ratio']:.2f} (in-sample average {oos['mean_train_score']:.2f})")
+    print(f"   - Max Drawdown: {oos['max_drawdown']:.2%}")
+    return result
+
+def run_search_optimization(strategy: str = 'halving', budget: float = 60, patience: int = None):
+    """
+    Budgeted search over a wider space than the grid (signal parameters plus portfolio sizing and
+    rebalancing), scored by the Sharpe of the shared-capital portfolio on the full history.
+    strategy is one of SEARCH_STRATEGIES: 'grid', 'random', 'halving' or 'surrogate'.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}'. Choose from: {', '.join(SEARCH_STRATEGIES)}")
+
+    symbols_to_test = get_all_assets_from_db()
+    if not symbols_to_test:
+        print("No symbols found in the database. Exiting optimization.")
+        return
+
+    db_path = os.path.join(os.path.dirname(__file__), '..', 'Step 5: Saving Market Data', 'market_data.db')
+    with get_connection_manager(db_path).reader() as conn:
+        close_df = read_panel(conn, symbols=symbols_to_test, columns=('close',))['close']
+
+    space = SearchSpace(
+        window=Integer(5, 100, 5),
+        std_dev=Real(1.0, 3.5, 0.25),
+        max_positions=Choice([5, 10, 20]),
+        rebalance_every=Choice([None, 5, 21]),
+    )
+    search = SEARCH_STRATEGIES[strategy](space, budget=budget, patience=patience)
+
+    print("\n" + "="*80)
+    print(f"🔎 {strategy.title()} search: budget {budget} backtests over {space.size()} combinations")
+    print("="*80)
+    result = search.run(PortfolioObjective(close_df))
+
+    if result['best_params'] is None:
+        print("No valid backtests were completed. Please check your data and strategy logic.")
+        return result
+
+    print(f"\n🏆 Best Parameters after {result['evaluations']} backtests "
+          f"({result['budget_used']:.1f} full-data equivalents):")
+    for name, value in result['best_params'].items():
+        print(f"   - {name}: {value}")
+    print(f"   - Portfolio Sharpe Ratio: {result['best_score']:.2f}")
+    return result
+
 if __name__ == "__main__":
-    run_portfolio_optimization()
+    if '--walk-forward' in sys.argv:
+        run_walk_forward_optimization()
+    elif '--search' in sys.argv:
+        position = sys.argv.index('--search') + 1
+        run_search_optimization(sys.argv[position] if position < len(sys.argv) else 'halving')
+    else:
+        run_portfolio_optimization()
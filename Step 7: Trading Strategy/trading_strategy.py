@@ -5,7 +5,6 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-import sqlite3
 from datetime import datetime, timedelta
 import pytz
 import logging
@@ -16,6 +15,14 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(CURRENT_DIR)
 if PARENT_DIR not in sys.path:
     sys.path.insert(0, PARENT_DIR)
+STEP5_DIR = os.path.join(PARENT_DIR, 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from timestamps import read_bars, read_panel
+from indicators import bollinger_bands
+from portfolio_backtest import bollinger_signals, run_portfolio_backtest, performance_metrics
 
 # Import Alpaca API
 try:
@@ -45,7 +52,8 @@ class BollingerBandMeanReversionStrategy:
     Implements a mean reversion strategy using Bollinger Bands for signal generation.
     """
     
-    def __init__(self, db_path=None, window: int = 20, std_dev: float = 2.5):
+    def __init__(self, db_path=None, window: int = 20, std_dev: float = 2.5, indicator_cache=None,
+                 result_cache=None):
         # Database setup
         if db_path is None:
             self.db_path = os.path.abspath(os.path.join(
@@ -53,6 +61,12 @@ class BollingerBandMeanReversionStrategy:
                 '../Step 5: Saving Market Data/market_data.db'))
         else:
             self.db_path = db_path
+        self.db = get_connection_manager(self.db_path)
+        
+        # Optional IndicatorCache shared across strategy instances (optimizer, live trader)
+        self.indicator_cache = indicator_cache
+        # Optional BacktestResultCache: identical backtests on unchanged data are served from disk
+        self.result_cache = result_cache
 
         # 1. DEFINE TRADING GOALS
         self.trading_goals = {
@@ -94,21 +108,11 @@ class BollingerBandMeanReversionStrategy:
     def get_historical_data_from_db(self, symbol: str) -> pd.DataFrame:
         """Get ALL historical data from our existing database for a symbol."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            query = """
-                SELECT timestamp, close, high, low, open, volume
-                FROM market_data 
-                WHERE symbol = ? 
-                ORDER BY timestamp ASC
-            """
-            df = pd.read_sql_query(query, conn, params=[symbol])
-            conn.close()
-            
-            if not df.empty:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                df.set_index('timestamp', inplace=True)
+            # Typed read: timestamps come back as datetime64[ns, UTC] from the stored ts_ns column
+            with self.db.reader() as conn:
+                df = read_bars(conn, symbols=symbol, columns=('close', 'high', 'low', 'open', 'volume'))
             
-            return df
+            return df.drop(columns='symbol').set_index('timestamp')
             
         except Exception as e:
             logging.error(f"Error retrieving historical data: {e}")
@@ -119,16 +123,28 @@ class BollingerBandMeanReversionStrategy:
         window = self.strategy_parameters['bollinger_window']
         std_dev = self.strategy_parameters['bollinger_std_dev']
         
-        rolling_mean = prices.rolling(window=window).mean()
-        rolling_std = prices.rolling(window=window).std()
+        bands = bollinger_bands(prices, window, num_std=std_dev)
+        
+        return pd.DataFrame({
+            'middle_band': bands['middle'],
+            'upper_band': bands['upper'],
+            'lower_band': bands['lower']
+        })
+
+    def bollinger_bands_for(self, symbol: str, prices: pd.Series) -> pd.DataFrame:
+        """Bollinger Bands for a symbol's stored prices, served from the indicator cache when set"""
+        if self.indicator_cache is None:
+            return self.calculate_bollinger_bands(prices)
         
-        upper_band = rolling_mean + (rolling_std * std_dev)
-        lower_band = rolling_mean - (rolling_std * std_dev)
+        window = self.strategy_parameters['bollinger_window']
+        std_dev = self.strategy_parameters['bollinger_std_dev']
         
+        # Mean/std are cached per window; every std_dev multiple reuses them
+        cached = self.indicator_cache.get(symbol, 'mean_std', {'window': window}).reindex(prices.index)
         return pd.DataFrame({
-            'middle_band': rolling_mean,
-            'upper_band': upper_band,
-            'lower_band': lower_band
+            'middle_band': cached['mean'],
+            'upper_band': cached['mean'] + cached['std'] * std_dev,
+            'lower_band': cached['mean'] - cached['std'] * std_dev
         })
 
     def generate_trading_signals(self, symbol: str = 'SPY') -> pd.DataFrame:
@@ -140,7 +156,7 @@ class BollingerBandMeanReversionStrategy:
         if data.empty:
             return pd.DataFrame()
         
-        bbands = self.calculate_bollinger_bands(data['close'])
+        bbands = self.bollinger_bands_for(symbol, data['close'])
         data = data.join(bbands)
         
         data['signal'] = 0
@@ -158,7 +174,18 @@ class BollingerBandMeanReversionStrategy:
         
         return data
     
+    def _cached_backtest(self, kind: str, symbols, arguments: Dict, run):
+        """Serve a backtest from the result cache when one is set, keyed by every parameter it uses"""
+        if self.result_cache is None:
+            return run()
+        params = {**self.strategy_parameters, **self.risk_parameters, **arguments}
+        return self.result_cache.get_or_run(f"{type(self).__name__}.{kind}", params, symbols, run, db=self.db)
+
     def backtest_strategy(self, symbol: str = 'SPY', initial_capital: float = 100000) -> Dict:
+        return self._cached_backtest('backtest_strategy', symbol, {'initial_capital': initial_capital},
+                                     lambda: self._backtest_symbol(symbol, initial_capital))
+
+    def _backtest_symbol(self, symbol: str, initial_capital: float) -> Dict:
         data = self.generate_trading_signals(symbol)
         
         if data.empty:
@@ -230,6 +257,55 @@ class BollingerBandMeanReversionStrategy:
             'daily_returns': daily_returns
         }
     
+    def _get_available_symbols_from_db(self) -> List[str]:
+        """Symbols with stored daily bars"""
+        with self.db.reader() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT symbol FROM symbol_stats WHERE timeframe = 'Day' ORDER BY symbol")]
+
+    def run_portfolio_backtest(self, symbols: List[str] = None, initial_capital: float = 100000,
+                               max_positions: int = 10, position_size: float = None,
+                               rebalance_every: int = None, start_date=None, end_date=None) -> Dict:
+        """
+        Backtest all symbols together on one shared capital pool: Bollinger signals for every
+        symbol are precomputed as (date x symbol) arrays, then the portfolio steps through time
+        with max_positions slots, each sized at position_size of equity (1/max_positions by default).
+        """
+        if symbols is None:
+            symbols = self._get_available_symbols_from_db()
+        if position_size is None:
+            position_size = 1.0 / max_positions
+        
+        arguments = {'initial_capital': initial_capital, 'max_positions': max_positions,
+                     'position_size': position_size, 'rebalance_every': rebalance_every,
+                     'start_date': start_date, 'end_date': end_date}
+        return self._cached_backtest(
+            'run_portfolio_backtest', symbols, arguments,
+            lambda: self._backtest_portfolio(symbols, initial_capital, max_positions, position_size,
+                                             rebalance_every, start_date, end_date))
+
+    def _backtest_portfolio(self, symbols, initial_capital, max_positions, position_size,
+                            rebalance_every, start_date, end_date) -> Dict:
+        with self.db.reader() as conn:
+            close_df = read_panel(conn, symbols=symbols, start_date=start_date, end_date=end_date,
+                                  columns=('close',))['close']
+        if close_df.empty:
+            return {}
+        
+        panel = bollinger_signals(close_df, self.strategy_parameters['bollinger_window'],
+                                  self.strategy_parameters['bollinger_std_dev'])
+        history, positions, trades = run_portfolio_backtest(
+            panel, initial_capital=initial_capital, max_positions=max_positions,
+            position_size=position_size, rebalance_every=rebalance_every
+        )
+        
+        return {
+            'portfolio_metrics': performance_metrics(history, initial_capital, trades),
+            'history': history,
+            'positions': positions,
+            'trades': trades
+        }
+    
     def run_comprehensive_backtest(self, symbols: List[str] = None, initial_capital: float = 100000) -> Dict:
         if symbols is None:
             symbols = self._get_available_symbols_from_db()
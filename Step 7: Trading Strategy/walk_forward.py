@@ -0,0 +1,275 @@
+# Step 7: Walk-Forward Optimization
+# Rolling train/test folds over one close panel, with per-fold results cached on disk by data hash
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP5_DIR = os.path.join(os.path.dirname(CURRENT_DIR), 'Step 5: Saving Market Data')
+if STEP5_DIR not in sys.path:
+    sys.path.append(STEP5_DIR)
+
+from db_connection import get_connection_manager
+from portfolio_backtest import SignalPanel, bollinger_signals, run_portfolio_backtest, performance_metrics
+from indicators import TRADING_DAYS
+
+DEFAULT_CACHE_PATH = os.path.join(CURRENT_DIR, 'optimizer_cache', 'walk_forward.db')
+
+# Metrics kept per fold and parameter set (the rest of performance_metrics is not needed to rank)
+FOLD_METRICS = ('total_return', 'annualized_return', 'volatility', 'sharpe_ratio', 'max_drawdown',
+                'total_trades', 'closed_trades', 'win_rate', 'avg_positions')
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS fold_results (
+        cache_key TEXT PRIMARY KEY,
+        data_hash TEXT NOT NULL,
+        train_start TEXT NOT NULL,
+        test_start TEXT NOT NULL,
+        test_end TEXT NOT NULL,
+        params TEXT NOT NULL,
+        train_metrics TEXT NOT NULL,
+        test_metrics TEXT NOT NULL,
+        test_equity BLOB,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def parameter_grid(**ranges):
+    """Every combination of the given parameter ranges as a list of dicts"""
+    names = sorted(ranges)
+    return [dict(zip(names, (v.item() if hasattr(v, 'item') else v for v in values)))
+            for values in itertools.product(*(ranges[name] for name in names))]
+
+
+def make_folds(dates, train_bars=504, test_bars=126, warmup_bars=60, anchored=False):
+    """
+    Row boundaries (data_start, train_start, test_start, test_end) for each fold.
+    Folds step by test_bars from the start of the data, so new bars only ever change the
+    last fold (its test window grows until it is full, then a new fold begins).
+    With anchored=True the train window expands from the first tradable bar instead of rolling.
+    """
+    n = len(dates)
+    folds = []
+    test_start = warmup_bars + train_bars
+    while test_start < n:
+        train_start = warmup_bars if anchored else test_start - train_bars
+        folds.append((train_start - warmup_bars, train_start, test_start, min(test_start + test_bars, n)))
+        test_start += test_bars
+    return folds
+
+
+def panel_hash(close_df: pd.DataFrame) -> str:
+    """Content hash of a close panel: symbols, dates and prices (NaN-normalized)"""
+    digest = hashlib.sha1()
+    digest.update('|'.join(map(str, close_df.columns)).encode())
+    digest.update(close_df.index.asi8.tobytes())
+    digest.update(np.nan_to_num(close_df.to_numpy(dtype='float64'), nan=-1.0).tobytes())
+    return digest.hexdigest()
+
+
+def _clean_metrics(metrics: dict) -> dict:
+    return {name: float(metrics[name]) for name in FOLD_METRICS if name in metrics}
+
+
+def _evaluate_fold(fold_close, warmup_bars, train_bars, params_list, engine):
+    """
+    Backtest each parameter set on one fold's train and test rows (runs in a worker process).
+    Signals are computed on the fold's own rows, so a fold only depends on the data it covers.
+    """
+    results = []
+    for params in params_list:
+        signals = bollinger_signals(fold_close, params['window'], params['std_dev'])
+        evaluated = []
+        for start, end in ((warmup_bars, warmup_bars + train_bars), (warmup_bars + train_bars, len(fold_close))):
+            rows = slice(start, end)
+            panel = SignalPanel(signals.dates[rows], signals.symbols, signals.close[rows],
+                                signals.entries[rows], signals.exits[rows], signals.strength[rows],
+                                signals.has_bar[rows], sides=signals.sides[rows])
+            history, _, trades = run_portfolio_backtest(panel, **engine)
+            evaluated.append((_clean_metrics(performance_metrics(history, engine['initial_capital'], trades)),
+                              history['portfolio_value'].to_numpy()))
+        (train_metrics, _), (test_metrics, test_equity) = evaluated
+        results.append((params, train_metrics, test_metrics, test_equity))
+    return results
+
+
+class WalkForwardOptimizer:
+    """
+    Rolls train/test windows over a date-aligned close panel, optimizes Bollinger parameters
+    on each train window with the shared-capital portfolio engine and scores the chosen set on
+    the following test window. Every (fold, parameter set) result is cached under a hash of the
+    rows that fold reads; folds with cache misses are evaluated in parallel worker processes.
+    """
+
+    def __init__(self, cache_path=None, train_bars=504, test_bars=126, anchored=False,
+                 objective='sharpe_ratio', max_workers=None, initial_capital=100_000,
+                 max_positions=10, position_size=None, rebalance_every=None, commission_bps=0.0):
+        self.cache_path = cache_path or DEFAULT_CACHE_PATH
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        self.cache = get_connection_manager(self.cache_path)
+        with self.cache.writer() as conn:
+            conn.execute(CACHE_SCHEMA)
+
+        self.train_bars = train_bars
+        self.test_bars = test_bars
+        self.anchored = anchored
+        self.objective = objective
+        self.max_workers = max_workers
+        self.engine = {
+            'initial_capital': initial_capital,
+            'max_positions': max_positions,
+            'position_size': position_size if position_size is not None else 1.0 / max_positions,
+            'rebalance_every': rebalance_every,
+            'commission_bps': commission_bps,
+        }
+        self.stats = {'cached': 0, 'computed': 0}
+
+    def _slot_key(self, universe, dates, fold, params):
+        """Identifies a (fold, parameter set) slot; the data hash decides whether it is still valid"""
+        _, train_start, test_start, _ = fold
+        raw = json.dumps({
+            'universe': universe,
+            'train_start': str(dates[train_start]),
+            'test_start': str(dates[test_start]),
+            'train_bars': self.train_bars,
+            'anchored': self.anchored,
+            'params': params,
+            'engine': self.engine,
+        }, sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def run(self, close_df: pd.DataFrame, param_grid) -> dict:
+        """
+        Walk forward over close_df (dates x symbols) for every parameter set in param_grid
+        (dicts with 'window' and 'std_dev'). Returns per-fold choices, every fold result,
+        the stitched out-of-sample equity curve and its metrics.
+        """
+        param_grid = list(param_grid)
+        warmup_bars = max(p['window'] for p in param_grid)
+        folds = make_folds(close_df.index, self.train_bars, self.test_bars, warmup_bars, self.anchored)
+        if not folds:
+            logging.warning(f"Not enough data for one fold: {len(close_df)} bars, "
+                            f"need more than {warmup_bars + self.train_bars}")
+            return {}
+
+        dates = close_df.index
+        universe = hashlib.sha1('|'.join(map(str, close_df.columns)).encode()).hexdigest()
+        fold_hashes = [panel_hash(close_df.iloc[fold[0]:fold[3]]) for fold in folds]
+
+        # Look up every (fold, params) slot; keep the ones whose stored data hash still matches
+        results = {}
+        missing = {}
+        with self.cache.reader() as conn:
+            for f, fold in enumerate(folds):
+                for p, params in enumerate(param_grid):
+                    key = self._slot_key(universe, dates, fold, params)
+                    row = conn.execute('''
+                        SELECT data_hash, train_metrics, test_metrics, test_equity
+                        FROM fold_results WHERE cache_key = ?
+                    ''', (key,)).fetchone()
+                    if row is not None and row[0] == fold_hashes[f]:
+                        results[f, p] = (json.loads(row[1]), json.loads(row[2]),
+                                         np.frombuffer(row[3], dtype='float64'))
+                    else:
+                        missing.setdefault(f, []).append(p)
+        self.stats['cached'] += len(results)
+        logging.info(f"Walk-forward: {len(folds)} folds x {len(param_grid)} parameter sets, "
+                     f"{len(results)} cached, {sum(map(len, missing.values()))} to compute")
+
+        def store(f, computed):
+            fold = folds[f]
+            with self.cache.writer() as conn:
+                for p, (params, train_metrics, test_metrics, test_equity) in zip(missing[f], computed):
+                    results[f, p] = (train_metrics, test_metrics, test_equity)
+                    conn.execute('''
+                        INSERT OR REPLACE INTO fold_results
+                        (cache_key, data_hash, train_start, test_start, test_end, params,
+                         train_metrics, test_metrics, test_equity)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (self._slot_key(universe, dates, fold, params), fold_hashes[f],
+                          str(dates[fold[1]]), str(dates[fold[2]]), str(dates[fold[3] - 1]),
+                          json.dumps(params, sort_keys=True), json.dumps(train_metrics),
+                          json.dumps(test_metrics), np.asarray(test_equity, dtype='float64').tobytes()))
+            self.stats['computed'] += len(computed)
+
+        def fold_job(f):
+            data_start, train_start, test_start, test_end = folds[f]
+            return (close_df.iloc[data_start:test_end], train_start - data_start, test_start - train_start,
+                    [param_grid[p] for p in missing[f]], self.engine)
+
+        if missing and (self.max_workers == 1 or len(missing) == 1):
+            for f in missing:
+                store(f, _evaluate_fold(*fold_job(f)))
+        elif missing:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(_evaluate_fold, *fold_job(f)): f for f in missing}
+                for future in as_completed(futures):
+                    store(futures[future], future.result())
+
+        return self._summarize(close_df, folds, param_grid, results)
+
+    def _summarize(self, close_df, folds, param_grid, results):
+        """Pick the best train-window parameters per fold and stitch their test windows together"""
+        dates = close_df.index
+        rows = []
+        oos_returns = []
+        for f in range(len(folds)):
+            for p, params in enumerate(param_grid):
+                train_metrics, test_metrics, _ = results[f, p]
+                rows.append({'fold': f, **params,
+                             **{f'train_{k}': v for k, v in train_metrics.items()},
+                             **{f'test_{k}': v for k, v in test_metrics.items()}})
+
+        all_results = pd.DataFrame(rows)
+        score = all_results[f'train_{self.objective}'].fillna(-np.inf)
+        best = all_results.loc[score.groupby(all_results['fold']).idxmax()].reset_index(drop=True)
+
+        param_names = sorted(param_grid[0])
+        for _, choice in best.iterrows():
+            f = int(choice['fold'])
+            p = next(i for i, params in enumerate(param_grid)
+                     if all(params[name] == choice[name] for name in param_names))
+            equity = results[f, p][2]
+            _, _, test_start, test_end = folds[f]
+            # Each test window starts from fresh capital; chain their daily returns
+            previous = np.concatenate([[self.engine['initial_capital']], equity[:-1]])
+            oos_returns.append(pd.Series(equity / previous - 1, index=dates[test_start:test_end]))
+
+        best.insert(1, 'train_start', [dates[fold[1]] for fold in folds])
+        best.insert(2, 'test_start', [dates[fold[2]] for fold in folds])
+        best.insert(3, 'test_end', [dates[fold[3] - 1] for fold in folds])
+
+        returns = pd.concat(oos_returns)
+        equity = self.engine['initial_capital'] * (1 + returns).cumprod()
+        std = returns.std()
+        total_return = equity.iloc[-1] / self.engine['initial_capital'] - 1
+        drawdown = equity / equity.cummax() - 1
+        oos_metrics = {
+            'total_return': total_return,
+            'annualized_return': (1 + total_return) ** (TRADING_DAYS / len(returns)) - 1,
+            'sharpe_ratio': returns.mean() / std * np.sqrt(TRADING_DAYS) if std > 0 else 0,
+            'max_drawdown': abs(drawdown.min()),
+            'mean_train_score': best[f'train_{self.objective}'].mean(),
+            'mean_test_score': best[f'test_{self.objective}'].mean(),
+        }
+
+        return {
+            'folds': best,
+            'results': all_results,
+            'oos_equity': equity,
+            'oos_metrics': oos_metrics,
+        }
+
+    def summary(self) -> dict:
+        """Cache size and this session's cached/computed counters"""
+        with self.cache.reader() as conn:
+            entries = conn.execute('SELECT COUNT(*) FROM fold_results').fetchone()[0]
+        return {'entries': entries, **self.stats}